@@ -0,0 +1,840 @@
+"""Micro-benchmarks for the Cyclops hot paths.
+
+    python bench.py ocr [--image PATH] [--runs N]
+    python bench.py preprocess [--runs N]
+    python bench.py match [--runs N]
+    python bench.py capture [--seconds S]    (needs a display, e.g. Xvfb :99)
+    python bench.py loop [--frames N | --session FILE]
+    python bench.py scheduler [--jobs 1,4,16,64] [--seconds S]
+    python bench.py layout [--frames N]
+    python bench.py tiers [--frames N] [--target TEXT]
+    python bench.py textmatch [--targets 1,10,100,1000] [--fuzzy R]
+    python bench.py stop [--runs N]
+    python bench.py startup [--runs N]        (GUI path needs a display)
+    python bench.py metrics [--calls N]
+    python bench.py daemon [--clients 1,2,4] [--frames N] [--workers N]
+    python bench.py strips [--workers 1,2,4,8] [--lines N]
+    python bench.py needles [--needles 1,2,4,8,16] [--size WxH]
+    python bench.py profile [--needles N] [--needle-size WxH]
+    python bench.py frames [--minutes M] [--rate R] [--size WxH]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from PIL import Image, ImageDraw
+
+from capture import BACKENDS, BufferPool, CaptureBackend, RawFrame
+from frames import (ChangeDetector, FramePipeline, FrameSource, RecordedFrameSource, SyntheticFrameSource,
+                    crop_region)
+from inputs import LoggingSink
+from matcher import NeedleLibrary, TemplateMatcher
+from metrics import Metrics
+from ocr import (ENGINES, DEFAULT_CONFIG, DEFAULT_LANG, RegionTracker, StripRecognizer, TieredRecognizer,
+                 create_engine)
+from ocr_daemon import HAS_UNIX_SOCKETS, DaemonClient
+from preprocess import (NumpyPreprocessor, create_preprocessor, find_text_blocks, preprocess_pil, split_bands,
+                        split_strips)
+from scheduler import JobScheduler, WatchJob
+from textmatch import TextMatcher, normalize_text, substring_distance
+
+PREPROCESS_SIZES = [(200, 50), (640, 360), (1280, 720), (1920, 1080), (3840, 2160)]
+MATCH_SIZES = [(400, 300), (1280, 720), (1920, 1080), (3840, 2160)]
+CAPTURE_SIZES = [(200, 50), (640, 360), (1280, 720), (1920, 1080)]
+
+
+def _synthetic_text_image(width=600, height=120, lines=("Cyclops OCR benchmark", "attempt 12345 FAILED")):
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        draw.text((10, 10 + i * 30), line, fill="black")
+    return img
+
+
+def _binarize(image):
+    return image.convert("L").point(lambda x: 0 if x < 128 else 255, "1")
+
+
+def bench_ocr(args):
+    source = Image.open(args.image) if args.image else _synthetic_text_image()
+    image = _binarize(source)
+    print(f"image {image.size[0]}x{image.size[1]}, {args.runs} runs, lang={args.lang}")
+    for name, cls in ENGINES.items():
+        start = time.perf_counter()
+        try:
+            engine = cls(args.lang, DEFAULT_CONFIG)
+        except RuntimeError as e:
+            print(f"  {name:12s} unavailable: {e}")
+            continue
+        init_ms = (time.perf_counter() - start) * 1000
+        try:
+            engine.recognize(image)  # warm-up
+            engine.stats.reset()
+            for _ in range(args.runs):
+                engine.recognize(image)
+        finally:
+            engine.close()
+        print(f"  {name:12s} init={init_ms:.0f}ms  {engine.stats}")
+
+
+def _synthetic_screen(width, height):
+    """Gradient background with rows of text, closer to a real capture than a flat fill."""
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(gradient)
+    for y in range(5, height - 10, 24):
+        draw.text((8, y), "Status: waiting for server response 0123456789", fill=(20, 20, 20))
+    return gradient
+
+
+def _time_per_call(func, arg, runs):
+    func(arg)  # warm-up (buffer allocation, lazy imports)
+    start = time.perf_counter()
+    for _ in range(runs):
+        func(arg)
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def bench_preprocess(args):
+    numpy_path = NumpyPreprocessor()
+    print(f"{'size':>11s} {'PIL ms':>9s} {'numpy ms':>9s} {'speedup':>8s}  identical")
+    for w, h in PREPROCESS_SIZES:
+        image = _synthetic_screen(w, h)
+        identical = preprocess_pil(image).tobytes() == numpy_path(image).tobytes()
+        pil_ms = _time_per_call(preprocess_pil, image, args.runs)
+        np_ms = _time_per_call(numpy_path, image, args.runs)
+        print(f"{w:>5d}x{h:<5d} {pil_ms:9.2f} {np_ms:9.2f} {pil_ms / np_ms:7.1f}x  {identical}")
+
+
+def _synthetic_button(label="Retry"):
+    button = Image.new("RGB", (96, 32), (40, 110, 200))
+    draw = ImageDraw.Draw(button)
+    draw.rectangle((0, 0, 95, 31), outline=(250, 250, 250), width=2)
+    draw.text((24, 10), label, fill="white")
+    return button
+
+
+def bench_match(args):
+    import pyautogui
+
+    needle = _synthetic_button()
+    matcher = TemplateMatcher(needle)
+    print(f"{'size':>11s} {'locate ms':>10s} {'matcher ms':>11s} {'speedup':>8s}  positions")
+    for w, h in MATCH_SIZES:
+        haystack = _synthetic_screen(w, h)
+        haystack.paste(needle, (w * 2 // 3, h // 2))
+
+        def pyautogui_locate(img):
+            return pyautogui.locate(needle, img, confidence=0.8)
+
+        ref = pyautogui_locate(haystack)
+        ours = matcher.locate(haystack)
+        ref_ms = _time_per_call(pyautogui_locate, haystack, args.runs)
+        our_ms = _time_per_call(matcher.locate, haystack, args.runs)
+        ref_pos = (ref.left, ref.top) if ref else None
+        our_pos = (ours.left, ours.top) if ours else None
+        tracker = TemplateMatcher(needle, tracking=True)
+        tracker.locate(haystack)
+        track_ms = _time_per_call(tracker.locate, haystack, args.runs)
+        print(f"{w:>5d}x{h:<5d} {ref_ms:10.2f} {our_ms:11.2f} {ref_ms / our_ms:7.1f}x  "
+              f"{ref_pos} / {our_pos}  tracked={track_ms:.2f}ms")
+
+
+def bench_capture(args):
+    print(f"{'backend':>8s} {'size':>11s} {'fps':>8s} {'ms/grab':>8s}")
+    for name, cls in BACKENDS.items():
+        try:
+            backend = cls()
+        except RuntimeError as e:
+            print(f"{name:>8s} unavailable: {e}")
+            continue
+        try:
+            for w, h in CAPTURE_SIZES:
+                backend.grab(0, 0, w, h)  # warm-up
+                count = 0
+                start = time.perf_counter()
+                while time.perf_counter() - start < args.seconds:
+                    backend.grab(0, 0, w, h)
+                    count += 1
+                elapsed = time.perf_counter() - start
+                print(f"{name:>8s} {w:>5d}x{h:<5d} {count / elapsed:8.1f} {elapsed / count * 1000:8.2f}")
+        finally:
+            backend.close()
+
+
+def bench_loop(args):
+    """Full MacroController.run() headless: synthetic or replayed frames, logged clicks."""
+    from controller import MacroController
+
+    needle = _synthetic_button()
+    controller = MacroController(1.0, ocr_backend=args.ocr_backend)
+    controller.result_region = (0, 0, 640, 240)
+    controller.click_image = needle
+    controller.target_text = "SUCCESS"
+    controller.click_delay = 0
+    controller.retry_interval = 0
+    controller.pipelined = args.pipelined
+    if args.session:
+        controller.frame_source = RecordedFrameSource(args.session)
+    else:
+        controller.frame_source = SyntheticFrameSource(
+            needle, "SUCCESS", match_after=args.frames, jitter=args.jitter)
+    sink = controller.input_sink = LoggingSink()
+
+    start = time.perf_counter()
+    controller.run()
+    elapsed = time.perf_counter() - start
+    controller.frame_source.close()
+    n = controller.attempt_count
+    print(f"{n} iterations in {elapsed:.2f}s -> {n / elapsed:.1f} it/s "
+          f"({elapsed / max(n, 1) * 1000:.1f} ms/it), {len(sink.clicks)} clicks, "
+          f"OCR skipped {controller.ocr_skip_count}, captures {controller.frames.capture_count}")
+    print(f"OCR: {controller.ocr_engine.stats}")
+    if controller.pipeline is not None:
+        for name, stage in controller.pipeline.stats().items():
+            print(f"  {name:>10s}: mean {stage['mean_ms']:.1f}ms max {stage['max_ms']:.1f}ms "
+                  f"n={stage['count']} queue={stage['depth']}")
+        print(f"  dropped stale frames: {controller.pipeline.dropped}")
+
+
+class _GridScreen(FrameSource):
+    """Full-screen synthetic frame: a grid of cells, each with a button and a
+    counter that changes every grab so every scan really runs OCR."""
+
+    def __init__(self, cells, cell_size, needle):
+        self.cells = cells
+        self.cell_size = cell_size
+        self.needle = needle
+        self.count = 0
+
+    def grab(self, region):
+        self.count += 1
+        cw, ch = self.cell_size
+        cols = max(1, int(len(self.cells) ** 0.5 + 0.999))
+        rows = (len(self.cells) + cols - 1) // cols
+        screen = Image.new("RGB", (cols * cw, rows * ch), (235, 235, 235))
+        draw = ImageDraw.Draw(screen)
+        for x, y in self.cells:
+            draw.text((x + 8, y + 8), f"waiting... tick {self.count}", fill=(10, 10, 10))
+            screen.paste(self.needle, (x + 8, y + ch - self.needle.size[1] - 8))
+        return crop_region(screen, (0, 0, screen.size[0], screen.size[1]), region)
+
+
+def bench_scheduler(args):
+    needle = _synthetic_button()
+    cell = (320, 120)
+    print(f"{'jobs':>5s} {'scans/s':>9s} {'per job':>8s} {'captures':>9s} {'clicks':>7s} {'scan ms':>8s}")
+    for n in [int(v) for v in args.jobs.split(",")]:
+        cols = max(1, int(n ** 0.5 + 0.999))
+        cells = [((i % cols) * cell[0], (i // cols) * cell[1]) for i in range(n)]
+        sink = LoggingSink()
+        sched = JobScheduler(_GridScreen(cells, cell, needle), sink, workers=args.workers,
+                             ocr_backend=args.ocr_backend)
+        for i, (x, y) in enumerate(cells):
+            sched.add_job(WatchJob(f"job{i}", (x, y, cell[0], cell[1]), needle, "SUCCESS",
+                                   interval=args.interval))
+        start = time.perf_counter()
+        sched.run(duration=args.seconds)
+        elapsed = time.perf_counter() - start
+        st = sched.stats()
+        print(f"{n:>5d} {st['scans'] / elapsed:9.1f} {st['scans'] / elapsed / n:8.2f} "
+              f"{st['captures']:>9d} {st['clicks']:>7d} {st['scan']['mean_ms']:8.1f}")
+
+
+def _dashboard(width, height, tick):
+    """Status dashboard: many static lines, one line that changes every frame,
+    and a large chart-like graphic area."""
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((width // 2, 20, width - 20, height // 2), fill=(60, 60, 60))
+    for i, y in enumerate(range(12, height - 16, 28)):
+        text = f"server-{i:02d}  status OK  load 0.{i:02d}"
+        if i == 3:
+            text = f"server-03  status WAIT  tick {tick}"
+        draw.text((12, y), text, fill="black")
+    return img
+
+
+def bench_layout(args):
+    preprocess = NumpyPreprocessor()
+    engine = create_engine(args.ocr_backend)
+    layouts = {
+        "full": None,
+        "bands": lambda b: [[band] for band in split_bands(b)],
+        "blocks": find_text_blocks,
+    }
+    print(f"{'layout':>7s} {'ms/frame':>9s} {'OCR calls':>10s} {'pixels to OCR':>14s}")
+    for name, split in layouts.items():
+        tracker = RegionTracker()
+        calls_before = engine.stats.count
+        pixels = 0
+        start = time.perf_counter()
+        for tick in range(args.frames):
+            binary = preprocess(_dashboard(args.width, args.height, tick))
+            if split is None:
+                engine.recognize(binary)
+                pixels += binary.size[0] * binary.size[1]
+            else:
+                tracker.recognize(binary, split(binary), engine.recognize)
+        elapsed = (time.perf_counter() - start) / args.frames * 1000
+        calls = engine.stats.count - calls_before
+        if split is not None:
+            pixels = tracker.pixels_ocred
+        total = args.width * args.height * args.frames
+        print(f"{name:>7s} {elapsed:9.1f} {calls:10d} {pixels / total:13.1%}")
+    engine.close()
+
+
+def bench_tiers(args):
+    preprocess = NumpyPreprocessor()
+    full_engine = create_engine(args.ocr_backend)
+    tiers = TieredRecognizer(NumpyPreprocessor(), args.ocr_backend)
+    tiers.set_targets([args.target])
+    frames = []
+    for i in range(args.frames):
+        lines = ["Connecting to server...", f"attempt {i}"]
+        if i % args.hit_every == args.hit_every - 1:
+            lines.append(args.target)
+        frames.append(_synthetic_text_image(lines=lines))
+
+    start = time.perf_counter()
+    for image in frames:
+        full_engine.recognize(preprocess(image))
+    full_ms = (time.perf_counter() - start) / len(frames) * 1000
+
+    start = time.perf_counter()
+    for image in frames:
+        tiers.recognize(image, lambda: full_engine.recognize(preprocess(image)))
+    tiered_ms = (time.perf_counter() - start) / len(frames) * 1000
+
+    st = tiers.stats()
+    print(f"full pass only : {full_ms:.1f} ms/frame")
+    print(f"tiered         : {tiered_ms:.1f} ms/frame  (cheap lang={st['cheap_lang']})")
+    print(f"  tier 1 only  : {st['decided_cheap']} frames, {tiers.tier1}")
+    print(f"  escalated    : {st['escalated']} frames, {tiers.tier2}")
+    tiers.close()
+    full_engine.close()
+
+
+def bench_textmatch(args):
+    rng = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+
+    def phrase():
+        return " ".join("".join(rng.choice(alphabet) for _ in range(rng.randint(3, 8)))
+                        for _ in range(rng.randint(1, 3)))
+
+    texts = ["\n".join(phrase() for _ in range(6)) for _ in range(50)]
+    print(f"{'targets':>8} {'naive':>10} {'matcher':>10} {'compile':>10}")
+    for n in [int(v) for v in args.targets.split(",")]:
+        targets = [phrase() for _ in range(n)]
+        normalized = [normalize_text(t) for t in targets]
+
+        def naive(text):
+            text = normalize_text(text)
+            for t in normalized:
+                budget = int(len(t) * args.fuzzy)
+                if t in text or (budget and substring_distance(t, text) <= budget):
+                    return t
+            return None
+
+        start = time.perf_counter()
+        matcher = TextMatcher(targets, args.fuzzy)
+        compile_ms = (time.perf_counter() - start) * 1000
+        naive_ms = sum(_time_per_call(naive, t, args.runs) for t in texts) / len(texts)
+        matcher_ms = sum(_time_per_call(matcher.match, t, args.runs) for t in texts) / len(texts)
+        print(f"{n:>8} {naive_ms:>8.3f}ms {matcher_ms:>8.3f}ms {compile_ms:>8.1f}ms")
+
+
+def _polling_sleep(controller, seconds):
+    # the old _interruptible_sleep, for comparison
+    for _ in range(int(seconds * 10)):
+        if not controller.running:
+            return False
+        time.sleep(0.1)
+    return True
+
+
+def _stop_latency_ms(controller, wait, runs):
+    rng = random.Random(0)
+    samples = []
+    for _ in range(runs):
+        controller.running = True
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        time.sleep(rng.uniform(0.05, 0.3))
+        start = time.perf_counter()
+        controller.stop()
+        waiter.join()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def bench_stop(args):
+    """Time from stop() until a waiting controller returns, and sleep accuracy."""
+    from controller import MacroController
+
+    controller = MacroController(1.0)
+    controller.click_delay = 5.0
+    waits = {
+        "polling 100ms": lambda: _polling_sleep(controller, controller.click_delay),
+        "condition": lambda: controller._interruptible_sleep(controller.click_delay),
+    }
+    for name, wait in waits.items():
+        samples = sorted(_stop_latency_ms(controller, wait, args.runs))
+        print(f"stop latency, {name:>13s}: median {samples[len(samples) // 2]:.2f}ms "
+              f"max {samples[-1]:.2f}ms")
+
+    controller.running = True
+    for seconds in (0.05, 0.25, 1.234):
+        start = time.perf_counter()
+        _polling_sleep(controller, seconds)
+        polled = time.perf_counter() - start
+        start = time.perf_counter()
+        controller._interruptible_sleep(seconds)
+        waited = time.perf_counter() - start
+        print(f"sleep {seconds * 1000:7.1f}ms -> polling {polled * 1000:7.1f}ms, "
+              f"condition {waited * 1000:7.1f}ms")
+    controller.running = False
+
+
+def _run_ms(cmd, runs, env=None):
+    """Median wall time of `runs` runs, or (None, last stderr line) on failure."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(cmd, capture_output=True, env=env,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        samples.append((time.perf_counter() - start) * 1000)
+        if result.returncode != 0:
+            return None, result.stderr.decode(errors="replace").strip().splitlines()[-1:]
+    return sorted(samples)[len(samples) // 2], result.stdout.decode(errors="replace").strip()
+
+
+_HEAVY_MODULES = ("PIL.Image", "numpy", "cv2", "pyautogui", "pytesseract", "tesserocr", "mss", "tkinter")
+
+
+def bench_startup(args):
+    """Process start to ready for the Tk app and the headless CLI, with an
+    empty and a warm startup cache (scale / tesseract check), plus what
+    importing the controller pulls in."""
+    with tempfile.TemporaryDirectory() as tmp:
+        _synthetic_button().save(os.path.join(tmp, "needle.png"))
+        profile = os.path.join(tmp, "profile.json")
+        with open(profile, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "region": [0, 0, 640, 240], "needle": "needle.png",
+                       "targets": ["SUCCESS"]}, f)
+
+        probe = [sys.executable, "-c",
+                 "import sys, controller; "
+                 f"print(' '.join(m for m in {_HEAVY_MODULES!r} if m in sys.modules) or 'none')"]
+        ms, out = _run_ms(probe, args.runs)
+        print(f"{'import controller':>18s}: {ms or 0:.0f} ms, heavy modules loaded: {out}")
+
+        gui = [sys.executable, "-c",
+               "import main; main.check_tesseract(); app = main.MacroApp(main.get_display_scale()); "
+               "app.root.update(); app.root.destroy()"]
+        cli = [sys.executable, "cli.py", profile, "--check", "--dry-run"]
+        # a private HOME gives an empty ~/.cache/cyclops for the cold run
+        env = dict(os.environ, HOME=tmp, USERPROFILE=tmp)
+        for name, cmd in (("gui", gui), ("cli --check", cli)):
+            cold, error = _run_ms(cmd, 1, env)
+            if cold is None:
+                print(f"{name:>18s}: failed: {' '.join(error)}")
+                continue
+            warm, _ = _run_ms(cmd, args.runs, env)
+            print(f"{name:>18s}: cold {cold:.0f} ms, warm median {warm:.0f} ms ({args.runs} runs)")
+
+
+def bench_metrics(args):
+    """Per-stage instrumentation cost: one timer and one counter, as in the
+    scan loop, with metrics on, off and absent."""
+    def bare():
+        pass
+
+    def instrumented(metrics):
+        def stage():
+            with metrics.timer("ocr"):
+                pass
+            metrics.inc("iterations")
+        return stage
+
+    for name, func in (("none", bare), ("off", instrumented(Metrics(False))),
+                       ("on", instrumented(Metrics(True)))):
+        func()
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            func()
+        ns = (time.perf_counter() - start) / args.calls * 1e9
+        print(f"{name:>5s}: {ns:7.0f} ns per stage")
+    metrics = Metrics(True)
+    for i in range(args.calls):
+        metrics.observe(f"stage{i % 6}", (i % 1000) / 1000)
+    start = time.perf_counter()
+    metrics.to_prometheus()
+    print(f"prometheus export, 6 stages: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+_DAEMON_CLIENT = """
+import json, sys, time
+from bench import _binarize, _synthetic_text_image
+from ocr import create_engine
+from ocr_daemon import max_rss_kb
+backend, address, client, frames = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+images = [_binarize(_synthetic_text_image(lines=(f"client {client} frame {i}", "attempt FAILED")))
+          for i in range(frames)]
+engine = create_engine(backend, daemon_address=address)
+start = time.perf_counter()
+for image in images:
+    engine.recognize(image)
+print(json.dumps({"seconds": time.perf_counter() - start, "max_rss_kb": max_rss_kb()}))
+"""
+
+
+def _run_clients(backend, address, clients, frames):
+    """Wall time and summed peak RSS (kB) of `clients` concurrent OCR processes."""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    procs = [subprocess.Popen([sys.executable, "-c", _DAEMON_CLIENT, backend, address, str(i), str(frames)],
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+             for i in range(clients)]
+    results = []
+    for proc in procs:
+        out, err = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(err.decode(errors="replace").strip().splitlines()[-1])
+        results.append(json.loads(out))
+    wall = time.perf_counter() - start
+    return wall, sum(r["max_rss_kb"] or 0 for r in results)
+
+
+def bench_daemon(args):
+    """Throughput and memory of N Cyclops-like processes each running its own
+    OCR engine vs the same processes sharing one ocr_daemon."""
+    with tempfile.TemporaryDirectory() as tmp:
+        address = ("unix:" + os.path.join(tmp, "ocr.sock")) if HAS_UNIX_SOCKETS else "127.0.0.1:47832"
+        daemon = subprocess.Popen([sys.executable, "ocr_daemon.py", "--listen", address,
+                                   "--workers", str(args.workers), "--backend", args.backend],
+                                  stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+        client = DaemonClient(address)
+        try:
+            for _ in range(100):
+                if client.ping():
+                    break
+                time.sleep(0.1)
+            else:
+                print("daemon did not start")
+                return
+            print(f"{'clients':>7} {'mode':>8} {'frames/s':>9} {'RSS MB':>8}")
+            for n in [int(v) for v in args.clients.split(",")]:
+                total = n * args.frames
+                wall, rss = _run_clients(args.backend, "", n, args.frames)
+                print(f"{n:>7} {'local':>8} {total / wall:>9.1f} {rss / 1024:>8.0f}")
+                wall, rss = _run_clients("daemon", address, n, args.frames)
+                rss += client.stats()["max_rss_kb"] or 0
+                print(f"{n:>7} {'daemon':>8} {total / wall:>9.1f} {rss / 1024:>8.0f}  (clients + daemon)")
+            stats = client.stats()
+            print(f"daemon: {stats['requests']} requests in {stats['batches']} batches, "
+                  f"{stats['deduplicated']} deduplicated, {stats['rejected']} busy, {stats['expired']} expired")
+        finally:
+            client.close()
+            daemon.terminate()
+            daemon.wait()
+
+
+def bench_strips(args):
+    """One OCR call on a tall region vs the same region OCRed as parallel
+    strips, for each worker count."""
+    lines = [f"line {i:03d} attempt {i * 37 % 1000} FAILED retry" for i in range(args.lines)]
+    image = _synthetic_text_image(width=640, height=20 + 26 * args.lines, lines=())
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((10, 10 + i * 26), line, fill="black")
+    binary = create_preprocessor()(image)
+    print(f"region {image.size[0]}x{image.size[1]}, binarized {binary.size[0]}x{binary.size[1]}, "
+          f"{os.cpu_count()} cores")
+
+    engine = create_engine(args.backend)
+    single = engine.recognize(binary).strip()
+    single_ms = _time_per_call(engine.recognize, binary, args.runs)
+    engine.close()
+    print(f"{'workers':>7} {'strips':>6} {'ms':>9} {'speedup':>8} same-text")
+    print(f"{'-':>7} {1:>6} {single_ms:>9.1f} {1.0:>7.2f}x yes")
+    for n in [int(v) for v in args.workers.split(",")]:
+        strips = StripRecognizer(n, args.backend)
+        count = len(split_strips(binary, n, strips.min_height))
+        text = strips.recognize(binary)  # also starts the pool and loads the engines
+        ms = _time_per_call(strips.recognize, binary, args.runs)
+        strips.close()
+        same = "yes" if text.split() == single.split() else "no"
+        print(f"{n:>7} {count:>6} {ms:>9.1f} {single_ms / ms:>7.2f}x {same}")
+
+
+def bench_needles(args):
+    """Several click targets: one pyautogui.locate per needle vs the needle
+    library over one shared haystack. The button on screen is the one with
+    the lowest priority, so every needle is searched (worst case); the miss
+    columns time the same needles over a screen showing none of them."""
+    import pyautogui
+
+    w, h = (int(v) for v in args.size.split("x"))
+    print(f"{'needles':>7} {'locate ms':>10} {'library ms':>11} {'speedup':>8} {'ms/needle':>10} "
+          f"{'miss locate':>12} {'miss library':>13}  found")
+    blank = _synthetic_screen(w, h)
+    for n in [int(v) for v in args.needles.split(",")]:
+        needles = [_synthetic_button(f"Btn {i:02d}") for i in range(n)]
+        haystack = blank.copy()
+        haystack.paste(needles[-1], (w * 2 // 3, h // 2))
+        library = NeedleLibrary()
+        for i, needle in enumerate(needles):
+            library.add(f"btn{i}", needle)
+
+        def pyautogui_each(img):
+            for needle in needles:
+                try:
+                    hit = pyautogui.locate(needle, img, confidence=0.8)
+                except pyautogui.ImageNotFoundException:
+                    continue
+                if hit is not None:
+                    return hit
+            return None
+
+        found = library.locate(haystack)
+        ref_ms = _time_per_call(pyautogui_each, haystack, args.runs)
+        lib_ms = _time_per_call(library.locate, haystack, args.runs)
+        name = library.last_needle.name if found else None
+        ref_miss_ms = _time_per_call(pyautogui_each, blank, args.runs)
+        lib_miss_ms = _time_per_call(library.locate, blank, args.runs)
+        print(f"{n:>7} {ref_ms:>10.1f} {lib_ms:>11.1f} {ref_ms / lib_ms:>7.1f}x {lib_ms / n:>10.2f} "
+              f"{ref_miss_ms:>12.1f} {lib_miss_ms:>13.1f}  {name}")
+
+
+def bench_profile(args):
+    """Profile load + apply into a fresh controller, with the needle artifact
+    cache (memory-mapped pyramids) and without it (pyramids rebuilt)."""
+    import shutil
+
+    from controller import MacroController
+    from profiles import ARTIFACT_DIR, apply_profile, load_profile, save_profile
+
+    w, h = (int(v) for v in args.needle_size.split("x"))
+    source = MacroController(1.0)
+    source.result_region = (0, 0, 1280, 720)
+    source.target_texts = ["SUCCESS", "FAILED"]
+    for i in range(args.needles):
+        needle = _synthetic_screen(w, h)
+        ImageDraw.Draw(needle).text((4, 4), f"needle {i}", fill="black")
+        source.add_needle(f"needle {i}", needle)
+
+    def load(directory):
+        apply_profile(MacroController(1.0), load_profile(directory))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        save_profile(source, tmp)
+        load(tmp)  # imports numpy / OpenCV / Pillow codecs outside the timing
+        warm_ms = _time_per_call(load, tmp, args.runs)
+
+        def cold(directory):
+            shutil.rmtree(os.path.join(directory, ARTIFACT_DIR), ignore_errors=True)
+            load(directory)  # rebuilds, and writes the cache back
+
+        cold_ms = _time_per_call(cold, tmp, args.runs)
+    print(f"{args.needles} needles of {w}x{h}: cached {warm_ms:.1f} ms, "
+          f"rebuilt {cold_ms:.1f} ms ({cold_ms / warm_ms:.1f}x)")
+
+
+class _BgrxScreen(CaptureBackend):
+    """Stands in for x11: a fixed BGRX screen copied out on every grab,
+    into a fresh buffer (what XGetImage + string_at costs) or a pooled one."""
+
+    name = "synthetic"
+    raw_bgrx = True
+
+    def __init__(self, width, height):
+        screen = _synthetic_screen(width, height)
+        screen.paste(_synthetic_button(), (width * 2 // 3, height // 2))
+        self._pixels = screen.convert("RGBX").tobytes("raw", "BGRX")
+
+    def grab_raw(self, x, y, w, h):
+        return RawFrame(bytes(self._pixels), w, h, "BGRX")
+
+    def grab_raw_into(self, x, y, w, h, pool):
+        buf = pool.acquire(len(self._pixels))
+        buf[:] = self._pixels
+        return pool.attach(RawFrame(buf, w, h, "BGRX"))
+
+
+def bench_frames(args):
+    """Memory churn of the scan loop (capture, change check, preprocess, image
+    search on every frame) over a simulated run of `--minutes` at `--rate`
+    scans/s, run back to back as fast as possible: PIL frames as before vs
+    pooled capture buffers scanned as array views. "alloc/frame" is how far
+    traced memory rose above the frame's starting point (numpy and Python
+    allocations; Pillow's own image memory is not traced, so the PIL images
+    made are counted instead); "drift" is what stayed allocated from the
+    first frame to the last."""
+    if not hasattr(tracemalloc, "reset_peak"):
+        raise SystemExit("bench.py frames needs Python 3.9+")
+    w, h = (int(v) for v in args.size.split("x"))
+    frames = max(1, int(args.minutes * 60 * args.rate))
+    backend = _BgrxScreen(w, h)
+    region = (0, 0, w, h)
+    pil_stats = getattr(Image.core, "get_stats", None)
+    print(f"{frames} frames of {w}x{h} ({args.minutes:g} min at {args.rate:g}/s)")
+    print(f"{'mode':>7} {'ms/frame':>9} {'alloc/frame':>12} {'churn/min':>10} {'drift':>8} "
+          f"{'PIL images':>11}  pool")
+    for mode in ("pil", "pooled"):
+        pool = BufferPool()
+        if mode == "pooled":
+            pipeline = FramePipeline(lambda reg: backend.grab_raw_into(*reg, pool))
+        else:
+            pipeline = FramePipeline(lambda reg: backend.grab(*reg))
+        detector = ChangeDetector()
+        preprocess = NumpyPreprocessor()
+        library = NeedleLibrary(tracking=True)
+        library.add("retry", _synthetic_button())
+
+        def scan(_):
+            frame = pipeline.fresh(region)
+            pixels = frame.pixels
+            detector.changed(pixels)
+            preprocess(pixels)
+            library.locate(pixels)
+
+        scan(None)  # warm-up: buffers, lazy imports, tracking
+        tracemalloc.start()
+        pil_before = pil_stats()["new_count"] if pil_stats else 0
+        start_mem = tracemalloc.get_traced_memory()[0]
+        churn = 0
+        start = time.perf_counter()
+        for _ in range(frames):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            scan(None)
+            churn += tracemalloc.get_traced_memory()[1] - base
+        elapsed = time.perf_counter() - start
+        drift = tracemalloc.get_traced_memory()[0] - start_mem
+        tracemalloc.stop()
+        pil_images = pil_stats()["new_count"] - pil_before if pil_stats else "n/a"
+        per_frame = churn / frames / 2 ** 20
+        pooled = pool.stats() if mode == "pooled" else {}
+        print(f"{mode:>7} {elapsed / frames * 1000:9.1f} {per_frame:9.1f} MB "
+              f"{per_frame * args.rate * 60:7.0f} MB {drift / 2 ** 20:5.1f} MB {pil_images!s:>11}  "
+              f"{pooled.get('allocations', '-')} allocations, {pooled.get('reuses', '-')} reuses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cyclops benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("ocr", help="per-call latency of each OCR backend")
+    p.add_argument("--image", help="image to recognize (default: synthetic)")
+    p.add_argument("--runs", type=int, default=20)
+    p.add_argument("--lang", default=DEFAULT_LANG)
+    p.set_defaults(func=bench_ocr)
+
+    p = sub.add_parser("preprocess", help="PIL vs NumPy OCR preprocessing, 200x50 to 4K")
+    p.add_argument("--runs", type=int, default=20)
+    p.set_defaults(func=bench_preprocess)
+
+    p = sub.add_parser("match", help="pyautogui.locate vs coarse-to-fine TemplateMatcher")
+    p.add_argument("--runs", type=int, default=10)
+    p.set_defaults(func=bench_match)
+
+    p = sub.add_parser("capture", help="capture rate of each screen capture backend")
+    p.add_argument("--seconds", type=float, default=2.0, help="time per backend and size")
+    p.set_defaults(func=bench_capture)
+
+    p = sub.add_parser("loop", help="headless MacroController.run() throughput")
+    p.add_argument("--frames", type=int, default=200, help="synthetic frames before the target text appears")
+    p.add_argument("--jitter", type=int, default=0, help="synthetic needle jitter in px")
+    p.add_argument("--session", help="replay a recorded session instead of synthetic frames")
+    p.add_argument("--ocr-backend", default="auto")
+    p.add_argument("--pipelined", action="store_true", help="run the staged pipeline")
+    p.set_defaults(func=bench_loop)
+
+    p = sub.add_parser("scheduler", help="aggregate throughput of the multi-job scheduler")
+    p.add_argument("--jobs", default="1,4,16,64", help="comma-separated job counts")
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.add_argument("--interval", type=float, default=0.0, help="per-job scan interval")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--ocr-backend", default="auto")
+    p.set_defaults(func=bench_scheduler)
+
+    p = sub.add_parser("layout", help="full-region OCR vs dirty bands vs text blocks")
+    p.add_argument("--frames", type=int, default=20)
+    p.add_argument("--width", type=int, default=1280)
+    p.add_argument("--height", type=int, default=720)
+    p.add_argument("--ocr-backend", default="auto")
+    p.set_defaults(func=bench_layout)
+
+    p = sub.add_parser("tiers", help="cheap-first tiered OCR vs always-full OCR")
+    p.add_argument("--frames", type=int, default=30)
+    p.add_argument("--target", default="SUCCESS")
+    p.add_argument("--hit-every", type=int, default=10, help="every Nth frame shows the target")
+    p.add_argument("--ocr-backend", default="auto")
+    p.set_defaults(func=bench_tiers)
+
+    p = sub.add_parser("textmatch", help="per-check cost of the stop-text matcher vs target count")
+    p.add_argument("--targets", default="1,10,100,1000", help="comma-separated target counts")
+    p.add_argument("--fuzzy", type=float, default=0.2, help="max edit ratio (0 = exact only)")
+    p.add_argument("--runs", type=int, default=5)
+    p.set_defaults(func=bench_textmatch)
+
+    p = sub.add_parser("stop", help="STOP-to-idle latency and sleep precision of the controller")
+    p.add_argument("--runs", type=int, default=20)
+    p.set_defaults(func=bench_stop)
+
+    p = sub.add_parser("startup", help="GUI vs headless CLI time from process start to ready")
+    p.add_argument("--runs", type=int, default=5)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("daemon", help="per-process OCR vs a shared OCR daemon: throughput and RSS")
+    p.add_argument("--clients", default="1,2,4", help="comma-separated client process counts")
+    p.add_argument("--frames", type=int, default=20, help="OCR calls per client")
+    p.add_argument("--workers", type=int, default=2, help="daemon worker threads")
+    p.add_argument("--backend", default="auto", help="OCR backend (local clients and daemon workers)")
+    p.set_defaults(func=bench_daemon)
+
+    p = sub.add_parser("strips", help="single-call OCR vs strip-parallel OCR, 1..N worker processes")
+    p.add_argument("--workers", default=",".join(str(n) for n in (1, 2, 4, 8) if n <= (os.cpu_count() or 1)),
+                   help="comma-separated worker counts")
+    p.add_argument("--lines", type=int, default=60, help="text lines in the synthetic region")
+    p.add_argument("--backend", default="auto")
+    p.add_argument("--runs", type=int, default=3)
+    p.set_defaults(func=bench_strips)
+
+    p = sub.add_parser("needles", help="per-needle pyautogui.locate vs one-pass needle library")
+    p.add_argument("--needles", default="1,2,4,8,16", help="comma-separated needle counts")
+    p.add_argument("--size", default="1920x1080", help="haystack WxH")
+    p.add_argument("--runs", type=int, default=5)
+    p.set_defaults(func=bench_needles)
+
+    p = sub.add_parser("profile", help="profile load time with and without the needle artifact cache")
+    p.add_argument("--needles", type=int, default=4)
+    p.add_argument("--needle-size", default="400x300", help="WxH of each needle")
+    p.add_argument("--runs", type=int, default=10)
+    p.set_defaults(func=bench_profile)
+
+    p = sub.add_parser("frames", help="scan-loop memory churn: PIL frames vs pooled capture buffers")
+    p.add_argument("--minutes", type=float, default=60.0, help="length of the simulated run")
+    p.add_argument("--rate", type=float, default=1.0, help="simulated scans per second")
+    p.add_argument("--size", default="3840x2160", help="region WxH")
+    p.set_defaults(func=bench_frames)
+
+    p = sub.add_parser("metrics", help="cost of the stage timers with metrics on vs off")
+    p.add_argument("--calls", type=int, default=200000)
+    p.set_defaults(func=bench_metrics)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
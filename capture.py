@@ -0,0 +1,401 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import weakref
+from typing import Dict, List, Optional
+
+from lazy import available, lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageGrab = lazy_import("PIL.ImageGrab")
+mss = lazy_import("mss", optional=True)
+np = lazy_import("numpy", optional=True)
+
+IS_MAC = sys.platform == "darwin"
+IS_WIN = sys.platform == "win32"
+
+
+class RawFrame:
+    """Pixel buffer straight from a capture backend.
+
+    `mode` is the raw layout of `data`: "BGRX" for X11/mss (4 bytes per
+    pixel, alpha/padding ignored) or a PIL mode for the legacy path.
+    """
+
+    def __init__(self, data, width: int, height: int, mode: str = "BGRX",
+                 stride: int = 0):
+        self.data = data
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.stride = stride
+
+    def array(self):
+        """(height, width, 4) uint8 view of a BGRX `data` buffer; no copy."""
+        if self.mode != "BGRX":
+            raise ValueError(f"no array view for {self.mode} frames")
+        stride = self.stride or self.width * 4
+        return np.ndarray((self.height, self.width, 4), np.uint8, self.data, 0, (stride, 4, 1))
+
+    def to_image(self) -> Image.Image:
+        if self.mode == "BGRX":
+            return Image.frombuffer("RGB", (self.width, self.height), self.data,
+                                    "raw", "BGRX", self.stride, 1)
+        return Image.frombuffer(self.mode, (self.width, self.height), self.data,
+                                "raw", self.mode, self.stride, 1)
+
+
+class BufferPool:
+    """Free list of same-sized capture buffers.
+
+    `acquire()` lends a buffer and `attach()` ties it to the RawFrame built
+    on it: when that frame is garbage the buffer goes back on the free list.
+    Array views from `RawFrame.array()` must not outlive their frame; scan
+    stages hold the Frame while they read it. The pool grows to the number
+    of frames actually in flight (two in the sequential loop, about a dozen
+    in pipelined mode) and then stops allocating. At most `max_buffers` are
+    kept free; a new size drops them.
+    """
+
+    def __init__(self, max_buffers: int = 16):
+        self.max_buffers = max_buffers
+        self._nbytes = 0
+        self._free: List[bytearray] = []
+        # re-entrant: a finalizer can run on this thread while it holds the lock
+        self._lock = threading.RLock()
+        self.allocations = 0
+        self.reuses = 0
+        self.dropped = 0
+
+    def acquire(self, nbytes: int) -> bytearray:
+        with self._lock:
+            if nbytes != self._nbytes:
+                self._free = []
+                self._nbytes = nbytes
+            if self._free:
+                self.reuses += 1
+                return self._free.pop()
+            self.allocations += 1
+        return bytearray(nbytes)
+
+    def attach(self, frame: RawFrame) -> RawFrame:
+        weakref.finalize(frame, self.release, frame.data)
+        return frame
+
+    def release(self, buf: bytearray):
+        """Put `buf` back; for buffers no frame was attached to."""
+        with self._lock:
+            if len(buf) == self._nbytes and len(self._free) < self.max_buffers:
+                self._free.append(buf)
+            else:
+                self.dropped += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"free": len(self._free), "bytes": len(self._free) * self._nbytes,
+                    "allocations": self.allocations, "reuses": self.reuses,
+                    "dropped": self.dropped}
+
+
+class CaptureBackend:
+    name = "base"
+    # grab_raw() yields BGRX, so frames can go downstream as array views
+    raw_bgrx = False
+
+    def grab_raw(self, x: int, y: int, w: int, h: int) -> RawFrame:
+        raise NotImplementedError
+
+    def grab_raw_into(self, x: int, y: int, w: int, h: int, pool: BufferPool) -> RawFrame:
+        """`grab_raw()` into a buffer from `pool` where the backend can write
+        into caller memory; others allocate as usual."""
+        return self.grab_raw(x, y, w, h)
+
+    def grab(self, x: int, y: int, w: int, h: int) -> Image.Image:
+        return self.grab_raw(x, y, w, h).to_image()
+
+    def screenshot(self) -> Image.Image:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LegacyBackend(CaptureBackend):
+    """`screencapture` + PNG round-trip on macOS, ImageGrab elsewhere."""
+
+    name = "legacy"
+
+    def __init__(self):
+        # per-instance temp files: a fixed name raced between two Cyclops instances
+        self._tmp_paths = []
+        if IS_MAC:
+            self._screen_tmp = self._make_tmp("screen")
+            self._region_tmp = self._make_tmp("region")
+
+    def _make_tmp(self, tag: str) -> str:
+        fd, path = tempfile.mkstemp(prefix=f"Cyclops_{tag}_", suffix=".png")
+        os.close(fd)
+        self._tmp_paths.append(path)
+        return path
+
+    def _screencapture(self, args: List[str], path: str) -> Image.Image:
+        subprocess.run(
+            ["screencapture", "-x", *args, path],
+            capture_output=True, timeout=5,
+        )
+        img = Image.open(path)
+        return img.copy()
+
+    def grab(self, x: int, y: int, w: int, h: int) -> Image.Image:
+        if IS_MAC:
+            return self._screencapture(["-R", f"{x},{y},{w},{h}"], self._region_tmp)
+        return ImageGrab.grab(bbox=(x, y, x + w, y + h))
+
+    def grab_raw(self, x: int, y: int, w: int, h: int) -> RawFrame:
+        img = self.grab(x, y, w, h)
+        return RawFrame(img.tobytes(), img.size[0], img.size[1], img.mode)
+
+    def screenshot(self) -> Image.Image:
+        if IS_MAC:
+            return self._screencapture([], self._screen_tmp)
+        return ImageGrab.grab()
+
+    def close(self):
+        for path in self._tmp_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._tmp_paths = []
+
+
+class MssBackend(CaptureBackend):
+    """In-memory grabs through mss (CoreGraphics / GDI / XGetImage).
+
+    No `grab_raw_into`: mss allocates the pixels of every shot itself, so
+    copying them into a pooled buffer would add a copy without saving the
+    allocation. Frames are still BGRX array views of the shot.
+    """
+
+    name = "mss"
+    raw_bgrx = True
+
+    def __init__(self):
+        if not available(mss):
+            raise RuntimeError("mss is not installed or fails to import")
+        # mss handles are bound to the thread that created them
+        self._local = threading.local()
+        self._sct()
+
+    def _sct(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = self._local.sct = mss.mss()
+        return sct
+
+    def grab_raw(self, x: int, y: int, w: int, h: int) -> RawFrame:
+        shot = self._sct().grab({"left": x, "top": y, "width": w, "height": h})
+        return RawFrame(shot.raw, shot.width, shot.height, "BGRX")
+
+    def screenshot(self) -> Image.Image:
+        sct = self._sct()
+        mon = sct.monitors[1]
+        shot = sct.grab(mon)
+        return RawFrame(shot.raw, shot.width, shot.height, "BGRX").to_image()
+
+
+class _XImage(ctypes.Structure):
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+        ("red_mask", ctypes.c_ulong),
+        ("green_mask", ctypes.c_ulong),
+        ("blue_mask", ctypes.c_ulong),
+    ]
+
+
+_X_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+ZPIXMAP = 2
+ALL_PLANES = ctypes.c_ulong(-1).value
+
+
+class X11Backend(CaptureBackend):
+    """XGetImage on the root window via ctypes; works on any X server incl. Xvfb."""
+
+    name = "x11"
+    raw_bgrx = True
+
+    def __init__(self, display: Optional[str] = None):
+        lib_path = ctypes.util.find_library("X11")
+        if not lib_path:
+            raise RuntimeError("libX11 not found")
+        xlib = ctypes.cdll.LoadLibrary(lib_path)
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        xlib.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        xlib.XDefaultScreen.restype = ctypes.c_int
+        xlib.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDisplayWidth.restype = ctypes.c_int
+        xlib.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDisplayHeight.restype = ctypes.c_int
+        xlib.XGetImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int, ctypes.c_int,
+            ctypes.c_uint, ctypes.c_uint, ctypes.c_ulong, ctypes.c_int,
+        ]
+        xlib.XGetImage.restype = ctypes.POINTER(_XImage)
+        xlib.XGetSubImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int, ctypes.c_int,
+            ctypes.c_uint, ctypes.c_uint, ctypes.c_ulong, ctypes.c_int,
+            ctypes.POINTER(_XImage), ctypes.c_int, ctypes.c_int,
+        ]
+        xlib.XGetSubImage.restype = ctypes.POINTER(_XImage)
+        xlib.XCreateImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_int,
+            ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint, ctypes.c_int, ctypes.c_int,
+        ]
+        xlib.XCreateImage.restype = ctypes.POINTER(_XImage)
+        xlib.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDefaultVisual.restype = ctypes.c_void_p
+        xlib.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDefaultDepth.restype = ctypes.c_int
+        xlib.XDestroyImage.argtypes = [ctypes.POINTER(_XImage)]
+        xlib.XDestroyImage.restype = ctypes.c_int
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xlib.XSetErrorHandler.argtypes = [_X_ERROR_HANDLER]
+        xlib.XSetErrorHandler.restype = ctypes.c_void_p
+        self._xlib = xlib
+
+        # the default handler exits the process on BadMatch (grab outside the screen)
+        self._error_handler = _X_ERROR_HANDLER(lambda _display, _event: 0)
+        xlib.XSetErrorHandler(self._error_handler)
+
+        name = (display or os.environ.get("DISPLAY", "")).encode() or None
+        self._display = xlib.XOpenDisplay(name)
+        if not self._display:
+            raise RuntimeError(f"cannot open X display {display or os.environ.get('DISPLAY')!r}")
+        self._root = xlib.XDefaultRootWindow(self._display)
+        screen = xlib.XDefaultScreen(self._display)
+        self._visual = xlib.XDefaultVisual(self._display, screen)
+        self._depth = xlib.XDefaultDepth(self._display, screen)
+        self.screen_size = (xlib.XDisplayWidth(self._display, screen),
+                            xlib.XDisplayHeight(self._display, screen))
+        # one Display connection, Xlib calls must not interleave
+        self._lock = threading.Lock()
+
+    def grab_raw(self, x: int, y: int, w: int, h: int) -> RawFrame:
+        with self._lock:
+            ximage = self._xlib.XGetImage(self._display, self._root, x, y, w, h,
+                                          ALL_PLANES, ZPIXMAP)
+            if not ximage:
+                raise RuntimeError(f"XGetImage failed for region {(x, y, w, h)}")
+            try:
+                img = ximage.contents
+                if img.bits_per_pixel != 32:
+                    raise RuntimeError(f"unsupported X visual: {img.bits_per_pixel} bpp")
+                stride = img.bytes_per_line
+                data = ctypes.string_at(img.data, stride * img.height)
+                width, height = img.width, img.height
+            finally:
+                self._xlib.XDestroyImage(ximage)
+        return RawFrame(data, width, height, "BGRX", stride)
+
+    def grab_raw_into(self, x: int, y: int, w: int, h: int, pool: BufferPool) -> RawFrame:
+        """XGetSubImage straight into a pooled buffer: no per-grab pixel allocation
+        and no copy out of Xlib's own buffer."""
+        with self._lock:
+            # an XImage header around our memory; data is attached once the stride is known
+            ximage = self._xlib.XCreateImage(self._display, self._visual, self._depth,
+                                             ZPIXMAP, 0, None, w, h, 32, 0)
+            if not ximage:
+                raise RuntimeError("XCreateImage failed")
+            img = ximage.contents
+            stride = img.bytes_per_line
+            if img.bits_per_pixel != 32:
+                self._xlib.XDestroyImage(ximage)
+                raise RuntimeError(f"unsupported X visual: {img.bits_per_pixel} bpp")
+            buf = pool.acquire(stride * h)
+            pixels = (ctypes.c_char * len(buf)).from_buffer(buf)
+            try:
+                img.data = ctypes.addressof(pixels)
+                got = self._xlib.XGetSubImage(self._display, self._root, x, y, w, h,
+                                              ALL_PLANES, ZPIXMAP, ximage, 0, 0)
+                if not got:
+                    raise RuntimeError(f"XGetSubImage failed for region {(x, y, w, h)}")
+            except BaseException:
+                pool.release(buf)
+                raise
+            finally:
+                # the pixels belong to the pool, not to Xlib
+                img.data = None
+                self._xlib.XDestroyImage(ximage)
+        return pool.attach(RawFrame(buf, w, h, "BGRX", stride))
+
+    def screenshot(self) -> Image.Image:
+        w, h = self.screen_size
+        return self.grab(0, 0, w, h)
+
+    def close(self):
+        with self._lock:
+            if self._display:
+                self._xlib.XCloseDisplay(self._display)
+                self._display = None
+
+
+BACKENDS = {
+    "x11": X11Backend,
+    "mss": MssBackend,
+    "legacy": LegacyBackend,
+}
+
+if IS_MAC:
+    AUTO_ORDER = ("mss", "legacy")
+elif IS_WIN:
+    # mss switches the process to per-monitor DPI awareness, which would move
+    # pyautogui/Tk off the logical coordinates the app relies on (scale 1.0)
+    AUTO_ORDER = ("legacy",)
+else:
+    AUTO_ORDER = ("x11", "mss", "legacy")
+
+_backends: Dict[str, CaptureBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name: str = "auto") -> CaptureBackend:
+    """Shared backend instance. "auto" picks the first one that initializes."""
+    with _backends_lock:
+        if name in _backends:
+            return _backends[name]
+        if name == "auto":
+            last_error = None
+            for candidate in AUTO_ORDER:
+                try:
+                    backend = BACKENDS[candidate]()
+                    break
+                except RuntimeError as e:
+                    last_error = e
+            else:
+                raise RuntimeError(f"no capture backend available: {last_error}")
+        else:
+            if name not in BACKENDS:
+                raise ValueError(f"unknown capture backend: {name}")
+            backend = BACKENDS[name]()
+        _backends[name] = backend
+        return backend
@@ -0,0 +1,225 @@
+"""Headless Cyclops: run a profile without Tk and stream events as JSON lines.
+
+    python cli.py PROFILE.json [--dry-run] [--timeout S] [--record FILE | --replay FILE]
+                               [--metrics FILE [--metrics-format jsonl|prometheus]]
+    python cli.py PROFILE.json PROFILE.json ... [--dry-run] [--timeout S] [--workers N]
+
+Every line on stdout is one JSON object with "t" (seconds since start) and
+"event": ready, status, attempt, ocr, rate, click, match, stopped, stats or
+error. Exit code: 0 = target text found, 1 = stopped without a match,
+2 = bad profile or setup error.
+
+Several profiles run together as jobs of one JobScheduler: one capture per
+tick covers every due region, OCR runs on a shared worker pool and clicks
+are serialized. Their events carry the profile path as "job"; the exit code
+is 0 only when every job found its text.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+# before the imports below: startup_ms includes loading them
+_START = time.perf_counter()
+
+from controller import CAPTURE_BACKEND, MacroController, check_tesseract, get_display_scale  # noqa: E402
+from frames import LiveFrameSource, RecordedFrameSource, RecordingFrameSource  # noqa: E402
+from inputs import InputSink, LoggingSink, PyAutoGuiSink  # noqa: E402
+from metrics import MetricsExporter  # noqa: E402
+from ocr import create_engine  # noqa: E402
+from profiles import apply_profile, load_profile, make_job  # noqa: E402
+from scheduler import JobScheduler  # noqa: E402
+
+
+class EventWriter:
+    def __init__(self, stream=None):
+        # looked up per writer, not at import, so a redirected stdout is honoured
+        self.stream = stream if stream is not None else sys.stdout
+        self._lock = threading.Lock()
+
+    def __call__(self, event: str, **fields):
+        fields = dict(t=round(time.perf_counter() - _START, 4), event=event, **fields)
+        line = json.dumps(fields, ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+class _EventSink(InputSink):
+    """Reports every click as an event before passing it on."""
+
+    def __init__(self, inner: InputSink, emit: EventWriter):
+        self.inner = inner
+        self.emit = emit
+        self.name = inner.name
+
+    def click(self, x: float, y: float):
+        self.emit("click", x=round(x, 1), y=round(y, 1))
+        self.inner.click(x, y)
+
+    def close(self):
+        self.inner.close()
+
+
+def _wire(controller: MacroController, emit: EventWriter, outcome: dict):
+    controller.on_status_update = lambda msg: emit("status", message=msg)
+    controller.on_attempt_update = lambda n: emit("attempt", n=n)
+    controller.on_ocr_update = lambda text: emit("ocr", text=text)
+    controller.on_rate_update = lambda interval: emit("rate", interval=interval)
+
+    def on_match():
+        outcome["matched"] = True
+        hit = controller.last_text_hit
+        emit("match", target=hit.target if hit else None, kind=hit.kind if hit else None,
+             text=controller.last_ocr_text, attempts=controller.attempt_count)
+
+    controller.on_match_found = on_match
+    controller.on_stopped = lambda: emit("stopped")
+
+
+def _run_jobs(args, emit: EventWriter) -> int:
+    try:
+        profiles = [load_profile(path) for path in args.profile]
+        jobs = [make_job(profile, path) for profile, path in zip(profiles, args.profile)]
+        scale = args.scale or next((p["scale"] for p in profiles if "scale" in p), None)
+        if scale is None:
+            scale = 1.0 if args.replay else get_display_scale()
+        # one engine per worker for all jobs: the first profile's backend
+        ocr_backend = profiles[0].get("ocr_backend", "auto")
+        ocr_daemon = profiles[0].get("ocr_daemon")
+        engine = create_engine(ocr_backend, daemon_address=ocr_daemon)
+        name = engine.name
+        engine.close()
+        if name == "pytesseract" and not check_tesseract():
+            raise RuntimeError("tesseract not installed")
+    except (ValueError, RuntimeError, ImportError) as e:
+        emit("error", message=str(e))
+        return 2
+
+    if args.replay:
+        source = RecordedFrameSource(args.replay)
+    else:
+        source = LiveFrameSource(CAPTURE_BACKEND)
+        if args.record:
+            source = RecordingFrameSource(source, args.record)
+    sink: InputSink = LoggingSink() if args.dry_run else PyAutoGuiSink()
+    sched = JobScheduler(source, sink, float(scale), workers=args.workers, ocr_backend=ocr_backend,
+                         ocr_daemon_address=ocr_daemon,
+                         on_event=lambda job, kind, detail: emit(kind, job=job.name, detail=detail))
+    for job in jobs:
+        sched.add_job(job)
+    emit("ready", profiles=args.profile, scale=scale, jobs=len(jobs), ocr_backend=name,
+         capture="replay" if args.replay else CAPTURE_BACKEND,
+         startup_ms=round((time.perf_counter() - _START) * 1000, 1))
+    if args.check:
+        source.close()
+        return 0
+
+    try:
+        sched.run(duration=args.timeout)
+    except KeyboardInterrupt:
+        emit("status", message="interrupted")
+    finally:
+        source.close()
+        sink.close()
+        emit("stats", **sched.stats())
+    return 0 if all(job.status == "matched" for job in jobs) else 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cyclops headless runner")
+    parser.add_argument("profile", nargs="+",
+                        help="JSON profile: region, needle, targets, delays (several = one job each)")
+    parser.add_argument("--dry-run", action="store_true", help="log clicks instead of clicking")
+    parser.add_argument("--timeout", type=float, help="stop after this many seconds")
+    parser.add_argument("--scale", type=float, help="display scale (skips detection)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--record", metavar="SESSION", help="save captured frames to a session file")
+    source.add_argument("--replay", metavar="SESSION", help="read frames from a session file")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write stage latencies and counters to FILE periodically")
+    parser.add_argument("--metrics-format", choices=MetricsExporter.FORMATS, default="jsonl",
+                        help="jsonl = append snapshots, prometheus = textfile collector format")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, metavar="S")
+    parser.add_argument("--check", action="store_true",
+                        help="load the profile, set everything up and exit")
+    parser.add_argument("--workers", type=int, help="OCR threads shared by several profiles")
+    args = parser.parse_args(argv)
+
+    emit = EventWriter()
+    if len(args.profile) > 1:
+        if args.metrics:
+            parser.error("--metrics needs a single profile")
+        return _run_jobs(args, emit)
+    args.profile = args.profile[0]
+    try:
+        profile = load_profile(args.profile)
+        scale = args.scale or profile.get("scale")
+        if scale is None:
+            scale = 1.0 if args.replay else get_display_scale()
+        controller = MacroController(float(scale), profile.get("ocr_backend", "auto"),
+                                     profile.get("ocr_daemon"))
+        apply_profile(controller, profile)
+        controller.scale = float(scale)  # --scale wins over the profile's
+        # unattended: fail now rather than on the first scan
+        if controller.ocr_engine.name == "pytesseract" and not check_tesseract():
+            raise RuntimeError("tesseract not installed")
+    except (ValueError, RuntimeError, ImportError) as e:
+        # ValueError includes ProfileError
+        emit("error", message=str(e))
+        return 2
+
+    if args.replay:
+        controller.frame_source = RecordedFrameSource(args.replay)
+    elif args.record:
+        controller.frame_source = RecordingFrameSource(controller.frame_source, args.record)
+    if args.dry_run:
+        sink: InputSink = LoggingSink()
+    else:
+        sink = PyAutoGuiSink()
+    controller.input_sink = _EventSink(sink, emit)
+
+    outcome = {"matched": False}
+    _wire(controller, emit, outcome)
+    emit("ready", profile=args.profile, scale=scale, targets=controller.target_texts,
+         ocr_backend=controller.ocr_engine.name,
+         capture="replay" if args.replay else CAPTURE_BACKEND,
+         startup_ms=round((time.perf_counter() - _START) * 1000, 1))
+    if args.check:
+        controller.frame_source.close()
+        return 0
+
+    exporter = None
+    if args.metrics:
+        exporter = MetricsExporter(controller.metrics, args.metrics,
+                                   args.metrics_interval, args.metrics_format)
+        exporter.start()
+    controller.running = True
+    worker = threading.Thread(target=controller.run, name="cyclops-run", daemon=True)
+    worker.start()
+    deadline = time.monotonic() + args.timeout if args.timeout else None
+    try:
+        # join in slices so Ctrl+C / the timeout are noticed
+        while worker.is_alive():
+            worker.join(0.2)
+            if deadline is not None and time.monotonic() >= deadline:
+                emit("status", message="timeout")
+                controller.stop()
+                deadline = None
+    except KeyboardInterrupt:
+        emit("status", message="interrupted")
+        controller.stop()
+        worker.join(2.0)
+    finally:
+        controller.frame_source.close()
+        controller.input_sink.close()
+        if exporter is not None:
+            exporter.stop()
+        emit("stats", **controller.stats())
+        controller.close()
+    return 0 if outcome["matched"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,656 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import importlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+
+from capture import BufferPool, get_backend
+from frames import (AdaptiveRate, ChangeDetector, FramePipeline, FrameSource, FrameSourceExhausted,
+                    LiveFrameSource)
+from inputs import InputSink, PyAutoGuiSink
+from lazy import lazy_import
+from matcher import NeedleLibrary, PreparedNeedle
+from metrics import Metrics
+from ocr import OcrCache, OcrEngine, RegionTracker, StripRecognizer, TieredRecognizer, create_engine
+from pipeline import StagedRunner
+from preprocess import create_preprocessor, find_text_blocks, split_bands, text_blocks_available
+from textmatch import TARGET_SEPARATOR, TextHit, TextMatcher, split_targets, validate_targets
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+pyautogui = lazy_import("pyautogui")
+
+IS_MAC = sys.platform == "darwin"
+
+CLICK_DELAY = 3.0
+OCR_CONFIG = "--psm 6"
+OCR_LANG = "kor+eng"
+OCR_BACKEND = "auto"  # "auto" | "tesserocr" | "pytesseract" | "daemon"
+# where a shared `python ocr_daemon.py` listens ("unix:/path" or "host:port");
+# None = ocr_daemon.DEFAULT_ADDRESS. Only used with OCR_BACKEND = "daemon".
+OCR_DAEMON_ADDRESS: Optional[str] = None
+# "full" = one OCR call per frame, "bands" = re-OCR only changed text lines,
+# "blocks" = OCR only detected text boxes (changed ones), "auto" = blocks when
+# OpenCV is available, else bands once the binarized region is at least
+# OCR_BANDS_MIN_HEIGHT px tall, "strips" = cut the region into horizontal
+# strips on blank rows and OCR them in parallel worker processes. The partial
+# layouts are opt-in: per-box --psm 6 crops can read worse than the full region
+OCR_LAYOUT = "full"
+OCR_BANDS_MIN_HEIGHT = 200
+OCR_STRIP_WORKERS: Optional[int] = None  # None = one per CPU core
+OCR_STRIP_MIN_HEIGHT = 64  # px of the binarized (upscaled) image
+# cheap single-language / whitelisted / no-upscale pass first, full kor+eng pass
+# only when that text is close to a target. Off by default: the cheap pass reads
+# the whole region on every changed frame, bypassing the band/block tracking
+OCR_TIERED = False
+CAPTURE_BACKEND = "auto"  # "auto" | "x11" | "mss" | "legacy"
+# scan captures as array views (x11/mss with numpy), x11 grabbing into reused
+# buffers; a PIL image is only made for recording
+FRAME_POOL = True
+MATCH_CONFIDENCE = 0.8
+TEXT_MAX_ERROR_RATIO = 0.0  # >0 also stops on OCR typos, e.g. 0.2 = 1 edit per 5 chars
+IMAGE_RETRY_INTERVAL = 0.5
+IMAGE_RETRY_MAX = 10
+PIPELINED = False  # run capture / preprocess / OCR / match as concurrent stages
+MATCH_TRACKING = True  # search around the last hit before scanning the whole region
+CLICK_NEEDLE = "click"  # library name of click_image (priority 0: tried first)
+# max per-pixel, per-channel change (0-255) still treated as "unchanged";
+# 0 = only skip OCR on pixel-identical frames
+CHANGE_TOLERANCE = 0.0
+# adaptive mode: image-search retries poll the region instead of sleeping
+# IMAGE_RETRY_INTERVAL; the poll interval doubles while the region is static
+# (up to RATE_CEILING) and drops to RATE_FLOOR on any change, and the next
+# retry starts on the first change. The full click_delay still follows every
+# click: the screen may change before the click has taken effect.
+ADAPTIVE_RATE = False
+RATE_FLOOR = 0.05
+RATE_CEILING = 2.0
+RATE_BACKOFF = 2.0
+# per-stage latency histograms and run counters (see Metrics); off = a no-op
+# call per stage
+METRICS_ENABLED = True
+
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cyclops")
+OCR_CACHE_SIZE = 256
+OCR_CACHE_MAX_BYTES = 4 * 1024 * 1024
+# e.g. os.path.join(CACHE_DIR, "ocr_cache.json") keeps OCR'd screen text across
+# runs; off by default, None = memory only
+OCR_CACHE_PATH: Optional[str] = None
+# display scale and tesseract check results, keyed by screen size / tesseract binary
+STARTUP_CACHE_PATH: Optional[str] = os.path.join(CACHE_DIR, "startup.json")
+
+
+def take_screenshot() -> Image.Image:
+    return get_backend(CAPTURE_BACKEND).screenshot()
+
+
+def _read_startup_cache() -> dict:
+    if not STARTUP_CACHE_PATH:
+        return {}
+    try:
+        with open(STARTUP_CACHE_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) and data.get("version") == 1 else {}
+
+
+def _write_startup_cache(key: str, value):
+    if not STARTUP_CACHE_PATH:
+        return
+    data = _read_startup_cache()
+    data["version"] = 1
+    data[key] = value
+    try:
+        os.makedirs(os.path.dirname(STARTUP_CACHE_PATH), exist_ok=True)
+        tmp = f"{STARTUP_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, STARTUP_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def _mac_display_key() -> Optional[str]:
+    """Main display ID, logical size and backing pixel width via CoreGraphics;
+    no screenshot, no pyautogui. The logical size alone is in points, which
+    a 1x monitor and a Retina panel "looking like" the same size share."""
+    try:
+        cg = ctypes.cdll.LoadLibrary(ctypes.util.find_library("CoreGraphics")
+                                     or "/System/Library/Frameworks/CoreGraphics.framework/CoreGraphics")
+    except OSError:
+        return None
+    cg.CGMainDisplayID.restype = ctypes.c_uint32
+    cg.CGDisplayPixelsWide.argtypes = [ctypes.c_uint32]
+    cg.CGDisplayPixelsWide.restype = ctypes.c_size_t
+    cg.CGDisplayPixelsHigh.argtypes = [ctypes.c_uint32]
+    cg.CGDisplayPixelsHigh.restype = ctypes.c_size_t
+    cg.CGDisplayCopyDisplayMode.argtypes = [ctypes.c_uint32]
+    cg.CGDisplayCopyDisplayMode.restype = ctypes.c_void_p
+    cg.CGDisplayModeGetPixelWidth.argtypes = [ctypes.c_void_p]
+    cg.CGDisplayModeGetPixelWidth.restype = ctypes.c_size_t
+    cg.CGDisplayModeRelease.argtypes = [ctypes.c_void_p]
+    display = cg.CGMainDisplayID()
+    mode = cg.CGDisplayCopyDisplayMode(display)
+    if not mode:
+        return None
+    try:
+        pixel_w = cg.CGDisplayModeGetPixelWidth(mode)
+    finally:
+        cg.CGDisplayModeRelease(mode)
+    return f"{display}:{cg.CGDisplayPixelsWide(display)}x{cg.CGDisplayPixelsHigh(display)}@{pixel_w}"
+
+
+def get_display_scale() -> float:
+    if IS_MAC:
+        # the screenshot is the slow part; remember the ratio per display and
+        # mode so a resolution change or another monitor measures again
+        screen = _mac_display_key()
+        cached = _read_startup_cache().get("scale", {})
+        if screen is not None and screen in cached:
+            return cached[screen]
+        full = take_screenshot()
+        logical_w = pyautogui.size()[0]
+        scale = full.size[0] / logical_w
+        if screen is not None:
+            cached[screen] = scale
+            _write_startup_cache("scale", cached)
+        return scale
+    else:
+        # Windows: DPI awareness를 설정하지 않으면
+        # ImageGrab, pyautogui, Tk 모두 논리 좌표를 사용하므로
+        # scale 1.0으로 통일하여 좌표 불일치를 방지
+        return 1.0
+
+
+def capture_region(x, y, w, h) -> Image.Image:
+    return get_backend(CAPTURE_BACKEND).grab(x, y, w, h)
+
+
+def check_tesseract() -> bool:
+    """True if the tesseract binary runs. The version probe spawns a process,
+    so a success is cached for as long as the binary on PATH is unchanged."""
+    path = shutil.which("tesseract")
+    identity = None
+    if path is not None:
+        st = os.stat(path)
+        identity = [path, st.st_size, st.st_mtime]
+        if _read_startup_cache().get("tesseract") == identity:
+            return True
+    import pytesseract
+    try:
+        pytesseract.get_tesseract_version()
+    except pytesseract.TesseractNotFoundError:
+        return False
+    if identity is not None:
+        _write_startup_cache("tesseract", identity)
+    return True
+
+
+class MacroController:
+    def __init__(self, scale: float, ocr_backend: str = OCR_BACKEND,
+                 ocr_daemon_address: Optional[str] = OCR_DAEMON_ADDRESS):
+        self.scale = scale
+        self.explicit_scale: Optional[float] = None  # a profile's `scale`; saved instead of `scale`
+        self.ocr_backend = ocr_backend
+        self.ocr_daemon_address = ocr_daemon_address
+        self._ocr_engine: Optional[OcrEngine] = None
+        self._engine_lock = threading.Lock()
+        self.preprocess = create_preprocessor()
+        self.ocr_layout = OCR_LAYOUT
+        self.strip_workers = OCR_STRIP_WORKERS
+        self._strips: Optional[StripRecognizer] = None
+        self.region_tracker = RegionTracker()
+        self.tiered = OCR_TIERED
+        self.ocr_cache = OcrCache(OCR_CACHE_SIZE, OCR_CACHE_MAX_BYTES, OCR_CACHE_PATH)
+        # own preprocessor: its buffers must not be shared with the full pass,
+        # which may run on another thread in pipelined mode
+        self.tiers = TieredRecognizer(create_preprocessor(), ocr_backend, OCR_CONFIG,
+                                      cache=self.ocr_cache, daemon_address=ocr_daemon_address)
+        self.result_region: Optional[Tuple[int, int, int, int]] = None
+        # click targets in priority order; click_image is the one named CLICK_NEEDLE
+        self.needles = NeedleLibrary(tracking=MATCH_TRACKING)
+        self.target_texts: List[str] = []
+        self.text_max_error_ratio = TEXT_MAX_ERROR_RATIO
+        self._text_matcher: Optional[TextMatcher] = None
+        self.last_text_hit: Optional[TextHit] = None
+        # waits block on this; stop() notifies it
+        self.wakeup = threading.Condition()
+        self.click_delay = CLICK_DELAY
+        self.running = False
+        self.attempt_count = 0
+        self.last_ocr_text = ""
+        self.on_status_update = None
+        self.on_match_found = None
+        self.on_attempt_update = None
+        self.on_ocr_update = None
+        self.on_stopped = None
+        self.retry_interval = IMAGE_RETRY_INTERVAL
+        self.image_retry_max = IMAGE_RETRY_MAX
+        self.pipelined = PIPELINED
+        self.pipeline: Optional[StagedRunner] = None
+        self._click_lock = threading.Lock()
+        self.frame_source: FrameSource = LiveFrameSource(
+            CAPTURE_BACKEND, BufferPool() if FRAME_POOL else None)
+        self.input_sink: InputSink = PyAutoGuiSink()
+        self.frames = FramePipeline(self._capture_region)
+        self.change_detector = ChangeDetector(CHANGE_TOLERANCE)
+        self.ocr_skip_count = 0
+        self._last_match_verdict = False
+        self.adaptive = ADAPTIVE_RATE
+        self.scan_rate = AdaptiveRate(RATE_FLOOR, RATE_CEILING, RATE_BACKOFF)
+        # separate from change_detector: polling must not use up the change
+        # that the next OCR check is supposed to see
+        self.activity = ChangeDetector(CHANGE_TOLERANCE)
+        self.on_rate_update = None
+        self.metrics = Metrics(METRICS_ENABLED)
+
+    @property
+    def ocr_engine(self) -> OcrEngine:
+        # created on first use: loading tesseract (and its traineddata) is
+        # not needed to show the window or parse a profile
+        with self._engine_lock:
+            if self._ocr_engine is None:
+                self._ocr_engine = create_engine(self.ocr_backend, OCR_LANG, OCR_CONFIG,
+                                                 self.ocr_daemon_address)
+            return self._ocr_engine
+
+    def set_ocr_backend(self, backend: str, daemon_address: Optional[str] = None):
+        """Switch OCR backend; the current engines are closed and the new ones
+        load on first use."""
+        if (backend, daemon_address) == (self.ocr_backend, self.ocr_daemon_address):
+            return
+        self.close()
+        self.ocr_backend = self.tiers.backend = backend
+        self.ocr_daemon_address = self.tiers.daemon_address = daemon_address
+
+    def warm_up(self):
+        """Load the OCR engine and the image libraries ahead of the first scan."""
+        self.ocr_engine
+        try:
+            importlib.import_module("cv2")  # numpy comes with it
+        except ImportError:
+            pass
+
+    @property
+    def click_image(self) -> Optional[Image.Image]:
+        needle = self.needles.get(CLICK_NEEDLE)
+        return needle.image if needle is not None else None
+
+    @click_image.setter
+    def click_image(self, image: Optional[Image.Image]):
+        # prepare the needle (grayscale + pyramid) once, not on every search
+        if image is None:
+            self.needles.remove(CLICK_NEEDLE)
+        else:
+            self.needles.add(CLICK_NEEDLE, image, MATCH_CONFIDENCE, priority=0)
+
+    def add_needle(self, name: str, image: Image.Image, confidence: float = MATCH_CONFIDENCE,
+                   priority: Optional[int] = None, prepared: Optional[PreparedNeedle] = None):
+        """Another click target; the highest-priority one on screen is clicked."""
+        self.needles.add(name, image, confidence, priority, prepared)
+
+    @property
+    def matcher(self) -> Optional[NeedleLibrary]:
+        return self.needles if len(self.needles) else None
+
+    def _capture_region(self, region: Tuple[int, int, int, int]):
+        with self.metrics.timer("capture"):
+            return self.frame_source.grab_frame(region)
+
+    def _find_and_click(self, region_img: Image.Image) -> bool:
+        rx, ry, rw, rh = self.result_region
+        with self.metrics.timer("locate"):
+            match = self.matcher.locate(region_img)
+        if match is None:
+            self.metrics.inc("misses")
+            return False
+
+        cx, cy = match.center
+        # center is in physical pixels within the region image
+        # convert to logical screen coords: region offset + (pixel offset / scale)
+        click_x = rx + cx / self.scale
+        click_y = ry + cy / self.scale
+        return self._click(click_x, click_y)
+
+    def _click(self, x: float, y: float) -> bool:
+        # stop() takes the same lock, so no click can slip out after it returns
+        with self._click_lock:
+            if not self.running:
+                return False
+            with self.metrics.timer("click"):
+                self.input_sink.click(x, y)
+            self.metrics.inc("clicks")
+            return True
+
+    def _preprocess(self, image: Image.Image) -> Image.Image:
+        with self.metrics.timer("preprocess"):
+            return self.preprocess(image)
+
+    def _recognize(self, binary: Image.Image,
+                   recognize: Optional[Callable[[Image.Image], str]] = None) -> str:
+        key = OcrCache.key(binary, OCR_LANG, OCR_CONFIG)
+        text = self.ocr_cache.get(key)
+        if text is None:
+            with self.metrics.timer("ocr"):
+                text = (recognize or self.ocr_engine.recognize)(binary).strip()
+            self.ocr_cache.put(key, text)
+        return text
+
+    def _strip_recognizer(self) -> StripRecognizer:
+        workers = self.strip_workers or os.cpu_count() or 2
+        if self._strips is None or self._strips.workers != workers:
+            if self._strips is not None:
+                self._strips.close()
+            # worker processes load their own engine; a daemon client there
+            # would only forward the strips one by one
+            backend = "auto" if self.ocr_backend == "daemon" else self.ocr_backend
+            self._strips = StripRecognizer(workers, backend, OCR_LANG, OCR_CONFIG,
+                                           OCR_STRIP_MIN_HEIGHT)
+        return self._strips
+
+    def _layout(self, binary: Image.Image) -> str:
+        if self.ocr_layout == "auto":
+            if text_blocks_available():
+                return "blocks"
+            return "bands" if binary.size[1] >= OCR_BANDS_MIN_HEIGHT else "full"
+        return self.ocr_layout
+
+    def _ocr_binary(self, binary: Image.Image) -> str:
+        layout = self._layout(binary)
+        if layout == "blocks":
+            return self.region_tracker.recognize(binary, find_text_blocks(binary), self._recognize)
+        if layout == "bands":
+            lines = [[band] for band in split_bands(binary)]
+            return self.region_tracker.recognize(binary, lines, self._recognize)
+        if layout == "strips":
+            strips = self._strip_recognizer()
+            return self._recognize(binary, lambda b: strips.recognize(b, self.ocr_engine.recognize))
+        return self._recognize(binary)
+
+    def _tiers_ready(self) -> bool:
+        if self.tiers.error is not None:
+            # the cheap pass failed mid-run (e.g. TesseractError): full pass only
+            self.tiered = False
+            return False
+        try:
+            if self._get_text_matcher().regex_targets:
+                # a regex hit can't be told apart by edit distance on the cheap pass
+                return False
+            self.tiers.set_targets(self.target_texts, self.text_max_error_ratio)
+        except RuntimeError:
+            # cheap-pass language data missing: full pass only
+            self.tiered = False
+            return False
+        return self.tiers.engine is not None
+
+    def _ocr_frame(self, image: Image.Image, binary: Optional[Image.Image] = None) -> str:
+        """OCR a captured frame; `binary` is its preprocessed form if already made."""
+        def full() -> str:
+            return self._ocr_binary(binary if binary is not None else self._preprocess(image))
+
+        if self.tiered and self._tiers_ready():
+            return self.tiers.recognize(image, full)
+        return full()
+
+    def _ocr_image(self, image: Image.Image) -> str:
+        return self._ocr_frame(image)
+
+    @property
+    def target_text(self) -> str:
+        return f"{TARGET_SEPARATOR} ".join(self.target_texts)
+
+    @target_text.setter
+    def target_text(self, text: str):
+        """Raises ValueError for an invalid "re:" target, leaving the old targets."""
+        targets = split_targets(text)
+        validate_targets(targets)
+        self.target_texts = targets
+
+    def _get_text_matcher(self) -> TextMatcher:
+        m = self._text_matcher
+        if (m is None or m.targets != self.target_texts
+                or m.max_error_ratio != self.text_max_error_ratio):
+            m = self._text_matcher = TextMatcher(self.target_texts, self.text_max_error_ratio)
+        return m
+
+    def _check_match(self, ocr_text: str) -> bool:
+        with self.metrics.timer("match"):
+            self.last_text_hit = self._get_text_matcher().match(ocr_text)
+        return self.last_text_hit is not None
+
+    def _match_status(self) -> str:
+        hit = self.last_text_hit
+        if hit is None:
+            return f"MATCH! (#{self.attempt_count})"
+        return f'MATCH! "{hit.target}" {hit.kind} (#{self.attempt_count})'
+
+    def _notify(self, callback, *args):
+        if callback:
+            callback(*args)
+
+    def _halt(self, status: str):
+        self._notify(self.on_status_update, status)
+        self.running = False
+        self.wake()
+        self._notify(self.on_stopped)
+
+    def wake(self):
+        """Wake every wait on `wakeup` so it re-checks `running`."""
+        with self.wakeup:
+            self.wakeup.notify_all()
+
+    def _interruptible_sleep(self, seconds: float) -> bool:
+        """Wait `seconds`; False if stopped meanwhile."""
+        return self._wait_until(time.monotonic() + seconds)
+
+    def _wait_until(self, deadline: float) -> bool:
+        with self.wakeup:
+            while self.running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self.wakeup.wait(remaining)
+        return False
+
+    def _observe_activity(self, changed: bool):
+        before = self.scan_rate.interval
+        if self.scan_rate.observe(changed) != before:
+            self._notify(self.on_rate_update, self.scan_rate.interval)
+
+    def _await_change(self, limit: float) -> bool:
+        """Adaptive wait: poll the region at the adaptive interval until it
+        changes or `limit` seconds have passed. False if stopped meanwhile."""
+        deadline = time.monotonic() + limit
+        while True:
+            if not self._wait_until(min(time.monotonic() + self.scan_rate.interval, deadline)):
+                return False
+            if time.monotonic() >= deadline:
+                self.frames.invalidate()
+                return True
+            try:
+                frame = self.frames.fresh(self.result_region)
+            except FrameSourceExhausted:
+                return True  # the next capture in _run reports it
+            changed = self.activity.changed(frame.pixels)
+            self._observe_activity(changed)
+            if changed:
+                return True
+
+    def _retry_pause(self) -> bool:
+        if not self.adaptive:
+            return self._interruptible_sleep(self.retry_interval)
+        # nothing new to find on a static screen: retry on change, or at the slowest rate
+        return self._await_change(self.scan_rate.ceiling)
+
+    def run(self):
+        try:
+            self._run()
+        finally:
+            self.ocr_cache.save()
+
+    def _run(self):
+        self.running = True
+        self.attempt_count = 0
+        self.ocr_skip_count = 0
+        self.frames.invalidate()
+        self.change_detector.reset()
+        self.activity.reset()
+        self.scan_rate.reset()
+        self.region_tracker.reset()
+        self._notify(self.on_rate_update, self.scan_rate.interval if self.adaptive else None)
+
+        if self.pipelined:
+            self.pipeline = StagedRunner(self)
+            self.pipeline.run()
+            return
+
+        while self.running:
+            self.attempt_count += 1
+            self.metrics.inc("iterations")
+            self._notify(self.on_attempt_update, self.attempt_count)
+
+            # OCR check first (before clicking)
+            self._notify(self.on_status_update, f"#{self.attempt_count} OCR...")
+            try:
+                frame = self.frames.fresh(self.result_region)
+            except pyautogui.FailSafeException:
+                self._halt("EMERGENCY STOP")
+                return
+            except FrameSourceExhausted:
+                self._halt("frame source exhausted")
+                return
+
+            changed = self.change_detector.changed(frame.pixels)
+            if self.adaptive:
+                self._observe_activity(changed)
+            if changed:
+                ocr_start = time.perf_counter()
+                ocr_text = self._ocr_image(frame.pixels)
+                ocr_seconds = time.perf_counter() - ocr_start
+                self.metrics.observe("scan", ocr_seconds)
+                ocr_ms = ocr_seconds * 1000
+                self.last_ocr_text = ocr_text
+                self._last_match_verdict = self._check_match(ocr_text)
+                self._notify(self.on_ocr_update, ocr_text)
+                self._notify(self.on_status_update,
+                             f"#{self.attempt_count} OCR {ocr_ms:.0f}ms ({self.ocr_engine.name})")
+            else:
+                # region unchanged: previous text and verdict still hold
+                self.ocr_skip_count += 1
+                self.metrics.inc("ocr_skipped")
+                self._notify(self.on_status_update,
+                             f"#{self.attempt_count} unchanged, OCR skipped ({self.ocr_skip_count})")
+
+            if self._last_match_verdict:
+                self.metrics.inc("matches")
+                self._notify(self.on_status_update, self._match_status())
+                with self._click_lock:
+                    self.running = False
+                self._notify(self.on_match_found)
+                return
+
+            # No match → find image and click
+            found = False
+            for retry in range(self.image_retry_max):
+                if not self.running:
+                    self._notify(self.on_status_update, "stopped")
+                    return
+                self._notify(self.on_status_update,
+                             f"#{self.attempt_count} searching... ({retry + 1}/{self.image_retry_max})")
+                try:
+                    # first try reuses the OCR frame; later retries need a fresher one
+                    frame = self.frames.current(self.result_region)
+                    if self.adaptive:
+                        # baseline for the wait below: the screen as it was before acting
+                        self.activity.changed(frame.pixels)
+                    found = self._find_and_click(frame.pixels)
+                except pyautogui.FailSafeException:
+                    self._halt("EMERGENCY STOP")
+                    return
+                except FrameSourceExhausted:
+                    self._halt("frame source exhausted")
+                    return
+                if found:
+                    self.frames.invalidate()
+                    break
+                self.frames.invalidate()
+                if retry + 1 < self.image_retry_max:
+                    self.metrics.inc("retries")
+                if not self._retry_pause():
+                    self._notify(self.on_status_update, "stopped")
+                    return
+
+            if not found:
+                self._halt(f"#{self.attempt_count} image not found after {self.image_retry_max} retries. stopping.")
+                return
+
+            status = f"#{self.attempt_count} clicked. waiting..."
+            if len(self.needles) > 1:
+                status = f'#{self.attempt_count} clicked "{self.needles.last_needle.name}". waiting...'
+            if self.matcher.tracking:
+                status += f" (near-hit {self.matcher.track_hit_rate:.0%})"
+            self._notify(self.on_status_update, status)
+
+            # after a click the delay is a minimum, also in adaptive mode
+            if not self._interruptible_sleep(self.click_delay):
+                self._notify(self.on_status_update, "stopped")
+                return
+
+        self._notify(self.on_status_update, "stopped")
+
+    def stop(self):
+        with self._click_lock:
+            self.running = False
+        self.wake()
+        if self.pipeline is not None:
+            self.pipeline.interrupt()
+
+    def close(self):
+        """Release worker processes and engines; the controller can still run again."""
+        if self._strips is not None:
+            self._strips.close()
+            self._strips = None
+        self.tiers.close()
+        with self._engine_lock:
+            if self._ocr_engine is not None:
+                self._ocr_engine.close()
+                self._ocr_engine = None
+
+    def stats(self) -> dict:
+        out = {
+            "attempts": self.attempt_count,
+            "captures": self.frames.capture_count,
+            "ocr_skipped": self.ocr_skip_count,
+            "ocr": self._ocr_engine.stats.summary() if self._ocr_engine else None,
+            "ocr_cache": self.ocr_cache.stats(),
+        }
+        if self.tiered:
+            out["ocr_tiers"] = self.tiers.stats()
+        if self._strips is not None:
+            out["ocr_strips"] = self._strips.stats()
+        if self.matcher is not None:
+            out["image_search"] = {
+                "needles": [n.name for n in self.needles],
+                "last_needle": self.needles.last_needle.name if self.needles.last_needle else None,
+                "track_hits": self.matcher.track_hits,
+                "track_misses": self.matcher.track_misses,
+                "full_searches": self.matcher.full_searches,
+            }
+        if self.pipeline is not None:
+            out["pipeline"] = self.pipeline.stats()
+        pool = getattr(self.frame_source, "pool", None)
+        if pool is not None:
+            out["frame_pool"] = pool.stats()
+        if self.metrics.enabled:
+            out["metrics"] = self.metrics.snapshot()
+        return out
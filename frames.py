@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import random
+import time
+import zipfile
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from capture import BufferPool, RawFrame, get_backend
+from lazy import available, lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageChops = lazy_import("PIL.ImageChops")
+ImageDraw = lazy_import("PIL.ImageDraw")
+np = lazy_import("numpy", optional=True)
+
+Region = Tuple[int, int, int, int]
+SESSION_VERSION = 1
+DIFF_ROWS = 64  # rows per block when comparing array frames
+
+
+def is_array(image) -> bool:
+    return available(np) and isinstance(image, np.ndarray)
+
+
+class Frame:
+    """One capture: a PIL image, or a RawFrame (in a pooled buffer on x11).
+
+    Scan stages read `pixels`, which for a raw frame is a BGRX array view of
+    the buffer (no copy); `image` converts to PIL on first use, for recording
+    and previews.
+    """
+
+    def __init__(self, capture, region: Region, seq: int):
+        if isinstance(capture, RawFrame):
+            self.raw: Optional[RawFrame] = capture
+            self._image = None
+        else:
+            self.raw = None
+            self._image = capture
+        self.region = region
+        self.seq = seq
+        self.timestamp = time.monotonic()
+
+    @property
+    def image(self) -> Image.Image:
+        if self._image is None:
+            self._image = self.raw.to_image()
+        return self._image
+
+    @property
+    def pixels(self):
+        if self.raw is not None:
+            return self.raw.array()
+        return self._image
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.timestamp
+
+
+class FramePipeline:
+    """Holds the most recent capture so OCR and image search share one grab.
+
+    `current()` reuses the held frame; a new capture happens only through
+    `fresh()` or after `invalidate()` (e.g. after a click or a retry wait).
+    """
+
+    def __init__(self, grab: Callable[[Region], object]):
+        self._grab = grab
+        self._frame: Optional[Frame] = None
+        self._seq = 0
+        self.capture_count = 0
+
+    def fresh(self, region: Region) -> Frame:
+        image = self._grab(region)
+        self._seq += 1
+        self.capture_count += 1
+        self._frame = Frame(image, region, self._seq)
+        return self._frame
+
+    def current(self, region: Region) -> Frame:
+        if self._frame is None or self._frame.region != region:
+            return self.fresh(region)
+        return self._frame
+
+    def invalidate(self):
+        self._frame = None
+
+
+class ChangeDetector:
+    """Decides whether a frame differs from the previous one.
+
+    An exact digest catches the common identical-pixels case cheaply. With a
+    non-zero `tolerance` the frame counts as unchanged when no channel of
+    any pixel moved more than `tolerance` levels (0-255), which absorbs
+    capture noise. The comparison is a full-resolution maximum, not an
+    average, so a short word appearing in a large region is never smoothed
+    away below the tolerance.
+    """
+
+    def __init__(self, tolerance: float = 0.0):
+        self.tolerance = tolerance
+        self._digest: Optional[bytes] = None
+        self._reference = None
+
+    def _max_diff_array(self, arr) -> int:
+        # the last changed frame, copied: a pooled capture buffer is reused.
+        # Row blocks keep the temporaries small on 4K frames.
+        reference = self._reference
+        worst = 0
+        for top in range(0, arr.shape[0], DIFF_ROWS):
+            a = arr[top:top + DIFF_ROWS, :, :3]
+            b = reference[top:top + DIFF_ROWS, :, :3]
+            worst = max(worst, int((np.maximum(a, b) - np.minimum(a, b)).max()))
+        return worst
+
+    def _keep(self, image):
+        if not is_array(image):
+            self._reference = image
+        elif is_array(self._reference) and self._reference.shape == image.shape:
+            np.copyto(self._reference, image)
+        else:
+            self._reference = image.copy()
+
+    def changed(self, image) -> bool:
+        if is_array(image):
+            # C-contiguous views hash straight from the capture buffer
+            data = image if image.flags.c_contiguous else np.ascontiguousarray(image)
+        else:
+            data = image.tobytes()
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if digest == self._digest:
+            return False
+        self._digest = digest
+
+        if self.tolerance <= 0:
+            self._reference = None
+            return True
+
+        # compare against the last frame reported as changed, not the previous
+        # one, so slow drift below the tolerance still adds up to a change
+        previous = self._reference
+        if is_array(image):
+            if not is_array(previous) or previous.shape != image.shape:
+                self._keep(image)
+                return True
+            max_diff = self._max_diff_array(image)
+        else:
+            if (previous is None or is_array(previous) or previous.size != image.size
+                    or previous.mode != image.mode):
+                self._keep(image)
+                return True
+            extrema = ImageChops.difference(previous, image).getextrema()
+            # one (min, max) pair per band; a single pair for one-band images
+            max_diff = max(hi for _, hi in extrema) if isinstance(extrema[0], tuple) else extrema[1]
+        if max_diff > self.tolerance:
+            self._keep(image)
+            return True
+        return False
+
+    def reset(self):
+        self._digest = None
+        self._reference = None
+
+
+class AdaptiveRate:
+    """Polling interval driven by screen activity.
+
+    Every static observation multiplies the interval by `backoff` up to
+    `ceiling`; any change drops it straight back to `floor`.
+    """
+
+    def __init__(self, floor: float = 0.1, ceiling: float = 2.0, backoff: float = 2.0):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.backoff = backoff
+        self.interval = floor
+
+    @property
+    def rate(self) -> float:
+        return 1.0 / self.interval if self.interval > 0 else float("inf")
+
+    def observe(self, changed: bool) -> float:
+        if changed:
+            self.interval = self.floor
+        else:
+            self.interval = min(self.ceiling, self.interval * self.backoff)
+        return self.interval
+
+    def reset(self):
+        self.interval = self.floor
+
+
+class FrameSourceExhausted(Exception):
+    """A recorded session has no more frames."""
+
+
+class FrameSource:
+    name = "base"
+
+    def grab(self, region: Region) -> Image.Image:
+        raise NotImplementedError
+
+    def grab_frame(self, region: Region):
+        """What FramePipeline captures: a PIL image, or a RawFrame where the
+        source can hand out its capture buffer without converting it."""
+        return self.grab(region)
+
+    def close(self):
+        pass
+
+
+class LiveFrameSource(FrameSource):
+    name = "live"
+
+    def __init__(self, backend: str = "auto", pool: Optional[BufferPool] = None):
+        self.backend = backend
+        # BGRX frames are only useful downstream as numpy views
+        self.pool = pool if np is not None else None
+
+    def grab(self, region: Region) -> Image.Image:
+        x, y, w, h = region
+        return get_backend(self.backend).grab(x, y, w, h)
+
+    def grab_frame(self, region: Region):
+        backend = get_backend(self.backend)
+        if self.pool is None or not backend.raw_bgrx:
+            return self.grab(region)
+        x, y, w, h = region
+        return backend.grab_raw_into(x, y, w, h, self.pool)
+
+
+class RecordingFrameSource(FrameSource):
+    """Passes frames through from `inner` and stores them in a session file.
+
+    The session is a zip of PNG frames plus `session.json` with the capture
+    offset (seconds from start) and region of each frame.
+    """
+
+    name = "recording"
+
+    def __init__(self, inner: FrameSource, path: str):
+        self.inner = inner
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_STORED)
+        self._entries = []
+        self._start = time.monotonic()
+
+    def grab(self, region: Region) -> Image.Image:
+        image = self.inner.grab(region)
+        name = f"frames/{len(self._entries):06d}.png"
+        buf = io.BytesIO()
+        image.save(buf, "PNG")
+        self._zip.writestr(name, buf.getvalue())
+        self._entries.append({
+            "t": round(time.monotonic() - self._start, 4),
+            "region": list(region),
+            "file": name,
+        })
+        return image
+
+    def close(self):
+        if self._zip is None:
+            return
+        manifest = {"version": SESSION_VERSION, "frames": self._entries}
+        self._zip.writestr("session.json", json.dumps(manifest))
+        self._zip.close()
+        self._zip = None
+        self.inner.close()
+
+
+class RecordedFrameSource(FrameSource):
+    """Replays a session file frame by frame, as fast as it is asked for.
+
+    A request for a sub-region of the recorded region is cropped out of the
+    recorded frame; any other region gets the frame as recorded.
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str, loop: bool = False):
+        self._zip = zipfile.ZipFile(path, "r")
+        manifest = json.loads(self._zip.read("session.json"))
+        if manifest.get("version") != SESSION_VERSION:
+            raise ValueError(f"unsupported session version: {manifest.get('version')}")
+        self._entries = manifest["frames"]
+        self.loop = loop
+        self.position = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def grab(self, region: Region) -> Image.Image:
+        if self.position >= len(self._entries):
+            if not self.loop or not self._entries:
+                raise FrameSourceExhausted(f"session ended after {self.position} frames")
+            self.position = 0
+        entry = self._entries[self.position]
+        self.position += 1
+        with self._zip.open(entry["file"]) as f:
+            image = Image.open(f)
+            image.load()
+        return crop_region(image, tuple(entry["region"]), region)
+
+    def close(self):
+        self._zip.close()
+
+
+def crop_region(image: Image.Image, image_region: Region, region: Region) -> Image.Image:
+    """Cut `region` (logical coords) out of an image captured for `image_region`."""
+    if region == image_region:
+        return image
+    ix, iy, iw, ih = image_region
+    x, y, w, h = region
+    if x < ix or y < iy or x + w > ix + iw or y + h > iy + ih:
+        return image
+    scale = image.size[0] / iw
+    box = (round((x - ix) * scale), round((y - iy) * scale),
+           round((x - ix + w) * scale), round((y - iy + h) * scale))
+    return image.crop(box)
+
+
+class SyntheticFrameSource(FrameSource):
+    """Generated screen: the needle somewhere in the region, target text later.
+
+    Frame `n` shows `target_text` once n >= `match_after` (never if None);
+    `jitter` moves the needle by up to that many pixels between frames.
+    """
+
+    name = "synthetic"
+
+    def __init__(self, needle: Image.Image, target_text: str = "",
+                 match_after: Optional[int] = None, scale: float = 1.0,
+                 jitter: int = 0, noise_lines: Sequence[str] = ("loading...",),
+                 seed: int = 0):
+        self.needle = needle
+        self.target_text = target_text
+        self.match_after = match_after
+        self.scale = scale
+        self.jitter = jitter
+        self.noise_lines = list(noise_lines)
+
+        self.frame_count = 0
+        self._rng = random.Random(seed)
+
+    def grab(self, region: Region) -> Image.Image:
+        _, _, w, h = region
+        size = (max(1, round(w * self.scale)), max(1, round(h * self.scale)))
+        image = Image.new("RGB", size, (235, 235, 235))
+        draw = ImageDraw.Draw(image)
+        lines: List[str] = list(self.noise_lines)
+        if self.match_after is not None and self.frame_count >= self.match_after:
+            lines.append(self.target_text)
+        for i, line in enumerate(lines):
+            draw.text((8, 8 + i * 20), line, fill=(10, 10, 10))
+
+        nw, nh = self.needle.size
+        px = max(0, (size[0] - nw) // 2 + self._rng.randint(-self.jitter, self.jitter))
+        py = max(0, size[1] - nh - 8 + self._rng.randint(-self.jitter, 0))
+        image.paste(self.needle, (max(0, min(px, size[0] - nw)), py))
+        self.frame_count += 1
+        return image
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from lazy import lazy_import
+
+pyautogui = lazy_import("pyautogui")
+
+
+class InputSink:
+    name = "base"
+
+    def click(self, x: float, y: float):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PyAutoGuiSink(InputSink):
+    name = "pyautogui"
+
+    def __init__(self, failsafe: bool = True, pause: float = 0.1):
+        self.failsafe = failsafe
+        self.pause = pause
+        self._configured = False
+
+    def click(self, x: float, y: float):
+        # pyautogui is imported here, on the first click, not at startup
+        if not self._configured:
+            pyautogui.FAILSAFE = self.failsafe
+            pyautogui.PAUSE = self.pause
+            self._configured = True
+        pyautogui.click(x, y)
+
+
+class LoggingSink(InputSink):
+    """Records clicks instead of (or before) sending them on to `forward`.
+
+    Each click is kept in `clicks` as (monotonic time, x, y) and, when `path`
+    is given, appended to it as a JSON line.
+    """
+
+    name = "log"
+
+    def __init__(self, path: Optional[str] = None, forward: Optional[InputSink] = None):
+        self.forward = forward
+        self.clicks: List[Tuple[float, float, float]] = []
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def click(self, x: float, y: float):
+        t = time.monotonic()
+        with self._lock:
+            self.clicks.append((t, x, y))
+            if self._file is not None:
+                self._file.write(json.dumps({"t": t, "x": x, "y": y}) + "\n")
+                self._file.flush()
+        if self.forward is not None:
+            self.forward.click(x, y)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self.forward is not None:
+            self.forward.close()
@@ -0,0 +1,77 @@
+import importlib
+import importlib.util
+from typing import Optional
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access.
+
+    pyautogui, OpenCV, numpy and Pillow together take a large share of
+    startup; most code paths that reference them at module level only need
+    them once a scan actually runs. Methods are underscore-prefixed so they
+    cannot shadow attributes of the wrapped module.
+    """
+
+    def __init__(self, name: str):
+        self.__dict__["_lazy_name"] = name
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_failed"] = False
+
+    def _lazy_load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            # importlib holds the import lock, so concurrent first use is safe
+            module = importlib.import_module(self.__dict__["_lazy_name"])
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._lazy_load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._lazy_load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if is_loaded(self) else "not loaded"
+        return f"<lazy module {self.__dict__['_lazy_name']!r} ({state})>"
+
+
+def lazy_import(name: str, optional: bool = False) -> Optional[LazyModule]:
+    """Proxy for `name`. With `optional`, None when the module is not installed
+    (checked without importing it). An installed module can still fail to
+    import, so fallbacks test optional modules with `available()`."""
+    if optional:
+        try:
+            if importlib.util.find_spec(name) is None:
+                return None
+        except (ImportError, ValueError):
+            return None
+    return LazyModule(name)
+
+
+def available(module) -> bool:
+    """True if an optional module is installed and imports cleanly; imports it.
+
+    Completes the `try: import / except ImportError` pattern for lazy
+    modules: find_spec also succeeds for a broken install (e.g. tesserocr
+    built against another libtesseract), which only fails on import.
+    """
+    if module is None:
+        return False
+    if not isinstance(module, LazyModule):
+        return True
+    if module.__dict__["_lazy_failed"]:
+        return False
+    try:
+        module._lazy_load()
+    except ImportError:
+        module.__dict__["_lazy_failed"] = True
+        return False
+    return True
+
+
+def is_loaded(module) -> bool:
+    if isinstance(module, LazyModule):
+        return module.__dict__["_lazy_module"] is not None
+    return module is not None
+
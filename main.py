@@ -1,11 +1,12 @@
 import tkinter as tk
-from tkinter import messagebox, simpledialog
+from tkinter import filedialog, messagebox, simpledialog
+import argparse
+import importlib.util
 import queue
 import subprocess
 import tempfile
 import threading
 import time
-import re
 import os
 import sys
 from typing import Optional, Tuple
@@ -13,12 +14,11 @@ from typing import Optional, Tuple
 IS_MAC = sys.platform == "darwin"
 IS_WIN = sys.platform == "win32"
 
-try:
-    import pyautogui
-    import pytesseract
-    from PIL import Image, ImageEnhance, ImageGrab
-except ImportError as e:
-    print(f"Required packages missing: {e}")
+# presence check only; the packages themselves are imported on first use
+_missing = [name for name in ("pyautogui", "pytesseract", "PIL")
+            if importlib.util.find_spec(name) is None]
+if _missing:
+    print(f"Required packages missing: {', '.join(_missing)}")
     print("  pip install pyautogui pytesseract Pillow opencv-python-headless")
     if IS_MAC:
         print("  brew install tesseract tesseract-lang")
@@ -26,53 +26,18 @@ except ImportError as e:
         print("  Install tesseract: https://github.com/UB-Mannheim/tesseract/wiki")
     sys.exit(1)
 
-CLICK_DELAY = 3.0
+from capture import get_backend
+from controller import (CAPTURE_BACKEND, CLICK_DELAY, CLICK_NEEDLE, MacroController, capture_region,
+                        check_tesseract, get_display_scale)
+from frames import RecordingFrameSource
+from metrics import MetricsExporter
+from profiles import ProfileError, apply_profile, load_profile, save_profile
+from textmatch import TARGET_SEPARATOR
+
 MIN_REGION_SIZE = 10
-OCR_CONFIG = "--psm 6"
 OVERLAY_ALPHA = 0.5
-MATCH_CONFIDENCE = 0.8
-IMAGE_RETRY_INTERVAL = 0.5
-IMAGE_RETRY_MAX = 10
-
-
-SCREENSHOT_TMP = os.path.join(tempfile.gettempdir(), "Cyclops_screen.png")
-REGION_TMP = os.path.join(tempfile.gettempdir(), "Cyclops_region.png")
-
-
-def take_screenshot() -> Image.Image:
-    if IS_MAC:
-        subprocess.run(
-            ["screencapture", "-x", SCREENSHOT_TMP],
-            capture_output=True, timeout=5,
-        )
-        img = Image.open(SCREENSHOT_TMP)
-        return img.copy()
-    else:
-        return ImageGrab.grab()
-
-
-def get_display_scale() -> float:
-    if IS_MAC:
-        full = take_screenshot()
-        logical_w = pyautogui.size()[0]
-        return full.size[0] / logical_w
-    else:
-        # Windows: DPI awareness를 설정하지 않으면
-        # ImageGrab, pyautogui, Tk 모두 논리 좌표를 사용하므로
-        # scale 1.0으로 통일하여 좌표 불일치를 방지
-        return 1.0
-
-
-def capture_region(x, y, w, h) -> Image.Image:
-    if IS_MAC:
-        subprocess.run(
-            ["screencapture", "-x", "-R", f"{x},{y},{w},{h}", REGION_TMP],
-            capture_output=True, timeout=5,
-        )
-        img = Image.open(REGION_TMP)
-        return img.copy()
-    else:
-        return ImageGrab.grab(bbox=(x, y, x + w, y + h))
+METRICS_REFRESH_MS = 1000
+METRICS_PANEL_STAGES = ("capture", "ocr", "locate", "click")
 
 
 def ask_text_native(prompt: str) -> Optional[str]:
@@ -219,152 +184,12 @@ class RegionSelector:
         self._done = True
 
 
-class MacroController:
-    def __init__(self, scale: float):
-        self.scale = scale
-        self.result_region: Optional[Tuple[int, int, int, int]] = None
-        self.click_image: Optional[Image.Image] = None
-        self.target_text = ""
-        self.click_delay = CLICK_DELAY
-        self.running = False
-        self.attempt_count = 0
-        self.last_ocr_text = ""
-        self.on_status_update = None
-        self.on_match_found = None
-        self.on_attempt_update = None
-        self.on_ocr_update = None
-        self.on_stopped = None
-
-    def _capture_region(self, region: Tuple[int, int, int, int]) -> Image.Image:
-        x, y, w, h = region
-        return capture_region(x, y, w, h)
-
-    def _find_and_click(self) -> bool:
-        rx, ry, rw, rh = self.result_region
-        region_img = capture_region(rx, ry, rw, rh)
-        needle = self.click_image
-        try:
-            location = pyautogui.locate(needle, region_img, confidence=MATCH_CONFIDENCE)
-        except pyautogui.ImageNotFoundException:
-            return False
-
-        if location is None:
-            return False
-
-        center = pyautogui.center(location)
-        # center is in physical pixels within the region image
-        # convert to logical screen coords: region offset + (pixel offset / scale)
-        click_x = rx + center.x / self.scale
-        click_y = ry + center.y / self.scale
-        pyautogui.click(click_x, click_y)
-        return True
-
-    def _ocr_image(self, image: Image.Image) -> str:
-        gray = image.convert("L")
-        enhancer = ImageEnhance.Contrast(gray)
-        gray = enhancer.enhance(2.0)
-
-        w, h = gray.size
-        if w < 300 or h < 50:
-            gray = gray.resize((w * 2, h * 2), Image.LANCZOS)
-
-        gray = gray.point(lambda x: 0 if x < 128 else 255, "1")
-
-        text = pytesseract.image_to_string(
-            gray, lang="kor+eng", config=OCR_CONFIG
-        )
-        return text.strip()
-
-    def _check_match(self, ocr_text: str) -> bool:
-        normalized_ocr = re.sub(r"\s+", " ", ocr_text).strip().lower()
-        normalized_target = re.sub(r"\s+", " ", self.target_text).strip().lower()
-        return normalized_target in normalized_ocr
-
-    def _notify(self, callback, *args):
-        if callback:
-            callback(*args)
-
-    def _interruptible_sleep(self, seconds: float) -> bool:
-        for _ in range(int(seconds * 10)):
-            if not self.running:
-                return False
-            time.sleep(0.1)
-        return True
-
-    def run(self):
-        self.running = True
-        self.attempt_count = 0
-
-        while self.running:
-            self.attempt_count += 1
-            self._notify(self.on_attempt_update, self.attempt_count)
-
-            # OCR check first (before clicking)
-            self._notify(self.on_status_update, f"#{self.attempt_count} OCR...")
-            try:
-                image = self._capture_region(self.result_region)
-            except pyautogui.FailSafeException:
-                self._notify(self.on_status_update, "EMERGENCY STOP")
-                self.running = False
-                self._notify(self.on_stopped)
-                return
-
-            ocr_text = self._ocr_image(image)
-            self.last_ocr_text = ocr_text
-            self._notify(self.on_ocr_update, ocr_text)
-
-            if self._check_match(ocr_text):
-                self._notify(self.on_status_update, f"MATCH! (#{self.attempt_count})")
-                self.running = False
-                self._notify(self.on_match_found)
-                return
-
-            # No match → find image and click
-            found = False
-            for retry in range(IMAGE_RETRY_MAX):
-                if not self.running:
-                    self._notify(self.on_status_update, "stopped")
-                    return
-                self._notify(self.on_status_update,
-                             f"#{self.attempt_count} searching... ({retry + 1}/{IMAGE_RETRY_MAX})")
-                try:
-                    found = self._find_and_click()
-                except pyautogui.FailSafeException:
-                    self._notify(self.on_status_update, "EMERGENCY STOP")
-                    self.running = False
-                    self._notify(self.on_stopped)
-                    return
-                if found:
-                    break
-                if not self._interruptible_sleep(IMAGE_RETRY_INTERVAL):
-                    self._notify(self.on_status_update, "stopped")
-                    return
-
-            if not found:
-                self._notify(self.on_status_update,
-                             f"#{self.attempt_count} image not found after {IMAGE_RETRY_MAX} retries. stopping.")
-                self.running = False
-                self._notify(self.on_stopped)
-                return
-
-            self._notify(self.on_status_update, f"#{self.attempt_count} clicked. waiting...")
-
-            if not self._interruptible_sleep(self.click_delay):
-                self._notify(self.on_status_update, "stopped")
-                return
-
-        self._notify(self.on_status_update, "stopped")
-
-    def stop(self):
-        self.running = False
-
-
 class MacroApp:
     def __init__(self, scale: float):
         self.scale = scale
         self.root = tk.Tk()
         self.root.title("Cyclops - OCR Macro")
-        self.root.geometry("600x580" if IS_WIN else "500x480")
+        self.root.geometry("600x640" if IS_WIN else "500x530")
         self.root.resizable(False, False)
 
         self.controller = MacroController(scale)
@@ -379,6 +204,8 @@ class MacroApp:
         self.lbl_status = None
         self.lbl_attempts = None
         self.lbl_last_ocr = None
+        self.lbl_rate = None
+        self.lbl_metrics = None
 
         self._result_region_img = None
         self.msg_queue = queue.Queue()
@@ -386,6 +213,7 @@ class MacroApp:
         self._build_gui()
         self._setup_callbacks()
         self._poll_queue()
+        self._refresh_metrics()
         self.root.bind("<Escape>", lambda e: self._on_stop())
 
     def _set_label(self, widget, text):
@@ -450,7 +278,16 @@ class MacroApp:
             command=self._preview_click_image, width=8,
             state=tk.DISABLED,
         )
-        self.btn_preview.pack(side=tk.LEFT, padx=(0, 10))
+        self.btn_preview.pack(side=tk.LEFT, padx=(0, 5))
+        self.btn_add_needle = tk.Button(
+            row2, text="+", command=self._on_add_needle, width=2,
+        )
+        self.btn_add_needle.pack(side=tk.LEFT)
+        self.btn_remove_needle = tk.Button(
+            row2, text="-", command=self._on_remove_needle, width=2,
+            state=tk.DISABLED,
+        )
+        self.btn_remove_needle.pack(side=tk.LEFT, padx=(0, 10))
         self.lbl_click_image = self._make_info_btn(row2, "--")
         self.lbl_click_image.pack(side=tk.LEFT)
 
@@ -505,6 +342,11 @@ class MacroApp:
             disabledforeground="gray50",
             font=("Helvetica", 11),
         ).pack(side=tk.LEFT, padx=(10, 0))
+        self.btn_adaptive = tk.Button(
+            row4, text=self._adaptive_text(), command=self._on_toggle_adaptive,
+            width=12,
+        )
+        self.btn_adaptive.pack(side=tk.RIGHT, padx=5)
 
         # Buttons
         tk.Frame(self.root, height=1, bg="gray70").pack(fill=tk.X, padx=10, pady=8)
@@ -522,6 +364,14 @@ class MacroApp:
             state=tk.DISABLED,
         )
         self.btn_stop.pack(side=tk.LEFT, padx=5)
+        self.btn_load = tk.Button(
+            frame_btn, text="Load", command=self._on_load_profile, width=5,
+        )
+        self.btn_load.pack(side=tk.RIGHT, padx=(0, 5))
+        self.btn_save = tk.Button(
+            frame_btn, text="Save", command=self._on_save_profile, width=5,
+        )
+        self.btn_save.pack(side=tk.RIGHT)
 
         # Status
         tk.Frame(self.root, height=1, bg="gray70").pack(fill=tk.X, padx=10, pady=8)
@@ -532,6 +382,8 @@ class MacroApp:
         for heading, attr_name, init_text in [
             ("Status:", "lbl_status", "Ready"),
             ("Attempts:", "lbl_attempts", "0"),
+            ("Scan rate:", "lbl_rate", "--"),
+            ("Stages:", "lbl_metrics", "--"),
             ("Last OCR:", "lbl_last_ocr", ""),
         ]:
             row = tk.Frame(status_frame)
@@ -562,6 +414,25 @@ class MacroApp:
             pass
         self.root.after(50, self._poll_queue)
 
+    def _metrics_text(self) -> str:
+        snap = self.controller.metrics.snapshot()
+        stages = snap["stages"]
+        parts = [f"{name[:3]} {stages[name]['mean_ms']:.0f}"
+                 for name in METRICS_PANEL_STAGES if name in stages]
+        if not parts:
+            return "--"
+        counters = snap["counters"]
+        return (" | ".join(parts) + " ms"
+                f"  miss {counters.get('misses', 0)} retry {counters.get('retries', 0)}")
+
+    def _refresh_metrics(self):
+        """Pull a metrics snapshot once a second (the panel is not event-driven)."""
+        if self.controller.metrics.enabled:
+            self._set_label(self.lbl_metrics, self._metrics_text())
+            self.root.after(METRICS_REFRESH_MS, self._refresh_metrics)
+        else:
+            self._set_label(self.lbl_metrics, "off")
+
     def _enqueue(self, func, *args):
         """Worker thread puts GUI updates in the queue (thread-safe)."""
         self.msg_queue.put((func, args))
@@ -576,6 +447,9 @@ class MacroApp:
         self.controller.on_ocr_update = lambda txt: self._enqueue(
             self._set_label, self.lbl_last_ocr, txt[:200] if txt else ""
         )
+        self.controller.on_rate_update = lambda interval: self._enqueue(
+            self._set_label, self.lbl_rate, self._rate_text(interval)
+        )
         self.controller.on_match_found = lambda: self._enqueue(
             self._on_match_found
         )
@@ -587,6 +461,8 @@ class MacroApp:
         region = self.selector.select(restore_window=False)
         if region:
             self.controller.result_region = region
+            if self.controller.matcher is not None:
+                self.controller.matcher.reset_tracking()
             x, y, w, h = region
             self._set_label(self.lbl_result_region, f"[OK] ({x},{y}) {w}x{h}")
             self._result_region_img = capture_region(x, y, w, h)
@@ -609,13 +485,44 @@ class MacroApp:
             x, y, w, h = region
             img = capture_region(x, y, w, h)
             self.controller.click_image = img
-            self._set_label(self.lbl_click_image, f"[OK] {w}x{h}")
+            self._set_label(self.lbl_click_image, self._needles_text())
             self.btn_preview.config(state=tk.NORMAL)
         else:
             self._set_label(self.lbl_click_image, "-- cancelled --")
         self.root.deiconify()
         self.root.lift()
 
+    def _extra_needles(self):
+        return [n for n in self.controller.needles if n.name != CLICK_NEEDLE]
+
+    def _needles_text(self) -> str:
+        main_img = self.controller.click_image
+        text = f"[OK] {main_img.size[0]}x{main_img.size[1]}" if main_img is not None else "--"
+        extra = len(self._extra_needles())
+        if extra:
+            text += f" +{extra} more"
+        return text
+
+    def _on_add_needle(self):
+        """Capture another click target; it is tried after the ones added before it."""
+        region = self.selector.select(restore_window=False)
+        if region:
+            x, y, w, h = region
+            extras = self._extra_needles()
+            self.controller.add_needle(f"image {len(extras) + 2}", capture_region(x, y, w, h))
+            self._set_label(self.lbl_click_image, self._needles_text())
+            self.btn_remove_needle.config(state=tk.NORMAL)
+        self.root.deiconify()
+        self.root.lift()
+
+    def _on_remove_needle(self):
+        extras = self._extra_needles()
+        if extras:
+            self.controller.needles.remove(extras[-1].name)
+        self._set_label(self.lbl_click_image, self._needles_text())
+        if len(extras) <= 1:
+            self.btn_remove_needle.config(state=tk.DISABLED)
+
     def _preview_click_image(self):
         img = self.controller.click_image
         if img is None:
@@ -625,13 +532,57 @@ class MacroApp:
         open_file(preview_path)
 
     def _on_set_target_text(self):
-        text = ask_text_native("Enter text to match:")
+        text = ask_text_native(f"Enter text to match ('{TARGET_SEPARATOR}' between several, 're:' for a regex):")
         if text and text.strip():
-            self.controller.target_text = text.strip()
-            display = text.strip()
-            if len(display) > 20:
-                display = display[:20] + "..."
-            self._set_label(self.lbl_target_text, f'[OK] "{display}"')
+            try:
+                self.controller.target_text = text
+            except ValueError as e:
+                messagebox.showwarning("Match text", str(e))
+                return
+            self._set_label(self.lbl_target_text, self._target_text_label())
+
+    def _target_text_label(self) -> str:
+        display = self.controller.target_text
+        if len(self.controller.target_texts) > 1:
+            display = f"{len(self.controller.target_texts)}: {display}"
+        if len(display) > 20:
+            display = display[:20] + "..."
+        return f'[OK] "{display}"'
+
+    def _on_save_profile(self):
+        directory = filedialog.askdirectory(title="Save profile to folder", mustexist=False)
+        if not directory:
+            return
+        try:
+            save_profile(self.controller, directory)
+        except (ProfileError, OSError) as e:
+            messagebox.showwarning("Save profile", str(e))
+            return
+        self._set_label(self.lbl_status, f"Saved {os.path.basename(directory)}")
+
+    def _on_load_profile(self):
+        directory = filedialog.askdirectory(title="Load profile folder", mustexist=True)
+        if directory:
+            self.load_profile(directory)
+
+    def load_profile(self, path: str) -> bool:
+        try:
+            apply_profile(self.controller, load_profile(path))
+        except ProfileError as e:
+            messagebox.showwarning("Load profile", str(e))
+            return False
+        x, y, w, h = self.controller.result_region
+        self._set_label(self.lbl_result_region, f"[OK] ({x},{y}) {w}x{h}")
+        self._result_region_img = None
+        self.btn_preview_region.config(state=tk.DISABLED)
+        self._set_label(self.lbl_click_image, self._needles_text())
+        self.btn_preview.config(state=tk.NORMAL if self.controller.click_image is not None else tk.DISABLED)
+        self.btn_remove_needle.config(state=tk.NORMAL if self._extra_needles() else tk.DISABLED)
+        self._set_label(self.lbl_target_text, self._target_text_label())
+        self._set_label(self.lbl_delay, f"{self.controller.click_delay:.1f}s")
+        self.btn_adaptive.config(text=self._adaptive_text())
+        self._set_label(self.lbl_status, f"Loaded {os.path.basename(os.path.normpath(path))}")
+        return True
 
     def _on_delay_up(self):
         new_val = min(self.controller.click_delay + 0.5, 10.0)
@@ -643,11 +594,23 @@ class MacroApp:
         self.controller.click_delay = new_val
         self._set_label(self.lbl_delay, f"{new_val:.1f}s")
 
+    def _adaptive_text(self) -> str:
+        return f"Adaptive: {'ON' if self.controller.adaptive else 'off'}"
+
+    def _rate_text(self, interval: Optional[float]) -> str:
+        if interval is None:
+            return f"fixed ({self.controller.click_delay:.1f}s delay)"
+        return f"{1.0 / interval:.1f}/s (every {interval * 1000:.0f}ms)"
+
+    def _on_toggle_adaptive(self):
+        self.controller.adaptive = not self.controller.adaptive
+        self.btn_adaptive.config(text=self._adaptive_text())
+
     def _on_start(self):
         if not self.controller.result_region:
             messagebox.showwarning("Warning", "Set the result region first.")
             return
-        if self.controller.click_image is None:
+        if self.controller.matcher is None:
             messagebox.showwarning("Warning", "Capture the click target image first.")
             return
         if not self.controller.target_text:
@@ -665,9 +628,14 @@ class MacroApp:
         self.btn_preview_region.config(state=tk.DISABLED)
         self.btn_click_image.config(state=tk.DISABLED)
         self.btn_preview.config(state=tk.DISABLED)
+        self.btn_add_needle.config(state=tk.DISABLED)
+        self.btn_remove_needle.config(state=tk.DISABLED)
         self.btn_set_text.config(state=tk.DISABLED)
         self.btn_delay_up.config(state=tk.DISABLED)
         self.btn_delay_down.config(state=tk.DISABLED)
+        self.btn_adaptive.config(state=tk.DISABLED)
+        self.btn_save.config(state=tk.DISABLED)
+        self.btn_load.config(state=tk.DISABLED)
 
         self.macro_thread = threading.Thread(
             target=self.controller.run, daemon=True
@@ -680,9 +648,10 @@ class MacroApp:
 
     def _on_match_found(self):
         self._reset_buttons()
+        hit = self.controller.last_text_hit
         messagebox.showinfo(
             "Match Found",
-            f"Found '{self.controller.target_text}'!\n"
+            f"Found '{hit.target if hit else self.controller.target_text}'!\n"
             f"Total {self.controller.attempt_count} attempts",
         )
 
@@ -695,18 +664,32 @@ class MacroApp:
         self.btn_click_image.config(state=tk.NORMAL)
         if self.controller.click_image is not None:
             self.btn_preview.config(state=tk.NORMAL)
+        self.btn_add_needle.config(state=tk.NORMAL)
+        if self._extra_needles():
+            self.btn_remove_needle.config(state=tk.NORMAL)
         self.btn_set_text.config(state=tk.NORMAL)
         self.btn_delay_up.config(state=tk.NORMAL)
         self.btn_delay_down.config(state=tk.NORMAL)
+        self.btn_adaptive.config(state=tk.NORMAL)
+        self.btn_save.config(state=tk.NORMAL)
+        self.btn_load.config(state=tk.NORMAL)
 
     def run(self):
         self.root.mainloop()
 
 
 if __name__ == "__main__":
-    try:
-        pytesseract.get_tesseract_version()
-    except pytesseract.TesseractNotFoundError:
+    parser = argparse.ArgumentParser(description="Cyclops - OCR Macro")
+    parser.add_argument("--record", metavar="SESSION",
+                        help="save every captured frame to a session file for offline replay")
+    parser.add_argument("--profile", metavar="DIR", help="load a saved profile at startup")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write stage latencies and counters to FILE periodically")
+    parser.add_argument("--metrics-format", choices=MetricsExporter.FORMATS, default="jsonl")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, metavar="S")
+    args = parser.parse_args()
+
+    if not check_tesseract():
         print("tesseract not installed.")
         if IS_MAC:
             print("Run: brew install tesseract tesseract-lang")
@@ -714,12 +697,43 @@ if __name__ == "__main__":
             print("Download: https://github.com/UB-Mannheim/tesseract/wiki")
         sys.exit(1)
 
-    pyautogui.FAILSAFE = True
-    pyautogui.PAUSE = 0.1
-
     print("Detecting display scale...")
     scale = get_display_scale()
     print(f"Scale factor: {scale}x")
+    print(f"Capture backend: {get_backend(CAPTURE_BACKEND).name}")
 
     app = MacroApp(scale)
-    app.run()
+    if args.profile:
+        app.load_profile(args.profile)
+    # load tesseract / OpenCV while the user sets things up
+    threading.Thread(target=app.controller.warm_up, name="cyclops-warm-up", daemon=True).start()
+    if args.record:
+        app.controller.frame_source = RecordingFrameSource(app.controller.frame_source, args.record)
+        print(f"Recording frames to {args.record}")
+    exporter = None
+    if args.metrics:
+        exporter = MetricsExporter(app.controller.metrics, args.metrics,
+                                   args.metrics_interval, args.metrics_format)
+        exporter.start()
+    try:
+        app.run()
+    finally:
+        app.controller.frame_source.close()
+        if exporter is not None:
+            exporter.stop()
+    print(f"OCR backend: {app.controller.ocr_engine.name}, latency: {app.controller.ocr_engine.stats}")
+    print(f"OCR skipped (unchanged region): {app.controller.ocr_skip_count}")
+    print(f"OCR cache: {app.controller.ocr_cache.stats()}")
+    if app.controller.tiered:
+        print(f"OCR tiers: {app.controller.tiers.stats()}")
+    tracker = app.controller.region_tracker
+    if tracker.regions_total:
+        print(f"OCR regions: {tracker.regions_ocred}/{tracker.regions_total} re-OCRed "
+              f"({tracker.saved_fraction:.0%} saved), "
+              f"pixels sent to OCR {tracker.pixels_saved_fraction:.0%} fewer")
+    matcher = app.controller.matcher
+    if matcher is not None:
+        print(f"Image search ({len(matcher)} needles): "
+              f"near-last-hit {matcher.track_hits}/{matcher.track_hits + matcher.track_misses}, "
+              f"full scans {matcher.full_searches}")
+    app.controller.close()
@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+from typing import List, Optional, Tuple
+
+from lazy import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+MATCH_CONFIDENCE = 0.8
+MAX_PYRAMID_LEVELS = 3
+MIN_NEEDLE_SIDE = 12         # stop downsampling before the needle loses its features
+COARSE_MARGIN = 0.2          # coarse levels score lower than full resolution
+COARSE_CANDIDATES = 3
+COARSE_FLOOR = 0.4           # below confidence: a coarse best this low is a miss outright
+DIRECT_MATCH_AREA = 320 * 240  # below this a single full-res pass is cheaper
+TRACK_MARGIN = 32            # px searched around the last hit before a full scan
+
+
+class Match:
+    def __init__(self, left: int, top: int, width: int, height: int, score: float):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.score = score
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        # same rounding as pyautogui.center()
+        return self.left + self.width // 2, self.top + self.height // 2
+
+    def __repr__(self):
+        return (f"Match(left={self.left}, top={self.top}, width={self.width}, "
+                f"height={self.height}, score={self.score:.3f})")
+
+
+def to_gray(image, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Grayscale uint8 array, converted the way pyscreeze does it (RGB -> BGR2GRAY).
+
+    pyautogui.locate() matches in grayscale: pyscreeze's GRAYSCALE_DEFAULT is
+    True from 0.1.29 on. A 3/4-channel array is taken as BGR/BGRX (a capture
+    buffer view) and converted into `out` when its shape fits.
+    """
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2:
+            return image
+        code = cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        if out is not None and out.shape == image.shape[:2]:
+            return cv2.cvtColor(image, code, dst=out)
+        return cv2.cvtColor(image, code)
+    if image.mode == "L":
+        return np.asarray(image)
+    return cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2GRAY)
+
+
+def build_pyramid(gray: np.ndarray, levels: int, min_side: int = 1) -> List[np.ndarray]:
+    pyramid = [gray]
+    while len(pyramid) < levels:
+        h, w = pyramid[-1].shape
+        if min(h, w) // 2 < min_side:
+            break
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid
+
+
+class PreparedNeedle:
+    """Needle converted once at capture time: grayscale plus pyramid levels."""
+
+    def __init__(self, image, confidence: float = MATCH_CONFIDENCE,
+                 levels: int = MAX_PYRAMID_LEVELS):
+        self.gray = to_gray(image)
+        self.height, self.width = self.gray.shape
+        self.confidence = confidence
+        self.pyramid = build_pyramid(self.gray, levels, MIN_NEEDLE_SIDE)
+
+    @classmethod
+    def from_pyramid(cls, pyramid: List[np.ndarray],
+                     confidence: float = MATCH_CONFIDENCE) -> "PreparedNeedle":
+        """Rebuild from saved levels (e.g. memory-mapped .npy files) without recomputing."""
+        needle = cls.__new__(cls)
+        needle.pyramid = list(pyramid)
+        needle.gray = needle.pyramid[0]
+        needle.height, needle.width = needle.gray.shape
+        needle.confidence = confidence
+        return needle
+
+
+class Haystack:
+    """Grayscale haystack whose pyramid levels are built on demand and kept."""
+
+    def __init__(self, image, out: Optional[np.ndarray] = None):
+        self.pyramid = [to_gray(image, out)]
+
+    @property
+    def gray(self) -> np.ndarray:
+        return self.pyramid[0]
+
+    def level(self, index: int) -> np.ndarray:
+        while len(self.pyramid) <= index:
+            self.pyramid.append(cv2.pyrDown(self.pyramid[-1]))
+        return self.pyramid[index]
+
+
+def _best_in(haystack: np.ndarray, needle: np.ndarray) -> Tuple[float, Tuple[int, int]]:
+    result = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+    _, score, _, loc = cv2.minMaxLoc(result)
+    return score, loc
+
+
+def _top_peaks(result: np.ndarray, count: int, min_score: float,
+               suppress: Tuple[int, int]) -> List[Tuple[float, int, int]]:
+    peaks = []
+    sw, sh = suppress
+    for _ in range(count):
+        _, score, _, (x, y) = cv2.minMaxLoc(result)
+        if score < min_score:
+            break
+        peaks.append((score, x, y))
+        result[max(0, y - sh):y + sh + 1, max(0, x - sw):x + sw + 1] = -1.0
+    return peaks
+
+
+class TemplateMatcher:
+    """Coarse-to-fine TM_CCOEFF_NORMED search for one prepared needle.
+
+    Matching is in grayscale, like pyautogui.locate(). The coarsest usable
+    pyramid level proposes a few candidates, each is then verified at full
+    resolution in a small window and accepted when it scores above
+    `needle.confidence`, the strict threshold pyautogui.locate(confidence=...)
+    applies. Where several overlapping positions pass, the best-scoring
+    one is returned rather than the first in raster order. When no candidate
+    verifies, one full-resolution pass decides, because the coarse level can
+    under-score a real hit; that pass is skipped when the coarse best is below
+    `confidence - COARSE_FLOOR`, so an absent needle costs one coarse scan.
+    """
+
+    def __init__(self, needle, confidence: float = MATCH_CONFIDENCE,
+                 tracking: bool = False, track_margin: int = TRACK_MARGIN):
+        if not isinstance(needle, PreparedNeedle):
+            needle = PreparedNeedle(needle, confidence)
+        self.needle = needle
+        self.tracking = tracking
+        self.track_margin = track_margin
+        self.last_hit: Optional[Match] = None
+        self.track_hits = 0
+        self.track_misses = 0
+        self.full_searches = 0
+
+    @property
+    def track_hit_rate(self) -> float:
+        tries = self.track_hits + self.track_misses
+        return self.track_hits / tries if tries else 0.0
+
+    def reset_tracking(self):
+        self.last_hit = None
+
+    def _near_last_hit(self, hay: Haystack) -> Optional[Match]:
+        n = self.needle
+        last = self.last_hit
+        hh, hw = hay.gray.shape
+        m = self.track_margin
+        x0 = max(0, last.left - m)
+        y0 = max(0, last.top - m)
+        x1 = min(hw, last.left + n.width + m)
+        y1 = min(hh, last.top + n.height + m)
+        if x1 - x0 < n.width or y1 - y0 < n.height:
+            return None
+        score, (x, y) = _best_in(hay.gray[y0:y1, x0:x1], n.gray)
+        if score <= n.confidence:
+            return None
+        return Match(x0 + x, y0 + y, n.width, n.height, score)
+
+    def _direct(self, hay: Haystack) -> Optional[Match]:
+        n = self.needle
+        score, (x, y) = _best_in(hay.gray, n.gray)
+        if score <= n.confidence:
+            return None
+        return Match(x, y, n.width, n.height, score)
+
+    def locate(self, haystack) -> Optional[Match]:
+        hay = haystack if isinstance(haystack, Haystack) else Haystack(haystack)
+        if self.tracking and self.last_hit is not None:
+            match = self._near_last_hit(hay)
+            if match is not None:
+                self.track_hits += 1
+                self.last_hit = match
+                return match
+            self.track_misses += 1
+
+        self.full_searches += 1
+        match = self._search(hay)
+        if match is not None:
+            self.last_hit = match
+        return match
+
+    def _search(self, hay: Haystack) -> Optional[Match]:
+        n = self.needle
+        hh, hw = hay.gray.shape
+        if n.width > hw or n.height > hh:
+            return None
+
+        if hh * hw <= DIRECT_MATCH_AREA:
+            return self._direct(hay)
+
+        level = len(n.pyramid) - 1
+        while level > 0:
+            lh, lw = hay.level(level).shape
+            nh, nw = n.pyramid[level].shape
+            if nw <= lw and nh <= lh:
+                break
+            level -= 1
+        if level == 0:
+            return self._direct(hay)
+
+        coarse_needle = n.pyramid[level]
+        result = cv2.matchTemplate(hay.level(level), coarse_needle, cv2.TM_CCOEFF_NORMED)
+        _, coarse_best, _, _ = cv2.minMaxLoc(result)
+        if coarse_best < n.confidence - COARSE_FLOOR:
+            # far below what even an under-scored hit reaches: an absent needle
+            # costs one coarse scan, not a full-resolution pass on top
+            return None
+        nh, nw = coarse_needle.shape
+        peaks = _top_peaks(result, COARSE_CANDIDATES, n.confidence - COARSE_MARGIN,
+                           (max(1, nw // 2), max(1, nh // 2)))
+
+        factor = 1 << level
+        pad = factor + 2
+        for _, cx, cy in peaks:
+            x0 = max(0, min(cx * factor - pad, hw - n.width))
+            y0 = max(0, min(cy * factor - pad, hh - n.height))
+            x1 = min(hw, cx * factor + n.width + pad)
+            y1 = min(hh, cy * factor + n.height + pad)
+            score, (x, y) = _best_in(hay.gray[y0:y1, x0:x1], n.gray)
+            if score > n.confidence:
+                return Match(x0 + x, y0 + y, n.width, n.height, score)
+        # the coarse level can under-score a real hit (thin strokes blur away);
+        # a miss is only reported once the full-resolution search agrees
+        return self._direct(hay)
+
+
+class Needle:
+    """One click target of a NeedleLibrary, with its own matcher and tracking."""
+
+    def __init__(self, name: str, image, confidence: float = MATCH_CONFIDENCE,
+                 priority: int = 0, tracking: bool = False,
+                 prepared: Optional[PreparedNeedle] = None):
+        self.name = name
+        self.image = image
+        self.priority = priority
+        self.matcher = TemplateMatcher(prepared or image, confidence, tracking=tracking)
+
+    @property
+    def confidence(self) -> float:
+        return self.matcher.needle.confidence
+
+    def __repr__(self):
+        return f"Needle({self.name!r}, priority={self.priority}, confidence={self.confidence})"
+
+
+class NeedleLibrary:
+    """Several click targets searched in priority order over one capture.
+
+    The haystack's grayscale conversion and pyramid levels are built once
+    and shared by every needle; each needle then pays only for its own
+    coarse-level scan and a few small full-resolution windows, and the
+    search stops at the first (lowest `priority` value) needle found.
+    Quacks like a TemplateMatcher (`locate`, `tracking`, hit counters) so
+    callers that used a single matcher keep working.
+    """
+
+    def __init__(self, tracking: bool = False):
+        self.tracking = tracking
+        # replaced, never mutated, so a scan in progress keeps a consistent list
+        self._needles: Tuple[Needle, ...] = ()
+        self.last_needle: Optional[Needle] = None
+        # grayscale target for BGRX captures, reused while the region size holds
+        self._gray: Optional[np.ndarray] = None
+
+    def add(self, name: str, image, confidence: float = MATCH_CONFIDENCE,
+            priority: Optional[int] = None, prepared: Optional[PreparedNeedle] = None) -> Needle:
+        """Add or replace `name`. Without a priority it goes after the others.
+        `prepared` skips the grayscale/pyramid work (its confidence is replaced)."""
+        if priority is None:
+            priority = max((n.priority for n in self._needles), default=-1) + 1
+        if prepared is not None:
+            prepared.confidence = confidence
+        needle = Needle(name, image, confidence, priority, self.tracking, prepared)
+        others = [n for n in self._needles if n.name != name]
+        # stable: equal priorities keep insertion order
+        self._needles = tuple(sorted(others + [needle], key=lambda n: n.priority))
+        return needle
+
+    def remove(self, name: str):
+        self._needles = tuple(n for n in self._needles if n.name != name)
+        if self.last_needle is not None and self.last_needle.name == name:
+            self.last_needle = None
+
+    def clear(self):
+        self._needles = ()
+        self.last_needle = None
+
+    def get(self, name: str) -> Optional[Needle]:
+        for needle in self._needles:
+            if needle.name == name:
+                return needle
+        return None
+
+    def __iter__(self):
+        return iter(self._needles)
+
+    def __len__(self):
+        return len(self._needles)
+
+    def _scratch(self, haystack) -> Optional[np.ndarray]:
+        if not isinstance(haystack, np.ndarray) or haystack.ndim != 3:
+            return None
+        shape = haystack.shape[:2]
+        if self._gray is None or self._gray.shape != shape:
+            self._gray = np.empty(shape, np.uint8)
+        return self._gray
+
+    def locate(self, haystack) -> Optional[Match]:
+        hay = haystack
+        if not isinstance(hay, Haystack):
+            hay = Haystack(haystack, self._scratch(haystack))
+        for needle in self._needles:
+            match = needle.matcher.locate(hay)
+            if match is not None:
+                self.last_needle = needle
+                return match
+        return None
+
+    def reset_tracking(self):
+        for needle in self._needles:
+            needle.matcher.reset_tracking()
+
+    @property
+    def track_hits(self) -> int:
+        return sum(n.matcher.track_hits for n in self._needles)
+
+    @property
+    def track_misses(self) -> int:
+        return sum(n.matcher.track_misses for n in self._needles)
+
+    @property
+    def full_searches(self) -> int:
+        return sum(n.matcher.full_searches for n in self._needles)
+
+    @property
+    def track_hit_rate(self) -> float:
+        tries = self.track_hits + self.track_misses
+        return self.track_hits / tries if tries else 0.0
@@ -0,0 +1,264 @@
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+
+class LatencyStats:
+    """Running latency summary for one operation (values recorded in seconds)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            if self.min is None or seconds < self.min:
+                self.min = seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.total = 0.0
+            self.min = None
+            self.max = 0.0
+            self.last = 0.0
+
+    def summary(self) -> Dict[str, float]:
+        """Snapshot in milliseconds."""
+        with self._lock:
+            return {
+                "count": self.count,
+                "mean_ms": self.mean * 1000,
+                "min_ms": (self.min or 0.0) * 1000,
+                "max_ms": self.max * 1000,
+                "last_ms": self.last * 1000,
+            }
+
+    def __str__(self):
+        s = self.summary()
+        return (f"n={s['count']} mean={s['mean_ms']:.1f}ms "
+                f"min={s['min_ms']:.1f}ms max={s['max_ms']:.1f}ms")
+
+
+# seconds; roughly x2.5 steps from 1 ms to 10 s, like Prometheus' defaults
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (seconds), cheap enough for every call."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (0 when empty)."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            counts, total, sum_ = list(self.counts), self.count, self.sum
+        return {
+            "count": total,
+            "sum_ms": sum_ * 1000,
+            "mean_ms": sum_ / total * 1000 if total else 0.0,
+            "p50_ms": self.quantile(0.5) * 1000,
+            "p95_ms": self.quantile(0.95) * 1000,
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], counts)),
+        }
+
+
+class _Timer:
+    __slots__ = ("_hist", "_start")
+
+    def __init__(self, hist: Histogram):
+        self._hist = hist
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """Per-stage latency histograms and event counters, pulled via `snapshot()`.
+
+    When `enabled` is False `timer()` hands back a shared no-op context
+    manager and `inc()` returns at once, so instrumented code costs a method
+    call per stage.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.started = time.time()
+
+    def histogram(self, name: str) -> Histogram:
+        hist = self.histograms.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(name, Histogram())
+        return hist
+
+    def timer(self, stage: str):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self.histogram(stage))
+
+    def observe(self, stage: str, seconds: float):
+        if self.enabled:
+            self.histogram(stage).observe(seconds)
+
+    def inc(self, name: str, n: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+        return {
+            "time": time.time(),
+            "uptime_s": time.time() - self.started,
+            "counters": counters,
+            "stages": {name: h.snapshot() for name, h in sorted(histograms.items())},
+        }
+
+    def to_prometheus(self, prefix: str = "cyclops") -> str:
+        """Prometheus text exposition format (node_exporter textfile style)."""
+        snap = self.snapshot()
+        lines = [f"# TYPE {prefix}_events_total counter"]
+        for name, value in sorted(snap["counters"].items()):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+        lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+        for stage, hist in histograms:
+            with hist._lock:
+                counts, total, sum_ = list(hist.counts), hist.count, hist.sum
+            cumulative = 0
+            for bound, n in zip(list(hist.buckets) + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {sum_:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Writes `metrics` to `path` every `interval` seconds on a daemon thread.
+
+    "jsonl" appends one snapshot per line; "prometheus" atomically rewrites
+    the file, for a node_exporter textfile collector to pick up.
+    """
+
+    FORMATS = ("jsonl", "prometheus")
+
+    def __init__(self, metrics: Metrics, path: str, interval: float = 10.0, fmt: str = "jsonl"):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"unknown metrics format: {fmt}")
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.fmt = fmt
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def write(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.fmt == "jsonl":
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.metrics.snapshot()) + "\n")
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.metrics.to_prometheus())
+        os.replace(tmp, self.path)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                pass  # a full disk must not take the macro down
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="cyclops-metrics", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the thread and write a final snapshot."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        try:
+            self.write()
+        except OSError:
+            pass
@@ -0,0 +1,537 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import shlex
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from lazy import available, lazy_import
+from metrics import LatencyStats
+from preprocess import needs_upscale, split_strips
+from textmatch import normalize_text, substring_distance
+
+Image = lazy_import("PIL.Image")
+pytesseract = lazy_import("pytesseract")
+tesserocr = lazy_import("tesserocr", optional=True)
+
+DEFAULT_LANG = "kor+eng"
+DEFAULT_CONFIG = "--psm 6"
+
+
+def parse_tesseract_config(config: str) -> Tuple[Optional[int], Dict[str, str]]:
+    """Split a pytesseract-style config string into (psm, -c variables)."""
+    psm = None
+    variables = {}
+    tokens = shlex.split(config or "")
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        if tok == "--psm" and i + 1 < len(tokens):
+            psm = int(tokens[i + 1])
+            i += 2
+            continue
+        if tok == "-c" and i + 1 < len(tokens):
+            key, _, value = tokens[i + 1].partition("=")
+            variables[key] = value
+            i += 2
+            continue
+        i += 1
+    return psm, variables
+
+
+class OcrEngine:
+    name = "base"
+
+    def __init__(self, lang: str = DEFAULT_LANG, config: str = DEFAULT_CONFIG):
+        self.lang = lang
+        self.config = config
+        self.stats = LatencyStats()
+
+    def recognize(self, image: Image.Image) -> str:
+        start = time.perf_counter()
+        try:
+            return self._recognize(image)
+        finally:
+            self.stats.record(time.perf_counter() - start)
+
+    def _recognize(self, image: Image.Image) -> str:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PytesseractEngine(OcrEngine):
+    """Spawns the tesseract CLI per call (temp file + model load every time)."""
+
+    name = "pytesseract"
+
+    def _recognize(self, image: Image.Image) -> str:
+        return pytesseract.image_to_string(image, lang=self.lang, config=self.config)
+
+
+class TesserocrEngine(OcrEngine):
+    """In-process tesseract API kept alive so the traineddata loads only once."""
+
+    name = "tesserocr"
+
+    def __init__(self, lang: str = DEFAULT_LANG, config: str = DEFAULT_CONFIG):
+        if not available(tesserocr):
+            raise RuntimeError("tesserocr is not installed or fails to import")
+        super().__init__(lang, config)
+        psm, variables = parse_tesseract_config(config)
+        kwargs = {"lang": lang}
+        if psm is not None:
+            kwargs["psm"] = psm
+        # PyTessBaseAPI is not thread-safe; one call at a time
+        self._lock = threading.Lock()
+        self._api = tesserocr.PyTessBaseAPI(**kwargs)
+        for key, value in variables.items():
+            self._api.SetVariable(key, value)
+
+    def _recognize(self, image: Image.Image) -> str:
+        with self._lock:
+            if self._api is None:
+                raise RuntimeError("engine closed")
+            self._api.SetImage(image)
+            return self._api.GetUTF8Text()
+
+    def close(self):
+        with self._lock:
+            if self._api is not None:
+                self._api.End()
+                self._api = None
+
+
+ENGINES = {
+    "tesserocr": TesserocrEngine,
+    "pytesseract": PytesseractEngine,
+}
+AUTO_ORDER = ("tesserocr", "pytesseract")
+
+
+def create_engine(backend: str = "auto", lang: str = DEFAULT_LANG,
+                  config: str = DEFAULT_CONFIG, daemon_address: Optional[str] = None) -> OcrEngine:
+    """Build an OCR engine. "auto" prefers the persistent backend and
+    falls back to pytesseract when tesserocr is missing or fails to load;
+    "daemon" sends images to a shared ocr_daemon (never picked by "auto")."""
+    if backend == "daemon":
+        from ocr_daemon import DaemonOcrEngine  # imports this module
+        return DaemonOcrEngine(daemon_address, lang, config)
+    if backend != "auto":
+        if backend not in ENGINES:
+            raise ValueError(f"unknown OCR backend: {backend}")
+        return ENGINES[backend](lang, config)
+
+    last_error = None
+    for name in AUTO_ORDER:
+        try:
+            return ENGINES[name](lang, config)
+        except (RuntimeError, ImportError) as e:
+            last_error = e
+    raise RuntimeError(f"no OCR backend available: {last_error}")
+
+
+# --- strip-parallel OCR (worker processes) ---
+
+_strip_engine: Optional[OcrEngine] = None
+
+
+def _strip_worker_init(backend: str, lang: str, config: str):
+    global _strip_engine
+    # one tesseract thread per process: the pool already covers the cores
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    _strip_engine = create_engine(backend, lang, config)
+
+
+def _strip_worker_recognize(mode: str, size: Tuple[int, int], data: bytes) -> str:
+    return _strip_engine.recognize(Image.frombytes(mode, size, data)).strip()
+
+
+class StripRecognizer:
+    """OCR of a tall binarized region split into strips, one per process.
+
+    Tesseract uses one core per page, so a large region is cut into
+    `workers` horizontal strips on blank rows (`split_strips`), the strips
+    are recognized in parallel by a process pool with an engine loaded in
+    each process, and the texts are joined top to bottom. Strips shorter
+    than `min_height` are not made; a region that stays one strip goes to
+    `single` (the caller's own engine) when given, skipping the pool.
+    """
+
+    def __init__(self, workers: Optional[int] = None, backend: str = "auto",
+                 lang: str = DEFAULT_LANG, config: str = DEFAULT_CONFIG, min_height: int = 64):
+        self.workers = workers or os.cpu_count() or 2
+        self.backend = backend
+        self.lang = lang
+        self.config = config
+        self.min_height = min_height
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.strips = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, initializer=_strip_worker_init,
+                                                 initargs=(self.backend, self.lang, self.config))
+            return self._pool
+
+    def recognize(self, binary: Image.Image, single: Optional[Callable[[Image.Image], str]] = None) -> str:
+        strips = split_strips(binary, self.workers, self.min_height)
+        self.calls += 1
+        self.strips += len(strips)
+        if len(strips) == 1 and single is not None:
+            return single(binary)
+        pool = self._get_pool()
+        futures = []
+        for box in strips:
+            part = binary.crop(box)
+            futures.append(pool.submit(_strip_worker_recognize, part.mode, part.size, part.tobytes()))
+        return "\n".join(text for text in (f.result() for f in futures) if text)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "workers": self.workers,
+            "calls": self.calls,
+            "strips_per_call": self.strips / self.calls if self.calls else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+
+class OcrCache:
+    """Bounded LRU of OCR text keyed by a digest of the preprocessed image.
+
+    Limited by entry count and by the approximate bytes held (key + UTF-8
+    text). `save()` / `load()` persist entries as JSON so a restart is warm.
+    """
+
+    ENTRY_OVERHEAD = 64
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 4 * 1024 * 1024,
+                 path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path:
+            self.load(path)
+
+    @staticmethod
+    def key(image: Image.Image, lang: str = DEFAULT_LANG, config: str = DEFAULT_CONFIG) -> str:
+        return OcrCache.raw_key(image.mode, image.size, image.tobytes(), lang, config)
+
+    @staticmethod
+    def raw_key(mode: str, size: Tuple[int, int], data: bytes,
+                lang: str = DEFAULT_LANG, config: str = DEFAULT_CONFIG) -> str:
+        """`key()` for an image still in its `tobytes()` form."""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{mode}:{tuple(size)}:{lang}:{config}".encode())
+        h.update(data)
+        return h.hexdigest()
+
+    def _entry_size(self, key: str, text: str) -> int:
+        return len(key) + len(text.encode("utf-8")) + self.ENTRY_OVERHEAD
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key: str, text: str):
+        size = self._entry_size(key, text)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= self._entry_size(key, old)
+            self._entries[key] = text
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._bytes > self.max_bytes):
+                old_key, old_text = self._entries.popitem(last=False)
+                self._bytes -= self._entry_size(old_key, old_text)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def save(self, path: Optional[str] = None) -> bool:
+        """Write the entries to `path`; False (with a warning) when that fails,
+        e.g. on a read-only or full disk: the cache is only a speed-up."""
+        path = path or self.path
+        if not path:
+            return False
+        with self._lock:
+            data = {"version": 1, "entries": list(self._entries.items())}
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"OCR cache not saved to {path}: {e}", file=sys.stderr)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def load(self, path: Optional[str] = None):
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != 1:
+            return
+        # oldest first so the LRU order survives the round-trip
+        for key, text in data.get("entries", []):
+            self.put(key, text)
+
+
+class RegionTracker:
+    """Re-OCRs only the sub-regions (bands/blocks) whose pixels changed.
+
+    Each crop is keyed by its content digest; crops that were already present
+    in the previous frame keep their text, the rest go to `recognize`. Boxes
+    come grouped in lines: texts on one line are joined with spaces, lines
+    with newlines, so the result reads like a full-region OCR.
+    """
+
+    def __init__(self):
+        self._previous: Dict[str, str] = {}
+        self.regions_total = 0
+        self.regions_ocred = 0
+        self.pixels_total = 0
+        self.pixels_ocred = 0
+
+    def reset(self):
+        self._previous = {}
+
+    @property
+    def saved_fraction(self) -> float:
+        if not self.regions_total:
+            return 0.0
+        return 1.0 - self.regions_ocred / self.regions_total
+
+    @property
+    def pixels_saved_fraction(self) -> float:
+        if not self.pixels_total:
+            return 0.0
+        return 1.0 - self.pixels_ocred / self.pixels_total
+
+    def recognize(self, binary: Image.Image, lines: List[List[Tuple[int, int, int, int]]],
+                  recognize: Callable[[Image.Image], str]) -> str:
+        current: Dict[str, str] = {}
+        out_lines = []
+        self.pixels_total += binary.size[0] * binary.size[1]
+        for line in lines:
+            parts = []
+            for box in line:
+                crop = binary.crop(box)
+                key = OcrCache.key(crop)
+                text = current.get(key)
+                if text is None:
+                    text = self._previous.get(key)
+                if text is None:
+                    text = recognize(crop)
+                    self.regions_ocred += 1
+                    self.pixels_ocred += crop.size[0] * crop.size[1]
+                self.regions_total += 1
+                current[key] = text
+                if text:
+                    parts.append(text)
+            if parts:
+                out_lines.append(" ".join(parts))
+        self._previous = current
+        return "\n".join(out_lines)
+
+
+AMBIGUOUS_SIMILARITY = 0.5  # cheap-pass similarity at which the full pass is needed
+_HANGUL = re.compile(r"[\u1100-\u11ff\u3130-\u318f\uac00-\ud7a3]")
+_LATIN = re.compile(r"[A-Za-z]")
+
+
+def script_lang(targets: List[str]) -> str:
+    """Cheapest traineddata that covers the scripts used by the targets."""
+    has_kor = any(_HANGUL.search(t) for t in targets)
+    has_latin = any(_LATIN.search(t) for t in targets)
+    if has_kor and has_latin:
+        return "kor+eng"
+    return "kor" if has_kor else "eng"
+
+
+def target_whitelist(targets: List[str]) -> str:
+    chars = set()
+    for target in targets:
+        for ch in target:
+            if ch.isalnum():
+                chars.update((ch, ch.lower(), ch.upper()))
+    return "".join(sorted(chars))
+
+
+class TieredRecognizer:
+    """Cheap first pass; the full recognition runs only on a near-match.
+
+    Tier 1 recognizes the frame without the 2x upscale, with a single
+    language picked from the targets' script and a character whitelist built
+    from the targets. If that text is clearly unlike every target it is the
+    answer. Anything similar enough to be a possible hit, exact hits
+    included, is re-read by tier 2, the caller's normal full recognition, so
+    a stop decision is never made on the cheap pass alone.
+
+    A read shorter than the shortest target (empty or garbled) rules nothing
+    out and is escalated too, and regions small enough to need the 2x
+    upscale skip tier 1 altogether: without it tesseract reads little there.
+    "Similar enough" is never stricter than the text matcher: with
+    `max_error_ratio` r a read at similarity 1 - r already matches, so the
+    threshold is min(ambiguous, 1 - r).
+
+    If tier 1 fails (e.g. tesseract lacks the traineddata of its single
+    language) the cheap engine is dropped, `error` keeps the reason and
+    every frame goes to the full pass.
+    """
+
+    def __init__(self, preprocess: Callable, backend: str = "auto",
+                 config: str = DEFAULT_CONFIG, cache: Optional[OcrCache] = None,
+                 ambiguous: float = AMBIGUOUS_SIMILARITY, daemon_address: Optional[str] = None):
+        self.preprocess = preprocess
+        self.backend = backend
+        self.daemon_address = daemon_address
+        self.config = config
+        self.cache = cache
+        self.ambiguous = ambiguous
+        self.max_error_ratio = 0.0
+        self.error: Optional[Exception] = None
+        self.targets: List[str] = []
+        self._normalized: List[str] = []
+        self.engine: Optional[OcrEngine] = None
+        self.tier1 = LatencyStats()
+        self.tier2 = LatencyStats()
+        self.decided_cheap = 0
+        self.escalated = 0
+
+    def set_targets(self, targets: List[str], max_error_ratio: float = 0.0):
+        self.max_error_ratio = max_error_ratio
+        targets = [t for t in targets if t.strip()]
+        if targets == self.targets and self.engine is not None:
+            return
+        self.close()
+        self.targets = targets
+        self._normalized = [normalize_text(t) for t in targets]
+        if not targets:
+            return
+        config = self.config
+        whitelist = target_whitelist(targets)
+        if whitelist:
+            config += " -c " + shlex.quote(f"tessedit_char_whitelist={whitelist}")
+        self.engine = create_engine(self.backend, script_lang(targets), config, self.daemon_address)
+
+    def similarity(self, text: str) -> float:
+        normalized = normalize_text(text)
+        best = 0.0
+        for target in self._normalized:
+            score = 1.0 - substring_distance(target, normalized) / len(target)
+            if score > best:
+                best = score
+        return best
+
+    @property
+    def threshold(self) -> float:
+        return min(self.ambiguous, 1.0 - self.max_error_ratio)
+
+    def _inconclusive(self, text: str) -> bool:
+        return len(normalize_text(text)) < min(len(t) for t in self._normalized)
+
+    def recognize(self, image, full: Callable[[], str]) -> str:
+        if self.engine is None:
+            return full()
+        shape = getattr(image, "shape", None)  # BGRX array view or PIL image
+        w, h = (shape[1], shape[0]) if shape is not None else image.size
+        if needs_upscale(w, h):
+            return self._escalate(full)
+        start = time.perf_counter()
+        binary = self.preprocess(image, upscale=False)
+        key = OcrCache.key(binary, self.engine.lang, self.engine.config)
+        text = self.cache.get(key) if self.cache is not None else None
+        if text is None:
+            try:
+                text = self.engine.recognize(binary).strip()
+            except (RuntimeError, OSError) as e:  # pytesseract.TesseractError is a RuntimeError
+                self.error = e
+                self.close()
+                return self._escalate(full)
+            if self.cache is not None:
+                self.cache.put(key, text)
+        self.tier1.record(time.perf_counter() - start)
+
+        if not self._inconclusive(text) and self.similarity(text) < self.threshold:
+            self.decided_cheap += 1
+            return text
+        return self._escalate(full)
+
+    def _escalate(self, full: Callable[[], str]) -> str:
+        self.escalated += 1
+        start = time.perf_counter()
+        text = full()
+        self.tier2.record(time.perf_counter() - start)
+        return text
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "cheap_lang": self.engine.lang if self.engine else None,
+            "error": str(self.error) if self.error is not None else None,
+            "decided_cheap": self.decided_cheap,
+            "escalated": self.escalated,
+            "tier1": self.tier1.summary(),
+            "tier2": self.tier2.summary(),
+        }
+
+    def close(self):
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
@@ -0,0 +1,523 @@
+"""Shared OCR service for several Cyclops processes on one machine.
+
+    python ocr_daemon.py [--listen ADDR] [--workers N] [--backend NAME]
+
+Each Cyclops process otherwise starts its own tesseract and keeps its own
+kor+eng models in memory. The daemon loads them once per worker and serves
+every client over a Unix socket ("unix:/path", the default on POSIX) or
+localhost TCP ("127.0.0.1:PORT"). Point a controller at it with
+OCR_BACKEND = "daemon" (and OCR_DAEMON_ADDRESS, or CYCLOPS_OCR_DAEMON).
+
+Wire format, both directions: 4-byte big-endian header length, a JSON
+header, then `header["bytes"]` bytes of payload (the image's `tobytes()`
+for an "ocr" request, nothing otherwise).
+"""
+from __future__ import annotations
+
+import argparse
+import errno
+import ipaddress
+import json
+import os
+import queue
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Tuple
+
+from lazy import lazy_import
+from metrics import LatencyStats
+from ocr import DEFAULT_CONFIG, DEFAULT_LANG, OcrCache, OcrEngine, create_engine
+
+Image = lazy_import("PIL.Image")
+
+HAS_UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+DEFAULT_ADDRESS = os.environ.get("CYCLOPS_OCR_DAEMON") or (
+    "unix:" + os.path.join(os.path.expanduser("~"), ".cache", "cyclops", "ocr.sock")
+    if HAS_UNIX_SOCKETS else "127.0.0.1:47831")
+DEFAULT_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+MAX_PENDING = 64  # requests queued or being recognized before new ones get "busy"
+BATCH_WINDOW = 0.005  # seconds the dispatcher waits for more requests to batch
+MAX_BATCH = 32
+MAX_ENGINES = 4  # engines kept per worker thread; each (lang, config) loads its own model
+CLIENT_TIMEOUT = 5.0
+MAX_HEADER = 64 * 1024
+MAX_PAYLOAD = 64 * 1024 * 1024
+
+_LENGTH = struct.Struct(">I")
+
+
+class DaemonError(RuntimeError):
+    """The daemon refused or failed a request (busy, timeout, bad request)."""
+
+
+def parse_address(address: str) -> Tuple[int, object]:
+    """"unix:/path" or "host:port" -> (socket family, bind/connect address)."""
+    if address.startswith("unix:"):
+        if not HAS_UNIX_SOCKETS:
+            raise ValueError("Unix sockets are not available on this platform")
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"bad daemon address {address!r}: expected unix:/path or host:port")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _is_loopback(host: str) -> bool:
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def _claim_unix_path(path: str):
+    """Remove a socket file left by a daemon that did not shut down; refuse
+    when a daemon still answers on it or the path is not a socket."""
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)  # stale: nobody is listening
+    else:
+        raise OSError(errno.EADDRINUSE, f"an OCR daemon is already listening on {path}")
+    finally:
+        probe.close()
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def send_message(sock: socket.socket, header: dict, payload: bytes = b""):
+    header = dict(header, bytes=len(payload))
+    raw = json.dumps(header).encode("utf-8")
+    sock.sendall(_LENGTH.pack(len(raw)) + raw + payload)
+
+
+def recv_message(sock: socket.socket) -> Tuple[dict, bytes]:
+    (length,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    if length > MAX_HEADER:
+        raise ConnectionError(f"header too large: {length}")
+    header = json.loads(_recv_exact(sock, length))
+    size = int(header.get("bytes", 0))
+    if size > MAX_PAYLOAD:
+        raise ConnectionError(f"payload too large: {size}")
+    return header, _recv_exact(sock, size) if size else b""
+
+
+def max_rss_kb() -> Optional[int]:
+    """Peak RSS of this process plus its largest finished child (the
+    tesseract CLI for pytesseract); None where `resource` is missing."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+           + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return rss // 1024 if sys.platform == "darwin" else rss  # bytes on macOS
+
+
+class _Request:
+    __slots__ = ("key", "mode", "size", "data", "lang", "config", "deadline", "future")
+
+    def __init__(self, header: dict, data: bytes):
+        self.mode = header["mode"]
+        self.size = tuple(header["size"])
+        self.lang = header.get("lang", DEFAULT_LANG)
+        self.config = header.get("config", DEFAULT_CONFIG)
+        self.data = data
+        self.deadline = time.monotonic() + float(header.get("timeout", CLIENT_TIMEOUT))
+        self.key = OcrCache.raw_key(self.mode, self.size, data, self.lang, self.config)
+        self.future: Future = Future()
+
+
+class OcrServer:
+    """Accepts OCR requests from many clients and runs them on a worker pool.
+
+    A dispatcher thread drains the request queue in batches: whatever
+    arrives within `batch_window` of the first request (up to `max_batch`)
+    is grouped by image digest, so the same frame sent by several processes
+    is recognized once, and answered from a shared OcrCache when seen
+    before. Each worker thread keeps its own engine per (lang, config),
+    up to `max_engines`; the least recently used one is closed beyond that.
+    While `max_pending` requests are queued or in progress, new ones get an
+    immediate "busy" reply instead of piling up; requests whose client deadline passed
+    while queued are dropped without being recognized.
+    """
+
+    def __init__(self, address: str = DEFAULT_ADDRESS, workers: int = DEFAULT_WORKERS,
+                 backend: str = "auto", max_pending: int = MAX_PENDING,
+                 batch_window: float = BATCH_WINDOW, max_batch: int = MAX_BATCH,
+                 max_engines: int = MAX_ENGINES):
+        if backend == "daemon":
+            raise ValueError("the daemon's workers need a local OCR backend")
+        self.address = address
+        self.workers = workers
+        self.backend = backend
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_engines = max(1, max_engines)
+        self.cache = OcrCache()
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self._pending: "queue.Queue[_Request]" = queue.Queue()
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="ocrd-worker")
+        self._local = threading.local()
+        self._engines: List[OcrEngine] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server: Optional[socketserver.BaseServer] = None
+        self._threads: List[threading.Thread] = []
+
+        self.requests = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.expired = 0
+        self.batches = 0
+        self.evicted = 0
+        self.latency = LatencyStats()
+
+    # --- recognition (pool threads) ---
+
+    def _engine(self, lang: str, config: str) -> OcrEngine:
+        engines = getattr(self._local, "engines", None)
+        if engines is None:
+            engines = self._local.engines = OrderedDict()
+        key = (lang, config)
+        engine = engines.get(key)
+        if engine is not None:
+            engines.move_to_end(key)
+            return engine
+        engine = engines[key] = create_engine(self.backend, lang, config)
+        with self._lock:
+            self._engines.append(engine)
+        while len(engines) > self.max_engines:
+            _, old = engines.popitem(last=False)
+            with self._lock:
+                self._engines.remove(old)
+                self.evicted += 1
+            old.close()
+        return engine
+
+    def _recognize(self, first: _Request) -> str:
+        image = Image.frombytes(first.mode, first.size, first.data)
+        text = self._engine(first.lang, first.config).recognize(image).strip()
+        self.cache.put(first.key, text)
+        return text
+
+    # --- dispatch ---
+
+    def submit(self, request: _Request) -> Future:
+        with self._lock:
+            if self.in_flight >= self.max_pending:
+                self.rejected += 1
+                raise DaemonError("busy")
+            self.in_flight += 1
+            self.requests += 1
+        request.future.add_done_callback(self._release)
+        self._pending.put(request)
+        return request.future
+
+    def _release(self, _done: Future):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _next_batch(self) -> List[_Request]:
+        try:
+            batch = [self._pending.get(timeout=0.2)]
+        except queue.Empty:
+            return []
+        until = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = until - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            self.batches += 1
+            now = time.monotonic()
+            groups: Dict[str, List[_Request]] = {}
+            for request in batch:
+                if request.deadline <= now:
+                    self.expired += 1
+                    request.future.set_exception(DaemonError("timeout"))
+                    continue
+                groups.setdefault(request.key, []).append(request)
+            for key, group in groups.items():
+                self.deduplicated += len(group) - 1
+                text = self.cache.get(key)
+                if text is not None:
+                    for request in group:
+                        request.future.set_result(text)
+                    continue
+                self._pool.submit(self._recognize, group[0]).add_done_callback(
+                    lambda done, group=group: self._resolve(group, done))
+
+    @staticmethod
+    def _resolve(group: List[_Request], done: Future):
+        error = done.exception()
+        for request in group:
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(done.result())
+
+    # --- connections ---
+
+    def _handle(self, sock: socket.socket):
+        while not self._stop.is_set():
+            try:
+                header, payload = recv_message(sock)
+            except (ConnectionError, OSError, ValueError):
+                return
+            op = header.get("op", "ocr")
+            reply = {"id": header.get("id")}
+            if op == "ping":
+                reply["ok"] = True
+            elif op == "stats":
+                reply["stats"] = self.stats()
+            elif op == "ocr":
+                start = time.perf_counter()
+                try:
+                    request = _Request(header, payload)
+                    future = self.submit(request)
+                    reply["text"] = future.result(timeout=max(0.0, request.deadline - time.monotonic()))
+                except FutureTimeout:
+                    reply["error"] = "timeout"
+                except DaemonError as e:
+                    reply["error"] = str(e)
+                except (KeyError, ValueError, TypeError) as e:
+                    reply["error"] = f"bad request: {e}"
+                except Exception as e:  # the engine failed; keep serving
+                    reply["error"] = f"ocr failed: {e}"
+                self.latency.record(time.perf_counter() - start)
+            else:
+                reply["error"] = f"unknown op {op!r}"
+            try:
+                send_message(sock, reply)
+            except OSError:
+                return
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "workers": self.workers,
+            "engines": len(self._engines),
+            "evicted": self.evicted,
+            "requests": self.requests,
+            "batches": self.batches,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "in_flight": self.in_flight,
+            "cache": self.cache.stats(),
+            "latency": self.latency.summary(),
+            "max_rss_kb": max_rss_kb(),
+        }
+
+    def start(self):
+        family, bind = parse_address(self.address)
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server._handle(self.request)
+
+        if family == socket.AF_UNIX:
+            directory = os.path.dirname(bind)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            _claim_unix_path(bind)
+            self._server = socketserver.ThreadingUnixStreamServer(bind, Handler)
+        else:
+            # no authentication: the service must not be reachable from the network
+            if not _is_loopback(bind[0]):
+                raise ValueError(f"refusing to listen on {bind[0]}: only loopback addresses")
+            socketserver.ThreadingTCPServer.allow_reuse_address = True
+            self._server = socketserver.ThreadingTCPServer(bind, Handler)
+        self._server.daemon_threads = True
+        for target, name in ((self._dispatch, "ocrd-dispatch"), (self._server.serve_forever, "ocrd-accept")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            family, bind = parse_address(self.address)
+            if family == socket.AF_UNIX and os.path.exists(bind):
+                os.unlink(bind)
+            self._server = None
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self._pool.shutdown(wait=True)
+        with self._lock:
+            for engine in self._engines:
+                engine.close()
+            self._engines = []
+
+
+class DaemonClient:
+    """One connection to the daemon; calls are serialized on it."""
+
+    def __init__(self, address: str = DEFAULT_ADDRESS, timeout: float = CLIENT_TIMEOUT):
+        self.address = address
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            family, target = parse_address(self.address)
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(target)
+            except OSError:
+                sock.close()
+                raise
+            self._sock = sock
+        return self._sock
+
+    def call(self, header: dict, payload: bytes = b"") -> dict:
+        with self._lock:
+            self._next_id += 1
+            header = dict(header, id=self._next_id)
+            try:
+                sock = self._connect()
+                send_message(sock, header, payload)
+                reply, _ = recv_message(sock)
+            except (OSError, ConnectionError, ValueError) as e:
+                # the stream may hold half a reply now: start over next time
+                self._close()
+                if isinstance(e, socket.timeout):
+                    raise DaemonError("timeout") from e
+                raise DaemonError(f"daemon unreachable at {self.address}: {e}") from e
+        if reply.get("error"):
+            raise DaemonError(reply["error"])
+        return reply
+
+    def ping(self) -> bool:
+        try:
+            return bool(self.call({"op": "ping"}).get("ok"))
+        except DaemonError:
+            return False
+
+    def stats(self) -> dict:
+        return self.call({"op": "stats"})["stats"]
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+class DaemonOcrEngine(OcrEngine):
+    """Sends images to a running ocr_daemon instead of loading tesseract here.
+
+    If the daemon is busy, times out or is unreachable, the call falls back
+    to a local `fallback` engine (created on first need) so a scan never
+    fails just because the daemon went away; None raises DaemonError instead.
+    """
+
+    name = "daemon"
+
+    def __init__(self, address: Optional[str] = None, lang: str = DEFAULT_LANG,
+                 config: str = DEFAULT_CONFIG, timeout: float = CLIENT_TIMEOUT,
+                 fallback: Optional[str] = "pytesseract"):
+        super().__init__(lang, config)
+        self.client = DaemonClient(address or DEFAULT_ADDRESS, timeout)
+        if not self.client.ping():
+            self.client.close()
+            raise RuntimeError(f"OCR daemon not running at {self.client.address}")
+        self.fallback = fallback
+        self._fallback_engine: Optional[OcrEngine] = None
+        self.fallbacks = 0
+
+    def _recognize(self, image: Image.Image) -> str:
+        header = {"op": "ocr", "mode": image.mode, "size": list(image.size),
+                  "lang": self.lang, "config": self.config, "timeout": self.client.timeout}
+        try:
+            return self.client.call(header, image.tobytes())["text"]
+        except DaemonError:
+            if self.fallback is None:
+                raise
+            self.fallbacks += 1
+            if self._fallback_engine is None:
+                self._fallback_engine = create_engine(self.fallback, self.lang, self.config)
+            return self._fallback_engine.recognize(image)
+
+    def close(self):
+        self.client.close()
+        if self._fallback_engine is not None:
+            self._fallback_engine.close()
+            self._fallback_engine = None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cyclops shared OCR daemon")
+    parser.add_argument("--listen", default=DEFAULT_ADDRESS, help="unix:/path or host:port")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--backend", default="auto", help="OCR backend of the workers")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING)
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW, metavar="S")
+    parser.add_argument("--max-engines", type=int, default=MAX_ENGINES,
+                        help="OCR engines kept per worker (one per language/config)")
+    args = parser.parse_args(argv)
+
+    try:
+        server = OcrServer(args.listen, args.workers, args.backend,
+                           args.max_pending, args.batch_window,
+                           max_engines=args.max_engines)
+        server.start()
+    except (OSError, ValueError) as e:
+        print(f"cannot listen on {args.listen}: {e}", file=sys.stderr)
+        return 2
+    print(f"OCR daemon on {args.listen} ({args.workers} workers, backend {args.backend})", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(json.dumps(server.stats()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from frames import Frame, FrameSourceExhausted
+from lazy import lazy_import
+from metrics import LatencyStats
+
+pyautogui = lazy_import("pyautogui")
+
+QUEUE_SIZE = 2       # small on purpose: a deep queue only holds stale frames
+POLL_INTERVAL = 0.05
+STATUS_INTERVAL = 1.0
+
+
+class StageEnd:
+    """Travels down the queues to tell every later stage to finish."""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+class WorkItem:
+    __slots__ = ("frame", "changed", "binary", "text", "verdict")
+
+    def __init__(self, frame: Frame):
+        self.frame = frame
+        self.changed = True
+        self.binary = None
+        self.text = ""
+        self.verdict = False
+
+
+class Stage:
+    """One worker thread: takes from `inbox`, runs `func`, puts to `outbox`.
+
+    A stage without an inbox is a source and calls `func(None)` in a loop.
+    `func` may return None to drop an item or a StageEnd to shut down.
+    """
+
+    def __init__(self, name: str, func: Callable, inbox: Optional[queue.Queue],
+                 outbox: queue.Queue, stop_event: threading.Event):
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.latency = LatencyStats()
+        self._stop = stop_event
+        self.thread = threading.Thread(target=self._loop, name=f"cyclops-{name}", daemon=True)
+
+    @property
+    def depth(self) -> int:
+        return self.inbox.qsize() if self.inbox is not None else 0
+
+    def start(self):
+        self.thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self.outbox.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _loop(self):
+        while not self._stop.is_set():
+            item = None
+            if self.inbox is not None:
+                try:
+                    item = self.inbox.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                if isinstance(item, StageEnd):
+                    self._put(item)
+                    return
+            start = time.perf_counter()
+            try:
+                result = self.func(item)
+            except FrameSourceExhausted:
+                result = StageEnd("frame source exhausted")
+            except Exception as e:
+                result = StageEnd(f"{self.name} failed: {e}")
+            if isinstance(result, StageEnd):
+                self._put(result)
+                return
+            self.latency.record(time.perf_counter() - start)
+            if result is not None and not self._put(result):
+                return
+
+
+class StagedRunner:
+    """Runs capture, preprocess, OCR and the match/click decision concurrently.
+
+    capture -> preprocess -> OCR run on their own threads with bounded queues
+    between them; the decision stage runs on the caller's thread (the one
+    that called `MacroController.run`). Items stay in capture order, so a
+    text match is always seen before any later click decision, and clicks go
+    through `controller._click`, which refuses to click once `running` is off.
+    After a click (or a miss) capture pauses until the click delay (or retry
+    interval) has passed and frames captured before that are discarded, so
+    each click still acts on a screen that reflects the previous click.
+    """
+
+    def __init__(self, controller, queue_size: int = QUEUE_SIZE):
+        self.c = controller
+        self._stop = threading.Event()
+        # capture pauses until then (after a click or a miss)
+        self.resume_at = 0.0
+        self._last_capture = 0.0
+        # adaptive mode: after a miss, search again on the next changed frame
+        # (or once the slowest poll interval has passed) instead of pausing
+        self._retry_after: Optional[float] = None
+        self.dropped = 0
+        self._last_text = ""
+        self._last_verdict = False
+
+        q_frames = queue.Queue(queue_size)
+        q_binary = queue.Queue(queue_size)
+        self.results = queue.Queue(queue_size)
+        self.stages: List[Stage] = [
+            Stage("capture", self._capture, None, q_frames, self._stop),
+            Stage("preprocess", self._preprocess, q_frames, q_binary, self._stop),
+            Stage("ocr", self._ocr, q_binary, self.results, self._stop),
+        ]
+        self.decide_latency = LatencyStats()
+
+    def _pause_for(self, seconds: float):
+        self.resume_at = time.monotonic() + seconds
+
+    def interrupt(self):
+        """Unblock the decision loop right away (called by `controller.stop`)."""
+        try:
+            self.results.put_nowait(StageEnd("stopped"))
+        except queue.Full:
+            pass  # a result is already waiting; the loop sees `running` off
+        self.c.wake()
+
+    # --- worker stages ---
+
+    def _capture(self, _):
+        wakeup = self.c.wakeup
+        with wakeup:
+            while True:
+                if self._stop.is_set():
+                    return None
+                resume_at = self.resume_at
+                if self.c.adaptive:
+                    resume_at = max(resume_at, self._last_capture + self.c.scan_rate.interval)
+                delay = resume_at - time.monotonic()
+                if delay <= 0:
+                    break
+                wakeup.wait(delay)
+        self._last_capture = time.monotonic()
+        return WorkItem(self.c.frames.fresh(self.c.result_region))
+
+    def _preprocess(self, item: WorkItem):
+        item.changed = self.c.change_detector.changed(item.frame.pixels)
+        if self.c.adaptive:
+            self.c._observe_activity(item.changed)
+        if item.changed:
+            item.binary = self.c._preprocess(item.frame.pixels)
+        return item
+
+    def _ocr(self, item: WorkItem):
+        if item.changed:
+            with self.c.metrics.timer("scan"):
+                self._last_text = self.c._ocr_frame(item.frame.pixels, item.binary)
+            self._last_verdict = self.c._check_match(self._last_text)
+            self.c.last_ocr_text = self._last_text
+            self.c._notify(self.c.on_ocr_update, self._last_text)
+        else:
+            self.c.ocr_skip_count += 1
+            self.c.metrics.inc("ocr_skipped")
+        item.text = self._last_text
+        item.verdict = self._last_verdict
+        return item
+
+    # --- stats ---
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for stage in self.stages:
+            out[stage.name] = dict(stage.latency.summary(), depth=stage.depth)
+        out["decide"] = dict(self.decide_latency.summary(), depth=self.results.qsize())
+        return out
+
+    def status_line(self) -> str:
+        parts = []
+        for name, s in self.stats().items():
+            parts.append(f"{name[:3]} {s['last_ms']:.0f}ms q{s['depth']}")
+        return " | ".join(parts)
+
+    # --- decision stage (caller's thread) ---
+
+    def run(self):
+        c = self.c
+        for stage in self.stages:
+            stage.start()
+        misses = 0
+        last_status = 0.0
+        try:
+            while c.running:
+                try:
+                    item = self.results.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                if not c.running:
+                    break
+                if isinstance(item, StageEnd):
+                    c._halt(item.reason)
+                    return
+
+                start = time.perf_counter()
+                if item.verdict:
+                    c.metrics.inc("matches")
+                    with c._click_lock:
+                        c.running = False
+                    c._notify(c.on_status_update, c._match_status())
+                    c._notify(c.on_match_found)
+                    return
+                if item.frame.timestamp < self.resume_at:
+                    # captured before the last click/retry settled
+                    self.dropped += 1
+                    continue
+                if self._retry_after is not None:
+                    if not item.changed and item.frame.timestamp < self._retry_after:
+                        continue
+                    self._retry_after = None
+
+                c.attempt_count += 1
+                c.metrics.inc("iterations")
+                c._notify(c.on_attempt_update, c.attempt_count)
+                try:
+                    found = c._find_and_click(item.frame.pixels)
+                except pyautogui.FailSafeException:
+                    c._halt("EMERGENCY STOP")
+                    return
+                if found:
+                    misses = 0
+                    self._pause_for(c.click_delay)
+                else:
+                    misses += 1
+                    if misses >= c.image_retry_max:
+                        c._halt(f"#{c.attempt_count} image not found after {misses} retries. stopping.")
+                        return
+                    c.metrics.inc("retries")
+                    if c.adaptive:
+                        self._retry_after = time.monotonic() + c.scan_rate.ceiling
+                    else:
+                        self._pause_for(c.retry_interval)
+                self.decide_latency.record(time.perf_counter() - start)
+
+                now = time.monotonic()
+                if now - last_status >= STATUS_INTERVAL:
+                    last_status = now
+                    c._notify(c.on_status_update, f"#{c.attempt_count} {self.status_line()}")
+            c._notify(c.on_status_update, "stopped")
+        finally:
+            self._stop.set()
+            c.wake()
+            for stage in self.stages:
+                stage.thread.join(timeout=1.0)
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Tuple
+
+from lazy import available, lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageEnhance = lazy_import("PIL.ImageEnhance")
+np = lazy_import("numpy", optional=True)
+cv2 = lazy_import("cv2", optional=True)
+
+CONTRAST = 2.0
+THRESHOLD = 128
+UPSCALE_MIN_W = 300
+UPSCALE_MIN_H = 50
+
+# Pillow's RGB -> L weights (ITU-R 601-2 luma, 16.16 fixed point)
+_L24 = (19595, 38470, 7471)
+
+
+def needs_upscale(w: int, h: int) -> bool:
+    return w < UPSCALE_MIN_W or h < UPSCALE_MIN_H
+
+
+def preprocess_pil(image: Image.Image, upscale: bool = True) -> Image.Image:
+    """Reference path: grayscale, contrast x2, 2x LANCZOS for small regions, threshold."""
+    gray = image.convert("L")
+    enhancer = ImageEnhance.Contrast(gray)
+    gray = enhancer.enhance(CONTRAST)
+
+    w, h = gray.size
+    if upscale and needs_upscale(w, h):
+        gray = gray.resize((w * 2, h * 2), Image.LANCZOS)
+
+    return gray.point(lambda x: 0 if x < THRESHOLD else 255, "1")
+
+
+class NumpyPreprocessor:
+    """Vectorized equivalent of `preprocess_pil` with per-shape buffer reuse.
+
+    Grayscale uses Pillow's fixed-point weights and contrast/threshold are
+    folded into one 256-entry lookup table built from the frame mean, so the
+    binarized output is bit-identical to the PIL path. The 2x LANCZOS upscale
+    for small regions is still done by Pillow to keep that guarantee; those
+    images are tiny, the large frames never take that branch.
+
+    Also takes a (h, w, 4) BGRX array, e.g. a view of a pooled capture
+    buffer, and reads the channels from it in place.
+
+    Not thread-safe: keep one instance per worker.
+    """
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        self._buffers: Dict[Tuple[int, int], tuple] = {}
+        self._levels = None  # built on first use so construction doesn't import numpy
+
+    def _get_buffers(self, h: int, w: int):
+        bufs = self._buffers.get((h, w))
+        if bufs is None:
+            bufs = (
+                np.empty((h, w), dtype=np.uint32),  # accumulator
+                np.empty((h, w), dtype=np.uint32),  # scratch
+                np.empty((h, w), dtype=np.uint8),   # gray
+                np.empty((h, w), dtype=np.bool_),   # binary
+            )
+            # a handful of region sizes at most; drop stale ones
+            if len(self._buffers) >= 4:
+                self._buffers.clear()
+            self._buffers[(h, w)] = bufs
+        return bufs
+
+    def _grayscale(self, arr, acc, tmp, gray, order=(0, 1, 2)):
+        r, g, b = order
+        np.multiply(arr[..., r], _L24[0], out=acc, dtype=np.uint32)
+        np.multiply(arr[..., g], _L24[1], out=tmp, dtype=np.uint32)
+        np.add(acc, tmp, out=acc)
+        np.multiply(arr[..., b], _L24[2], out=tmp, dtype=np.uint32)
+        np.add(acc, tmp, out=acc)
+        np.add(acc, 0x8000, out=acc)
+        np.right_shift(acc, 16, out=acc)
+        np.copyto(gray, acc, casting="unsafe")
+        return gray
+
+    def _contrast_lut(self, mean: int):
+        if self._levels is None:
+            self._levels = np.arange(256, dtype=np.float32)
+        # Image.blend(degenerate, image, factor) for factor > 1:
+        # float math, clamped to [0, 255], then truncated
+        lut = np.float32(mean) + np.float32(CONTRAST) * (self._levels - np.float32(mean))
+        return np.clip(lut, 0, 255).astype(np.uint8)
+
+    def gray(self, image):
+        if isinstance(image, np.ndarray):
+            if image.ndim == 2:
+                return image
+            h, w = image.shape[:2]
+            acc, tmp, gray, _ = self._get_buffers(h, w)
+            return self._grayscale(image, acc, tmp, gray, order=(2, 1, 0))
+        if image.mode == "L":
+            return np.asarray(image)
+        if image.mode not in ("RGB", "RGBA", "RGBX"):
+            image = image.convert("RGB")
+        arr = np.asarray(image)
+        h, w = arr.shape[:2]
+        acc, tmp, gray, _ = self._get_buffers(h, w)
+        return self._grayscale(arr, acc, tmp, gray)
+
+    def __call__(self, image, upscale: bool = True) -> Image.Image:
+        gray = self.gray(image)
+        h, w = gray.shape
+        mean = int(int(gray.sum(dtype=np.uint64)) / gray.size + 0.5)
+        contrast = self._contrast_lut(mean)
+
+        if upscale and needs_upscale(w, h):
+            enhanced = Image.fromarray(np.take(contrast, gray), "L")
+            enhanced = enhanced.resize((w * 2, h * 2), Image.LANCZOS)
+            return Image.fromarray(np.asarray(enhanced) >= THRESHOLD)
+
+        binary = self._get_buffers(h, w)[3]
+        np.take(contrast >= THRESHOLD, gray, out=binary)
+        return Image.fromarray(binary)
+
+
+def create_preprocessor() -> Callable[[Image.Image], Image.Image]:
+    # installed-only check: this runs at startup, before numpy is needed
+    if np is None:
+        return preprocess_pil
+    return NumpyPreprocessor()
+
+
+Box = Tuple[int, int, int, int]  # left, top, right, bottom
+
+BAND_ROW_NOISE = 0.002  # fraction of a row that may be ink and still count as blank
+BAND_MIN_GAP = 3        # blank rows needed to separate two bands
+BAND_PAD = 4
+
+
+def split_bands(binary: Image.Image) -> List[Box]:
+    """Full-width horizontal bands around runs of inked rows (text lines).
+
+    Cuts only fall on blank rows, so no text line is split. The background is
+    taken as the majority value, so dark-on-light and light-on-dark both work.
+    """
+    w, h = binary.size
+    if not available(np):
+        return [(0, 0, w, h)]
+    arr = np.asarray(binary)
+    background = np.count_nonzero(arr) * 2 >= arr.size
+    ink_per_row = np.count_nonzero(arr != background, axis=1)
+    rows = np.flatnonzero(ink_per_row > int(w * BAND_ROW_NOISE))
+    if rows.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(rows) > BAND_MIN_GAP)
+    starts = rows[np.concatenate(([0], breaks + 1))]
+    ends = rows[np.concatenate((breaks, [rows.size - 1]))]
+    return [(0, max(0, int(top) - BAND_PAD), w, min(h, int(bottom) + 1 + BAND_PAD))
+            for top, bottom in zip(starts, ends)]
+
+
+def split_strips(binary: Image.Image, count: int, min_height: int = 0) -> List[Box]:
+    """Up to `count` full-width strips of similar height that tile the image.
+
+    Each cut is placed midway through the blank gap between two text lines
+    (see `split_bands`), picking the gap nearest to an even split, so every
+    line lands whole in exactly one strip. Strips shorter than `min_height`
+    are not produced; a single strip is the whole image.
+    """
+    w, h = binary.size
+    if count <= 1 or h < 2 * max(1, min_height):
+        return [(0, 0, w, h)]
+    bands = split_bands(binary)
+    cuts = [(bottom + top) // 2 for (_, _, _, bottom), (_, top, _, _) in zip(bands, bands[1:])]
+    chosen: List[int] = []
+    for k in range(1, count):
+        target = h * k // count
+        last = chosen[-1] if chosen else 0
+        options = [c for c in cuts if c - last >= min_height and h - c >= min_height and c > last]
+        if not options:
+            break
+        cut = min(options, key=lambda c: abs(c - target))
+        if cut not in chosen:
+            chosen.append(cut)
+    edges = [0] + chosen + [h]
+    return [(0, top, w, bottom) for top, bottom in zip(edges, edges[1:])]
+
+
+BLOCK_KERNEL = (15, 3)    # dilation (w, h): joins letters into words and words into lines
+BLOCK_MIN_SIDE = 6
+BLOCK_PAD = 4
+
+
+def _reading_order(boxes: List[Box]) -> List[List[Box]]:
+    lines: List[List[Box]] = []
+    for box in sorted(boxes, key=lambda b: b[1]):
+        center = (box[1] + box[3]) / 2
+        if lines:
+            line = lines[-1]
+            top = min(b[1] for b in line)
+            bottom = max(b[3] for b in line)
+            if top <= center <= bottom:
+                line.append(box)
+                continue
+        lines.append([box])
+    return [sorted(line) for line in lines]
+
+
+def text_blocks_available() -> bool:
+    return available(cv2) and available(np)
+
+
+def find_text_blocks(binary: Image.Image) -> List[List[Box]]:
+    """Candidate text boxes from the thresholded image, grouped into lines.
+
+    Ink is dilated mostly horizontally so a word or line becomes one
+    connected component; tiny specks are dropped. Near-solid areas are kept,
+    since light text on a dark banner thresholds to one. Lines are ordered
+    top to bottom and boxes within a line left to right.
+    Without OpenCV the whole image is one block.
+    """
+    w, h = binary.size
+    if not text_blocks_available():
+        return [[(0, 0, w, h)]]
+    arr = np.asarray(binary)
+    background = np.count_nonzero(arr) * 2 >= arr.size
+    ink = (arr != background).astype(np.uint8)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, BLOCK_KERNEL)
+    joined = cv2.dilate(ink, kernel)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(joined, connectivity=8)
+
+    boxes: List[Box] = []
+    for i in range(1, count):
+        x, y, bw, bh, _ = stats[i]
+        if bw < BLOCK_MIN_SIDE or bh < BLOCK_MIN_SIDE:
+            continue
+        boxes.append((max(0, int(x) - BLOCK_PAD), max(0, int(y) - BLOCK_PAD),
+                      min(w, int(x + bw) + BLOCK_PAD), min(h, int(y + bh) + BLOCK_PAD)))
+
+    return _reading_order(boxes)
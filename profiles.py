@@ -0,0 +1,357 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, Optional
+
+from controller import (CHANGE_TOLERANCE, CLICK_DELAY, CLICK_NEEDLE, IMAGE_RETRY_INTERVAL, IMAGE_RETRY_MAX,
+                        TEXT_MAX_ERROR_RATIO)
+from lazy import lazy_import
+from matcher import MAX_PYRAMID_LEVELS, MIN_NEEDLE_SIDE, PreparedNeedle
+from ocr import ENGINES
+from ocr_daemon import parse_address
+from scheduler import WatchJob
+from textmatch import validate_targets
+
+Image = lazy_import("PIL.Image")
+np = lazy_import("numpy")
+
+PROFILE_VERSION = 1
+PROFILE_FILE = "profile.json"
+NEEDLE_DIR = "needles"
+# derived needle data (grayscale + pyramid levels as .npy), keyed by a hash of
+# the needle PNG and of everything below; bump when the derivation changes
+# (2 held BGR levels)
+ARTIFACT_VERSION = 3
+ARTIFACT_DIR = "cache"
+OCR_LAYOUTS = ("auto", "full", "bands", "blocks", "strips")
+OCR_BACKENDS = ("auto", "daemon", *ENGINES)
+
+# profile key -> (controller attribute, type)
+_SETTINGS = {
+    "click_delay": ("click_delay", float),
+    "retry_interval": ("retry_interval", float),
+    "retry_max": ("image_retry_max", int),
+    "max_error_ratio": ("text_max_error_ratio", float),
+    "adaptive": ("adaptive", bool),
+    "pipelined": ("pipelined", bool),
+    "tiered": ("tiered", bool),
+    "ocr_layout": ("ocr_layout", str),
+    "ocr_workers": ("strip_workers", int),
+}
+
+
+class ProfileError(ValueError):
+    pass
+
+
+def load_profile(path: str) -> Dict[str, Any]:
+    """Read and validate a JSON profile (a file, or a directory written by
+    `save_profile`).
+
+        {"version": 1, "region": [x, y, w, h], "needle": "button.png",
+         "targets": ["강화 성공", "골드 부족"], "click_delay": 3.0, ...}
+
+    `needle` is resolved relative to the profile file. `scale` is optional;
+    without it the display scale is detected at startup. Further click
+    targets go in `needles`, tried after `needle` in list order unless a
+    `priority` (lower first) is given:
+
+        "needles": [{"image": "retry.png", "confidence": 0.9},
+                    {"image": "ok.png", "name": "ok", "priority": 5}]
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, PROFILE_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ProfileError(f"cannot read profile {path}: {e}") from e
+    if not isinstance(profile, dict):
+        raise ProfileError("profile must be a JSON object")
+    if profile.get("version", PROFILE_VERSION) != PROFILE_VERSION:
+        raise ProfileError(f"unsupported profile version: {profile.get('version')}")
+
+    region = profile.get("region")
+    if (not isinstance(region, list) or len(region) != 4
+            or not all(isinstance(v, int) for v in region) or region[2] <= 0 or region[3] <= 0):
+        raise ProfileError("region must be [x, y, width, height] in screen pixels")
+
+    targets = profile.get("targets")
+    if isinstance(targets, str):
+        targets = [targets]
+    if not isinstance(targets, list) or not any(isinstance(t, str) and t.strip() for t in targets):
+        raise ProfileError("targets must be a non-empty list of texts")
+    profile["targets"] = [t for t in targets if isinstance(t, str) and t.strip()]
+    try:
+        validate_targets(profile["targets"])
+    except ValueError as e:
+        raise ProfileError(str(e)) from e
+
+    base = os.path.dirname(os.path.abspath(path))
+    needle = profile.get("needle")
+    needles = profile.get("needles", [])
+    if not isinstance(needles, list):
+        raise ProfileError("needles must be a list")
+    if isinstance(needle, str):
+        profile["needle"] = os.path.join(base, needle)
+    elif needle is not None or not needles:
+        raise ProfileError("needle must be the path of the click image")
+    for i, entry in enumerate(needles):
+        if isinstance(entry, str):
+            entry = {"image": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("image"), str):
+            raise ProfileError(f"needles[{i}] must be an image path or {{\"image\": path, ...}}")
+        if not isinstance(entry.get("confidence", 0.0), (int, float)):
+            raise ProfileError(f"needles[{i}].confidence must be a number")
+        if not isinstance(entry.get("priority", 0), int):
+            raise ProfileError(f"needles[{i}].priority must be an integer")
+        needles[i] = dict(entry, image=os.path.join(base, entry["image"]),
+                          name=str(entry.get("name") or os.path.splitext(os.path.basename(entry["image"]))[0]))
+    profile["needles"] = needles
+
+    for key, (_, kind) in _SETTINGS.items():
+        if key in profile and not isinstance(profile[key], (int, float) if kind is float else kind):
+            raise ProfileError(f"{key} must be {kind.__name__}")
+    if "scale" in profile and not isinstance(profile["scale"], (int, float)):
+        raise ProfileError("scale must be a number")
+    for key in ("ocr_backend", "ocr_daemon"):
+        if key in profile and not isinstance(profile[key], str):
+            raise ProfileError(f"{key} must be a string")
+    if profile.get("ocr_backend", "auto") not in OCR_BACKENDS:
+        raise ProfileError(f"ocr_backend must be one of {', '.join(OCR_BACKENDS)}")
+    if "ocr_daemon" in profile:
+        try:
+            parse_address(profile["ocr_daemon"])
+        except ValueError as e:
+            raise ProfileError(f"ocr_daemon: {e}") from e
+    if profile.get("ocr_layout", "auto") not in OCR_LAYOUTS:
+        raise ProfileError(f"ocr_layout must be one of {', '.join(OCR_LAYOUTS)}")
+    cache = profile.get("cache")
+    if cache is not None and not isinstance(cache, str):
+        raise ProfileError("cache must be a directory path")
+    profile["cache"] = os.path.join(base, cache) if cache else None
+    return profile
+
+
+# --- derived needle artifacts ---
+
+def _artifact_key(image_path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"v{ARTIFACT_VERSION}:levels={MAX_PYRAMID_LEVELS}:min={MIN_NEEDLE_SIDE}:".encode())
+    with open(image_path, "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def _read_index(cache_dir: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(cache_dir, "index.json"), "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") != ARTIFACT_VERSION:
+        return {}
+    return index.get("needles", {})
+
+
+def _write_index(cache_dir: str, entries: Dict[str, Any]):
+    tmp = os.path.join(cache_dir, f"index.json.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": ARTIFACT_VERSION, "needles": entries}, f, indent=1)
+    os.replace(tmp, os.path.join(cache_dir, "index.json"))
+
+
+def _load_artifacts(cache_dir: str, index: Dict[str, Any], key: str) -> Optional[PreparedNeedle]:
+    """Memory-mapped pyramid for `key`, or None when missing or damaged."""
+    entry = index.get(key)
+    if not entry:
+        return None
+    try:
+        levels = [np.load(os.path.join(cache_dir, f"{key}.{i}.npy"), mmap_mode="r")
+                  for i in range(len(entry["shapes"]))]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if [list(level.shape) for level in levels] != entry["shapes"]:
+        return None
+    return PreparedNeedle.from_pyramid(levels)
+
+
+def _intact(path: str, shape) -> bool:
+    try:
+        existing = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return False  # missing, or truncated by an interrupted write
+    return existing.shape == tuple(shape)
+
+
+def _save_artifacts(cache_dir: str, key: str, prepared: PreparedNeedle) -> Dict[str, Any]:
+    for i, level in enumerate(prepared.pyramid):
+        path = os.path.join(cache_dir, f"{key}.{i}.npy")
+        # content-addressed: an intact file is already right (and may be mapped)
+        if _intact(path, level.shape):
+            continue
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(level))
+        os.replace(tmp, path)
+    return {"shapes": [list(level.shape) for level in prepared.pyramid]}
+
+
+def _prune_artifacts(cache_dir: str, keep: Dict[str, Any]):
+    for name in os.listdir(cache_dir):
+        if name.endswith(".npy") and name.split(".", 1)[0] not in keep:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass  # still mapped by a running controller (Windows)
+
+
+# --- apply / save ---
+
+
+def _open_image(path: str) -> Image.Image:
+    try:
+        image = Image.open(path)
+        image.load()
+    except OSError as e:
+        raise ProfileError(f"cannot load needle image {path}: {e}") from e
+    return image
+
+
+def apply_profile(controller, profile: Dict[str, Any]):
+    """Configure `controller` from a loaded profile.
+
+    With a `cache` directory the needles' grayscale and pyramid levels are
+    memory-mapped from .npy files instead of being computed; entries whose
+    PNG changed since they were written are rebuilt (and written back when
+    the directory is writable).
+    """
+    cache_dir = profile.get("cache")
+    index = _read_index(cache_dir) if cache_dir else {}
+    updated = False
+
+    def add(name: str, path: str, **kwargs):
+        nonlocal updated
+        image = _open_image(path)
+        prepared = None
+        if cache_dir:
+            key = _artifact_key(path)
+            prepared = _load_artifacts(cache_dir, index, key)
+            if prepared is None:
+                prepared = PreparedNeedle(image)
+                try:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    index[key] = _save_artifacts(cache_dir, key, prepared)
+                    updated = True
+                except OSError:
+                    pass  # read-only profile: just slower next time
+        controller.add_needle(name, image, prepared=prepared, **kwargs)
+
+    controller.result_region = tuple(profile["region"])
+    controller.needles.clear()
+    if profile.get("needle") is not None:
+        add(CLICK_NEEDLE, profile["needle"], priority=0)
+    for entry in profile.get("needles", []):
+        add(entry["name"], entry["image"], **{k: entry[k] for k in ("confidence", "priority") if k in entry})
+    if updated:
+        try:
+            _write_index(cache_dir, index)
+        except OSError:
+            pass
+    controller.target_texts = list(profile["targets"])
+    # a profile without a scale keeps the detected one
+    controller.explicit_scale = profile.get("scale")
+    if controller.explicit_scale is not None:
+        controller.scale = float(controller.explicit_scale)
+    if "ocr_backend" in profile or "ocr_daemon" in profile:
+        controller.set_ocr_backend(profile.get("ocr_backend", controller.ocr_backend),
+                                   profile.get("ocr_daemon"))
+    for key, (attr, kind) in _SETTINGS.items():
+        if key in profile:
+            setattr(controller, attr, kind(profile[key]))
+
+
+def make_job(profile: Dict[str, Any], name: str) -> WatchJob:
+    """A JobScheduler job from a loaded profile: its region, targets and
+    delays, and its click image (`needle`, else the first of `needles`)."""
+    needle: Dict[str, Any] = {"image": profile["needle"]} if profile.get("needle") else profile["needles"][0]
+    kwargs = {"confidence": needle["confidence"]} if "confidence" in needle else {}
+    return WatchJob(name, tuple(profile["region"]), _open_image(needle["image"]), profile["targets"],
+                    interval=float(profile.get("retry_interval", IMAGE_RETRY_INTERVAL)),
+                    click_delay=float(profile.get("click_delay", CLICK_DELAY)),
+                    retry_max=int(profile.get("retry_max", IMAGE_RETRY_MAX)),
+                    change_tolerance=CHANGE_TOLERANCE,
+                    max_error_ratio=float(profile.get("max_error_ratio", TEXT_MAX_ERROR_RATIO)), **kwargs)
+
+
+def _file_name(name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", name).strip("._") or "needle"
+
+
+def save_profile(controller, directory: str) -> str:
+    """Write `controller`'s setup to `directory` as profile.json, one PNG per
+    needle and the needle artifact cache; returns the profile.json path."""
+    if controller.result_region is None:
+        raise ProfileError("set the region first")
+    if not controller.target_texts:
+        raise ProfileError("set the target text first")
+    if not len(controller.needles):
+        raise ProfileError("capture a click image first")
+
+    needle_dir = os.path.join(directory, NEEDLE_DIR)
+    cache_dir = os.path.join(directory, ARTIFACT_DIR)
+    os.makedirs(needle_dir, exist_ok=True)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    profile: Dict[str, Any] = {
+        "version": PROFILE_VERSION,
+        "region": [int(v) for v in controller.result_region],
+        "targets": list(controller.target_texts),
+        "ocr_backend": controller.ocr_backend,
+        "cache": ARTIFACT_DIR,
+    }
+    # only a scale that was set explicitly: the detected one belongs to this
+    # machine's display and is measured again wherever the profile is loaded
+    if controller.explicit_scale is not None:
+        profile["scale"] = controller.explicit_scale
+    if controller.ocr_daemon_address:
+        profile["ocr_daemon"] = controller.ocr_daemon_address
+    for key, (attr, _) in _SETTINGS.items():
+        value = getattr(controller, attr)
+        if value is not None:
+            profile[key] = value
+
+    entries: Dict[str, Any] = {}
+    extra = []
+    used = set()
+    for needle in controller.needles:
+        file_name = _file_name(needle.name)
+        while file_name in used:
+            file_name += "_"
+        used.add(file_name)
+        rel = f"{NEEDLE_DIR}/{file_name}.png"
+        path = os.path.join(directory, rel)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        needle.image.save(tmp, "PNG")
+        os.replace(tmp, path)
+        key = _artifact_key(path)
+        entries[key] = _save_artifacts(cache_dir, key, needle.matcher.needle)
+        if needle.name == CLICK_NEEDLE:
+            profile["needle"] = rel
+        else:
+            extra.append({"image": rel, "name": needle.name,
+                          "confidence": needle.confidence, "priority": needle.priority})
+    if extra:
+        profile["needles"] = extra
+
+    _write_index(cache_dir, entries)
+    _prune_artifacts(cache_dir, entries)
+    path = os.path.join(directory, PROFILE_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return path
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, List, Optional, Sequence, Union
+
+from frames import ChangeDetector, FrameSource, FrameSourceExhausted, Region, crop_region
+from inputs import InputSink
+from matcher import MATCH_CONFIDENCE, TemplateMatcher
+from metrics import LatencyStats
+from ocr import DEFAULT_CONFIG, DEFAULT_LANG, OcrCache, create_engine
+from preprocess import create_preprocessor
+from textmatch import TextHit, TextMatcher
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+IDLE_WAIT_MAX = 0.05
+
+
+class WatchJob:
+    """One watch/click macro: region, needle, stop texts and its own scan rate."""
+
+    def __init__(self, name: str, region: Region, needle: Image.Image,
+                 targets: Union[str, Sequence[str]], interval: float = 1.0,
+                 click_delay: Optional[float] = None,
+                 confidence: float = MATCH_CONFIDENCE, retry_max: int = 10,
+                 change_tolerance: float = 0.0, max_error_ratio: float = 0.0):
+        self.name = name
+        self.region = region
+        self.targets = [targets] if isinstance(targets, str) else list(targets)
+        self.interval = interval
+        self.click_delay = interval if click_delay is None else click_delay
+        self.retry_max = retry_max
+        self.matcher = TemplateMatcher(needle, confidence, tracking=True)
+        self.change_detector = ChangeDetector(change_tolerance)
+
+        self.next_due = 0.0
+        self.busy = False
+        self.done = False
+        self.status = "waiting"
+        self.scans = 0
+        self.clicks = 0
+        self.misses = 0
+        self.ocr_skips = 0
+        self.last_text = ""
+        self.last_verdict = False
+        self.last_hit: Optional[TextHit] = None
+        self.text_matcher = TextMatcher(self.targets, max_error_ratio)
+
+    def text_matches(self, text: str) -> bool:
+        self.last_hit = self.text_matcher.match(text)
+        return self.last_hit is not None
+
+
+class JobScheduler:
+    """Runs many WatchJobs off one shared capture per tick.
+
+    Each tick grabs the bounding box of every job that is due (the full screen
+    when jobs are spread out), crops each job's region from that frame and
+    hands it to a shared worker pool for change detection, OCR and needle
+    search. Clicks from all jobs go through a single input queue so they
+    never interleave.
+    """
+
+    def __init__(self, source: FrameSource, input_sink: InputSink, scale: float = 1.0,
+                 workers: Optional[int] = None, ocr_backend: str = "auto",
+                 ocr_lang: str = DEFAULT_LANG, ocr_config: str = DEFAULT_CONFIG,
+                 ocr_daemon_address: Optional[str] = None,
+                 on_event: Optional[Callable[[WatchJob, str, str], None]] = None):
+        self.source = source
+        self.input_sink = input_sink
+        self.scale = scale
+        self.workers = workers or os.cpu_count() or 2
+        self.ocr_backend = ocr_backend
+        self.ocr_lang = ocr_lang
+        self.ocr_config = ocr_config
+        self.ocr_daemon_address = ocr_daemon_address
+        self.on_event = on_event
+        self.jobs: List[WatchJob] = []
+        self.ocr_cache = OcrCache()
+        self.running = False
+
+        self.ticks = 0
+        self.captures = 0
+        self.capture_latency = LatencyStats()
+        self.scan_latency = LatencyStats()
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._clicks: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._engines = []
+
+    def add_job(self, job: WatchJob):
+        with self._lock:
+            self.jobs.append(job)
+        self._wake.set()
+
+    def _emit(self, job: WatchJob, kind: str, detail: str = ""):
+        if self.on_event:
+            self.on_event(job, kind, detail)
+
+    # --- per-worker resources ---
+
+    def _worker_state(self):
+        local = self._local
+        if not hasattr(local, "engine"):
+            local.engine = create_engine(self.ocr_backend, self.ocr_lang, self.ocr_config,
+                                         self.ocr_daemon_address)
+            local.preprocess = create_preprocessor()
+            with self._lock:
+                self._engines.append(local.engine)
+        return local
+
+    def _recognize(self, image: Image.Image) -> str:
+        state = self._worker_state()
+        binary = state.preprocess(image)
+        key = OcrCache.key(binary, self.ocr_lang, self.ocr_config)
+        text = self.ocr_cache.get(key)
+        if text is None:
+            text = state.engine.recognize(binary).strip()
+            self.ocr_cache.put(key, text)
+        return text
+
+    # --- job work (pool threads) ---
+
+    def _scan(self, job: WatchJob, image: Image.Image):
+        start = time.perf_counter()
+        try:
+            job.scans += 1
+            if job.change_detector.changed(image):
+                job.last_text = self._recognize(image)
+                job.last_verdict = job.text_matches(job.last_text)
+                self._emit(job, "ocr", job.last_text)
+            else:
+                job.ocr_skips += 1
+
+            if job.last_verdict:
+                job.done = True
+                job.status = "matched"
+                self._emit(job, "match", job.last_hit.target if job.last_hit else job.last_text)
+                return
+
+            match = job.matcher.locate(image)
+            if match is None:
+                job.misses += 1
+                if job.misses >= job.retry_max:
+                    job.done = True
+                    job.status = "image not found"
+                    self._emit(job, "stopped", job.status)
+                job.next_due = time.monotonic() + job.interval
+                return
+
+            job.misses = 0
+            cx, cy = match.center
+            x, y, _, _ = job.region
+            self._clicks.put((job, x + cx / self.scale, y + cy / self.scale))
+            job.next_due = time.monotonic() + job.click_delay
+        except Exception as e:
+            job.done = True
+            job.status = f"error: {e}"
+            self._emit(job, "stopped", job.status)
+        finally:
+            self.scan_latency.record(time.perf_counter() - start)
+            job.busy = False
+            self._wake.set()
+
+    def _click_loop(self):
+        while True:
+            item = self._clicks.get()
+            if item is None:
+                return
+            job, x, y = item
+            with self._lock:
+                if not self.running or job.done:
+                    continue
+                self.input_sink.click(x, y)
+            job.clicks += 1
+            self._emit(job, "click", f"{x:.0f},{y:.0f}")
+
+    # --- tick loop (caller's thread) ---
+
+    @staticmethod
+    def _union(regions: List[Region]) -> Region:
+        x0 = min(r[0] for r in regions)
+        y0 = min(r[1] for r in regions)
+        x1 = max(r[0] + r[2] for r in regions)
+        y1 = max(r[1] + r[3] for r in regions)
+        return x0, y0, x1 - x0, y1 - y0
+
+    def run(self, duration: Optional[float] = None):
+        self.running = True
+        deadline = time.monotonic() + duration if duration else None
+        clicker = threading.Thread(target=self._click_loop, name="cyclops-clicks", daemon=True)
+        clicker.start()
+        pool = ThreadPoolExecutor(self.workers, thread_name_prefix="cyclops-ocr")
+        try:
+            while self.running:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    break
+                with self._lock:
+                    jobs = [j for j in self.jobs if not j.done]
+                if not jobs:
+                    break
+                due = [j for j in jobs if not j.busy and now >= j.next_due]
+                if not due:
+                    waits = [j.next_due - now for j in jobs if not j.busy]
+                    self._wake.wait(min([IDLE_WAIT_MAX] + waits))
+                    self._wake.clear()
+                    continue
+
+                union = self._union([j.region for j in due])
+                start = time.perf_counter()
+                try:
+                    frame = self.source.grab(union)
+                except FrameSourceExhausted:
+                    break
+                self.capture_latency.record(time.perf_counter() - start)
+                self.captures += 1
+                self.ticks += 1
+                for job in due:
+                    job.busy = True
+                    pool.submit(self._scan, job, crop_region(frame, union, job.region))
+        finally:
+            self.running = False
+            pool.shutdown(wait=True)
+            self._clicks.put(None)
+            clicker.join(timeout=1.0)
+            with self._lock:
+                engines, self._engines = self._engines, []
+            for engine in engines:
+                engine.close()
+
+    def stop(self):
+        with self._lock:
+            self.running = False
+        self._wake.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self.jobs)
+        return {
+            "jobs": len(jobs),
+            "active": sum(1 for j in jobs if not j.done),
+            "ticks": self.ticks,
+            "captures": self.captures,
+            "scans": sum(j.scans for j in jobs),
+            "ocr_skips": sum(j.ocr_skips for j in jobs),
+            "clicks": sum(j.clicks for j in jobs),
+            "capture": self.capture_latency.summary(),
+            "scan": self.scan_latency.summary(),
+            "ocr_cache": self.ocr_cache.stats(),
+        }
@@ -0,0 +1,114 @@
+import gc
+
+import pytest
+
+import capture
+from capture import BufferPool, CaptureBackend, RawFrame, get_backend
+
+
+def _grab(pool, nbytes=16):
+    return pool.attach(RawFrame(pool.acquire(nbytes), 2, 2))
+
+
+def test_buffer_is_reused_only_after_its_frame_is_gone():
+    pool = BufferPool()
+    first = _grab(pool)
+    second = _grab(pool)
+    assert second.data is not first.data  # first is still alive
+
+    data = first.data
+    del first
+    gc.collect()
+    third = _grab(pool)
+    assert third.data is data
+    assert pool.stats()["allocations"] == 2 and pool.stats()["reuses"] == 1
+    assert second.data is not third.data
+
+
+def test_live_frames_never_share_a_buffer():
+    pool = BufferPool(max_buffers=4)
+    frames = []
+    for i in range(50):
+        frames.append(_grab(pool))
+        if i % 3 == 0:
+            frames.pop(0)
+    assert len({id(f.data) for f in frames}) == len(frames)
+
+
+def test_size_change_drops_free_buffers():
+    pool = BufferPool()
+    frame = _grab(pool, 16)
+    del frame
+    gc.collect()
+    assert pool.stats()["free"] == 1
+    big = _grab(pool, 32)
+    assert len(big.data) == 32
+    assert pool.stats()["free"] == 0
+    assert pool.stats()["allocations"] == 2
+
+
+def test_free_list_is_capped():
+    pool = BufferPool(max_buffers=2)
+    frames = [_grab(pool) for _ in range(5)]
+    del frames
+    gc.collect()
+    assert pool.stats()["free"] == 2
+    assert pool.stats()["dropped"] == 3
+
+
+def test_release_returns_an_unattached_buffer():
+    pool = BufferPool()
+    buf = pool.acquire(16)
+    pool.release(buf)
+    assert pool.acquire(16) is buf
+
+
+def test_array_view_of_padded_rows():
+    np = pytest.importorskip("numpy")
+    # 2x2 BGRX pixels with 4 bytes of row padding
+    data = bytearray(range(24))
+    frame = RawFrame(data, 2, 2, "BGRX", stride=12)
+    view = frame.array()
+    assert view.shape == (2, 2, 4)
+    assert view[1, 0].tolist() == [12, 13, 14, 15]
+    data[12] = 99
+    assert view[1, 0, 0] == 99  # a view, not a copy
+    assert np.shares_memory(view, np.frombuffer(data, np.uint8))
+
+
+def test_to_image_reorders_bgrx_and_skips_padding():
+    pytest.importorskip("PIL.Image")
+    # 2x2: blue, green / red, white; 4 bytes of row padding
+    data = bytes([255, 0, 0, 0, 0, 255, 0, 0, 9, 9, 9, 9,
+                  0, 0, 255, 0, 255, 255, 255, 0, 9, 9, 9, 9])
+    image = RawFrame(data, 2, 2, "BGRX", stride=12).to_image()
+    assert image.mode == "RGB"
+    assert list(image.getdata()) == [(0, 0, 255), (0, 255, 0), (255, 0, 0), (255, 255, 255)]
+
+
+class _Unavailable(CaptureBackend):
+    def __init__(self):
+        raise RuntimeError("no display")
+
+
+class _Working(CaptureBackend):
+    name = "working"
+
+
+def test_auto_picks_the_first_backend_that_starts(monkeypatch):
+    monkeypatch.setattr(capture, "BACKENDS", {"x11": _Unavailable, "working": _Working})
+    monkeypatch.setattr(capture, "AUTO_ORDER", ("x11", "working"))
+    monkeypatch.setattr(capture, "_backends", {})
+    backend = get_backend()
+    assert backend.name == "working"
+    assert get_backend("auto") is backend  # shared, not started again
+    with pytest.raises(ValueError, match="unknown capture backend"):
+        get_backend("dxcam")
+
+
+def test_no_capture_backend(monkeypatch):
+    monkeypatch.setattr(capture, "BACKENDS", {"x11": _Unavailable})
+    monkeypatch.setattr(capture, "AUTO_ORDER", ("x11",))
+    monkeypatch.setattr(capture, "_backends", {})
+    with pytest.raises(RuntimeError, match="no display"):
+        get_backend()
@@ -0,0 +1,22 @@
+import io
+import json
+
+import cli
+
+
+def test_events_are_json_lines():
+    stream = io.StringIO()
+    emit = cli.EventWriter(stream)
+    emit("ready", targets=["강화 성공"])
+    emit("click", x=1.5, y=2)
+    first, second = (json.loads(line) for line in stream.getvalue().splitlines())
+    assert first["event"] == "ready" and first["targets"] == ["강화 성공"]
+    assert second == {"t": second["t"], "event": "click", "x": 1.5, "y": 2}
+    assert 0 <= first["t"] <= second["t"]
+    assert "강화" in stream.getvalue()  # not \u-escaped
+
+
+def test_unreadable_profile_is_an_error_event(tmp_path, capsys):
+    assert cli.main([str(tmp_path / "missing.json")]) == 2
+    event = json.loads(capsys.readouterr().out)
+    assert event["event"] == "error" and "cannot read profile" in event["message"]
@@ -0,0 +1,212 @@
+import random
+import threading
+import time
+
+import pytest
+
+from controller import MacroController
+from frames import FrameSource
+from inputs import LoggingSink
+from ocr import OcrCache, OcrEngine
+
+REGION = (100, 50, 200, 120)
+NEEDLE_AT = (90, 60)
+
+
+class _Screens(FrameSource):
+    """Serves `screens` in turn, then repeats the last one."""
+
+    def __init__(self, screens):
+        self.screens = screens
+        self.grabs = 0
+
+    def grab(self, region):
+        image = self.screens[min(self.grabs, len(self.screens) - 1)]
+        self.grabs += 1
+        return image
+
+
+class _Reader(OcrEngine):
+    """Reads `texts` in turn, one per OCR call, then repeats the last one."""
+
+    name = "scripted"
+
+    def __init__(self, texts):
+        super().__init__()
+        self.texts = list(texts)
+        self.calls = 0
+
+    def _recognize(self, image):
+        text = self.texts[min(self.calls, len(self.texts) - 1)]
+        self.calls += 1
+        return text
+
+
+class _StopAfter(LoggingSink):
+    """Ends the run after `limit` clicks (stop() itself would wait for the click lock)."""
+
+    def __init__(self, controller, limit):
+        super().__init__()
+        self.controller = controller
+        self.limit = limit
+
+    def click(self, x, y):
+        super().click(x, y)
+        if len(self.clicks) >= self.limit:
+            self.controller.running = False
+
+
+def _needle(Image):
+    rng = random.Random(3)
+    return Image.frombytes("RGB", (20, 20), bytes(rng.randrange(256) for _ in range(20 * 20 * 3)))
+
+
+def _screens(Image, needle, count, with_needle=True):
+    """`count` different screens (a marker moves along the top edge)."""
+    screens = []
+    for i in range(count):
+        screen = Image.new("RGB", REGION[2:], (230, 230, 230))
+        screen.paste((20, 20, 20), (5 + 6 * i, 5, 9 + 6 * i, 9))
+        if with_needle:
+            screen.paste(needle, NEEDLE_AT)
+        screens.append(screen)
+    return screens
+
+
+def _controller(screens, texts, needle):
+    controller = MacroController(1.0)
+    controller.ocr_cache = OcrCache()
+    controller._ocr_engine = _Reader(texts)
+    controller.frame_source = _Screens(screens)
+    controller.input_sink = LoggingSink()
+    controller.result_region = REGION
+    controller.click_image = needle
+    controller.target_texts = ["SUCCESS"]
+    controller.click_delay = 0.0
+    controller.retry_interval = 0.0
+    return controller
+
+
+def _deps():
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+    return Image
+
+
+def test_one_capture_per_iteration():
+    Image = _deps()
+    needle = _needle(Image)
+    controller = _controller(_screens(Image, needle, 3), ["loading", "loading", "SUCCESS"], needle)
+    matched = []
+    controller.on_match_found = lambda: matched.append(controller.attempt_count)
+    controller.run()
+
+    assert matched == [3]
+    # OCR and the needle search of an iteration share its capture
+    assert controller.frame_source.grabs == 3
+    assert controller._ocr_engine.calls == 3
+    center = (REGION[0] + NEEDLE_AT[0] + 10, REGION[1] + NEEDLE_AT[1] + 10)
+    assert [(x, y) for _, x, y in controller.input_sink.clicks] == [center, center]
+
+
+def test_unchanged_region_is_not_read_again():
+    Image = _deps()
+    needle = _needle(Image)
+    controller = _controller(_screens(Image, needle, 1), ["loading"], needle)
+    controller.input_sink = _StopAfter(controller, 3)
+    controller.run()
+
+    assert len(controller.input_sink.clicks) == 3
+    assert controller.frame_source.grabs == 3
+    assert controller._ocr_engine.calls == 1
+    assert controller.ocr_skip_count == 2
+
+
+def test_pipelined_run_waits_out_the_click_delay():
+    Image = _deps()
+    needle = _needle(Image)
+    controller = _controller(_screens(Image, needle, 3), ["loading", "loading", "SUCCESS"], needle)
+    controller.pipelined = True
+    controller.click_delay = 0.2
+    matched = []
+    controller.on_match_found = lambda: matched.append(True)
+    controller.run()
+
+    assert matched == [True]
+    clicks = [t for t, _, _ in controller.input_sink.clicks]
+    assert 1 <= len(clicks) <= 2
+    assert all(b - a >= 0.2 for a, b in zip(clicks, clicks[1:]))
+
+
+def test_target_text_setter_validates_and_matches():
+    controller = MacroController(1.0)
+    controller.target_text = r"강화 성공; re:\d+ gold"
+    with pytest.raises(ValueError, match="invalid regex"):
+        controller.target_text = "re:("
+    assert controller.target_texts == ["강화 성공", r"re:\d+ gold"]
+
+    assert controller._check_match("you have 300 gold") and controller.last_text_hit.kind == "regex"
+    assert not controller._check_match("강화 실패")
+    controller.text_max_error_ratio = 0.25
+    assert controller._check_match("강화 성곰!") and controller.last_text_hit.kind == "fuzzy"
+
+
+def test_cheap_pass_failure_turns_tiers_off():
+    controller = MacroController(1.0)
+    controller.tiered = True
+    controller.target_texts = ["SUCCESS"]
+    controller.tiers.error = RuntimeError("Failed loading language 'eng'")
+    assert not controller._tiers_ready()
+    assert not controller.tiered
+
+
+def test_stop_ends_a_wait_at_once():
+    controller = MacroController(1.0)
+    controller.running = True
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(controller._interruptible_sleep(30.0)))
+    waiter.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    controller.stop()
+    waiter.join(1.0)
+    assert result == [False]
+    assert time.monotonic() - start < 0.5
+
+
+def test_wait_lasts_its_delay():
+    controller = MacroController(1.0)
+    controller.running = True
+    start = time.monotonic()
+    assert controller._interruptible_sleep(0.1)
+    assert 0.1 <= time.monotonic() - start < 0.5
+
+
+def test_adaptive_mode_keeps_the_click_delay():
+    Image = _deps()
+    needle = _needle(Image)
+    # every capture differs, so a change-driven wait would end at once
+    controller = _controller(_screens(Image, needle, 50), ["loading"], needle)
+    controller.adaptive = True
+    controller.click_delay = 0.3
+    controller.input_sink = _StopAfter(controller, 2)
+    controller.run()
+
+    (first, _, _), (second, _, _) = controller.input_sink.clicks
+    assert second - first >= 0.3
+
+
+def test_adaptive_retry_starts_on_a_change():
+    Image = _deps()
+    needle = _needle(Image)
+    screens = _screens(Image, needle, 1, with_needle=False) + _screens(Image, needle, 3)[1:]
+    controller = _controller(screens, ["loading"], needle)
+    controller.adaptive = True
+    controller.retry_interval = 5.0  # not used in adaptive mode
+    controller.input_sink = _StopAfter(controller, 1)
+    start = time.monotonic()
+    controller.run()
+
+    assert len(controller.input_sink.clicks) == 1
+    assert controller.input_sink.clicks[0][0] - start < 1.0
@@ -0,0 +1,137 @@
+import pytest
+
+from frames import (AdaptiveRate, ChangeDetector, FramePipeline, FrameSource, FrameSourceExhausted,
+                    RecordedFrameSource, RecordingFrameSource, crop_region)
+
+
+class _Grabber:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, region):
+        self.calls += 1
+        return f"capture {self.calls}"
+
+
+def test_pipeline_reuses_current_frame_until_invalidated():
+    grab = _Grabber()
+    frames = FramePipeline(grab)
+    region = (0, 0, 10, 10)
+    first = frames.fresh(region)
+    assert frames.current(region) is first
+    assert frames.current((0, 0, 20, 20)) is not first  # other region: new capture
+    frames.invalidate()
+    assert frames.current(region).image == "capture 3"
+    assert frames.capture_count == grab.calls == 3
+
+
+def test_adaptive_rate_backs_off_and_resets():
+    rate = AdaptiveRate(floor=0.1, ceiling=0.8, backoff=2.0)
+    assert [rate.observe(False) for _ in range(4)] == [0.2, 0.4, 0.8, 0.8]
+    assert rate.observe(True) == 0.1
+
+
+def test_digest_only_by_default():
+    Image = pytest.importorskip("PIL.Image")
+    detector = ChangeDetector()
+    image = Image.new("RGB", (64, 32), (200, 200, 200))
+    assert detector.changed(image)
+    assert not detector.changed(image.copy())
+    image.putpixel((5, 5), (201, 200, 200))
+    assert detector.changed(image)
+
+
+def _array_screen(np, w=1920, h=1080):
+    screen = np.full((h, w, 4), 230, np.uint8)
+    screen[..., 3] = 0
+    return screen
+
+
+def test_small_word_in_large_region_is_a_change():
+    np = pytest.importorskip("numpy")
+    detector = ChangeDetector(tolerance=4.0)
+    screen = _array_screen(np)
+    assert detector.changed(screen)
+    screen = screen.copy()
+    screen[500:512, 900:930, :3] = 20  # a short dark word
+    assert detector.changed(screen)
+
+
+def test_noise_below_tolerance_is_not_a_change():
+    np = pytest.importorskip("numpy")
+    detector = ChangeDetector(tolerance=4.0)
+    screen = _array_screen(np)
+    assert detector.changed(screen)
+    noisy = screen.copy()
+    noisy[::3, ::5, :3] += 3
+    assert not detector.changed(noisy)
+
+
+def test_drift_is_measured_from_last_change():
+    np = pytest.importorskip("numpy")
+    detector = ChangeDetector(tolerance=4.0)
+    screen = _array_screen(np, 64, 64)
+    assert detector.changed(screen)
+    seen = []
+    for step in range(1, 4):
+        frame = screen.copy()
+        frame[..., :3] += 2 * step
+        seen.append(detector.changed(frame))
+    assert seen == [False, False, True]
+
+
+def test_reference_survives_buffer_reuse():
+    np = pytest.importorskip("numpy")
+    detector = ChangeDetector(tolerance=4.0)
+    buffer = _array_screen(np, 64, 64)
+    assert detector.changed(buffer)
+    buffer[10:20, 10:20, :3] = 0  # the pool refills the same buffer in place
+    assert detector.changed(buffer)
+
+
+class _Shot:
+    def __init__(self, size):
+        self.size = size
+
+    def crop(self, box):
+        return box
+
+
+def test_crop_region_maps_logical_to_image_pixels():
+    shot = _Shot((200, 100))  # (10, 10, 100, 50) captured at scale 2
+    assert crop_region(shot, (10, 10, 100, 50), (20, 20, 10, 10)) == (20, 20, 40, 40)
+    assert crop_region(shot, (10, 10, 100, 50), (10, 10, 100, 50)) is shot
+    assert crop_region(shot, (10, 10, 100, 50), (0, 0, 20, 20)) is shot  # not inside
+
+
+class _Colours(FrameSource):
+    def __init__(self, Image):
+        self.Image = Image
+        self.count = 0
+
+    def grab(self, region):
+        self.count += 1
+        return self.Image.new("RGB", region[2:], (self.count * 40, 0, 0))
+
+
+def test_record_then_replay(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    path = str(tmp_path / "session.zip")
+    region = (0, 0, 8, 6)
+    recorder = RecordingFrameSource(_Colours(Image), path)
+    recorded = [recorder.grab(region) for _ in range(3)]
+    recorder.close()
+
+    replay = RecordedFrameSource(path)
+    assert len(replay) == 3
+    for image in recorded:
+        assert replay.grab(region).tobytes() == image.tobytes()
+    with pytest.raises(FrameSourceExhausted):
+        replay.grab(region)
+    replay.close()
+
+    looped = RecordedFrameSource(path, loop=True)
+    for _ in range(3):
+        looped.grab(region)
+    assert looped.grab((2, 2, 4, 2)).size == (4, 2)  # back to the first frame, cropped
+    looped.close()
@@ -0,0 +1,30 @@
+import json
+
+from inputs import InputSink, LoggingSink
+
+
+class _Counter(InputSink):
+    def __init__(self):
+        self.clicks = []
+        self.closed = False
+
+    def click(self, x, y):
+        self.clicks.append((x, y))
+
+    def close(self):
+        self.closed = True
+
+
+def test_logging_sink_records_and_forwards(tmp_path):
+    path = tmp_path / "clicks.jsonl"
+    inner = _Counter()
+    sink = LoggingSink(str(path), forward=inner)
+    sink.click(10.5, 20)
+    sink.click(11, 21)
+    sink.close()
+
+    assert [(x, y) for _, x, y in sink.clicks] == [(10.5, 20), (11, 21)]
+    assert inner.clicks == [(10.5, 20), (11, 21)] and inner.closed
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [(line["x"], line["y"]) for line in lines] == [(10.5, 20), (11, 21)]
+    assert lines[0]["t"] <= lines[1]["t"]
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+from lazy import available, is_loaded, lazy_import
+
+
+def _module(tmp_path, monkeypatch, name, source):
+    (tmp_path / f"{name}.py").write_text(source, encoding="utf-8")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, name, raising=False)
+
+
+def test_imports_on_first_attribute_access(tmp_path, monkeypatch):
+    _module(tmp_path, monkeypatch, "cyclops_heavy", "VALUE = 42\n")
+    module = lazy_import("cyclops_heavy")
+    assert not is_loaded(module) and "cyclops_heavy" not in sys.modules
+    assert module.VALUE == 42
+    assert is_loaded(module)
+
+
+def test_optional_module_that_is_not_installed():
+    assert lazy_import("cyclops_not_installed", optional=True) is None
+    assert not available(None)
+
+
+def test_installed_but_broken_module_is_unavailable(tmp_path, monkeypatch):
+    _module(tmp_path, monkeypatch, "cyclops_broken", "raise ImportError('built for another libtesseract')\n")
+    module = lazy_import("cyclops_broken", optional=True)
+    assert module is not None  # find_spec only sees that it is installed
+    assert not available(module)
+    assert not available(module)  # the failure is remembered
+    assert not is_loaded(module)
+
+
+def test_importing_the_controller_loads_no_heavy_module():
+    heavy = ("PIL", "numpy", "cv2", "pyautogui", "pytesseract", "tesserocr", "mss")
+    out = subprocess.run(
+        [sys.executable, "-c",
+         f"import sys, controller; print([m for m in {heavy!r} if m in sys.modules])"],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert out.stdout.strip() == "[]"
@@ -0,0 +1,144 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+from matcher import NeedleLibrary, TemplateMatcher  # noqa: E402
+
+
+def _screen(rng, w, h):
+    # smooth background plus noise: coarse levels see structure, not just noise
+    base = cv2.resize(rng.integers(0, 256, (h // 16, w // 16, 3), dtype=np.uint8), (w, h))
+    return np.clip(base.astype(np.int16) + rng.integers(-12, 13, (h, w, 3)), 0, 255).astype(np.uint8)
+
+
+def _button(rng, w=64, h=24, color=(40, 110, 200)):
+    button = np.empty((h, w, 3), np.uint8)
+    button[:] = color
+    button[4:-4, 6:-6] = rng.integers(0, 256, (h - 8, w - 12, 3), dtype=np.uint8)
+    return button
+
+
+def _reference(haystack, needle, confidence):
+    # pyautogui.locate(confidence=...): grayscale, strictly above the threshold
+    gray = [cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) for image in (haystack, needle)]
+    result = cv2.matchTemplate(*gray, cv2.TM_CCOEFF_NORMED)
+    _, score, _, loc = cv2.minMaxLoc(result)
+    return loc if score > confidence else None
+
+
+@pytest.mark.parametrize("seed", range(8))
+@pytest.mark.parametrize("size", [(200, 120), (640, 480), (1280, 720)])
+def test_matches_full_resolution_search(seed, size):
+    rng = np.random.default_rng(seed)
+    w, h = size
+    haystack = _screen(rng, w, h)
+    needle = _button(rng)
+    if seed % 4:  # every fourth haystack has no needle at all
+        x, y = int(rng.integers(0, w - 64)), int(rng.integers(0, h - 24))
+        haystack[y:y + 24, x:x + 64] = needle
+
+    expected = _reference(haystack, needle, 0.8)
+    match = TemplateMatcher(needle, 0.8).locate(haystack)
+    if expected is None:
+        assert match is None
+    else:
+        assert match is not None
+        assert (match.left, match.top) == expected
+
+
+def test_colour_only_difference_matches_like_pyautogui():
+    # red and grey borders of equal luma: pyautogui.locate sees the same button
+    rng = np.random.default_rng(1)
+    enabled = _button(rng, color=(0, 0, 255))
+    disabled = enabled.copy()
+    disabled[:4] = disabled[-4:] = disabled[:, :6] = disabled[:, -6:] = (76, 76, 76)
+    haystack = _screen(rng, 640, 480)
+    haystack[200:224, 300:364] = disabled
+
+    for needle in (enabled, disabled):
+        expected = _reference(haystack, needle, 0.8)
+        match = TemplateMatcher(needle, 0.8).locate(haystack)
+        assert expected == (300, 200)
+        assert (match.left, match.top) == expected
+
+
+def test_threshold_is_strict():
+    rng = np.random.default_rng(6)
+    needle = _button(rng)
+    haystack = _screen(rng, 200, 120)
+    haystack[40:64, 60:124] = needle
+    score = TemplateMatcher(needle, 0.5).locate(haystack).score
+    assert TemplateMatcher(needle, score).locate(haystack) is None
+
+
+def test_absent_needle_costs_one_coarse_scan(monkeypatch):
+    rng = np.random.default_rng(7)
+    haystack = _screen(rng, 1280, 720)
+    library = NeedleLibrary()
+    for i in range(4):
+        library.add(f"button {i}", _button(rng))
+    monkeypatch.setattr(TemplateMatcher, "_direct", lambda self, hay: pytest.fail("full-resolution pass"))
+    assert library.locate(haystack) is None
+
+
+def test_bgrx_view_matches_like_bgr():
+    rng = np.random.default_rng(2)
+    haystack = _screen(rng, 640, 480)
+    needle = _button(rng)
+    haystack[100:124, 50:114] = needle
+    bgrx = np.dstack([haystack, np.zeros(haystack.shape[:2], np.uint8)])
+
+    library = NeedleLibrary()
+    library.add("button", needle)
+    match = library.locate(bgrx)
+    assert (match.left, match.top) == (50, 100)
+    assert library.last_needle.name == "button"
+
+
+def test_library_prefers_lower_priority_value():
+    rng = np.random.default_rng(3)
+    haystack = _screen(rng, 640, 480)
+    first, second = _button(rng), _button(rng)
+    haystack[10:34, 10:74] = second
+    haystack[300:324, 400:464] = first
+
+    library = NeedleLibrary()
+    library.add("second", second, priority=1)
+    library.add("first", first, priority=0)
+    match = library.locate(haystack)
+    assert library.last_needle.name == "first"
+    assert (match.left, match.top) == (400, 300)
+
+
+def test_library_add_replaces_and_remove_forgets():
+    rng = np.random.default_rng(5)
+    haystack = _screen(rng, 640, 480)
+    old, new, other = _button(rng), _button(rng), _button(rng)
+    haystack[300:324, 400:464] = new
+
+    library = NeedleLibrary()
+    library.add("a", other, priority=0)
+    library.add("b", other, priority=0)  # equal priorities keep insertion order
+    library.add("button", old)
+    assert [n.name for n in library] == ["a", "b", "button"]
+    library.add("button", new)
+    assert len(library) == 3 and library.get("button").image is new
+
+    assert library.locate(haystack).left == 400
+    library.remove("button")
+    assert library.last_needle is None and library.get("button") is None
+    assert library.locate(haystack) is None
+    library.clear()
+    assert len(library) == 0
+
+
+def test_tracking_finds_moved_needle():
+    rng = np.random.default_rng(4)
+    needle = _button(rng)
+    matcher = TemplateMatcher(needle, 0.8, tracking=True)
+    for x in (100, 110, 400):
+        haystack = _screen(rng, 640, 480)
+        haystack[200:224, x:x + 64] = needle
+        assert matcher.locate(haystack).left == x
+    assert matcher.track_hits >= 1
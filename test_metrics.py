@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from metrics import Histogram, LatencyStats, Metrics, MetricsExporter
+
+
+def test_latency_stats():
+    stats = LatencyStats()
+    for seconds in (0.002, 0.004, 0.003):
+        stats.record(seconds)
+    s = stats.summary()
+    assert s["count"] == 3 and s["last_ms"] == pytest.approx(3.0)
+    assert (s["min_ms"], s["max_ms"], s["mean_ms"]) == pytest.approx((2.0, 4.0, 3.0))
+    stats.reset()
+    assert stats.summary()["count"] == 0 and stats.summary()["min_ms"] == 0.0
+
+
+def test_histogram_buckets_and_quantiles():
+    hist = Histogram((0.01, 0.1, 1.0))
+    for seconds in (0.005, 0.01, 0.05, 0.05, 2.0):
+        hist.observe(seconds)
+    assert hist.counts == [2, 2, 0, 1]  # a bound belongs to its own bucket
+    assert hist.quantile(0.4) == 0.01
+    assert hist.quantile(0.8) == 0.1
+    assert hist.quantile(1.0) == float("inf")
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False)
+    with metrics.timer("ocr"):
+        pass
+    metrics.inc("clicks")
+    metrics.observe("scan", 0.1)
+    snap = metrics.snapshot()
+    assert snap["counters"] == {} and snap["stages"] == {}
+
+
+def test_prometheus_buckets_are_cumulative():
+    metrics = Metrics()
+    metrics.inc("clicks", 2)
+    hist = metrics.histogram("ocr")
+    hist.observe(0.0005)
+    hist.observe(0.2)
+    text = metrics.to_prometheus()
+    assert 'cyclops_events_total{event="clicks"} 2' in text
+    assert 'cyclops_stage_seconds_bucket{stage="ocr",le="0.001"} 1' in text
+    assert 'cyclops_stage_seconds_bucket{stage="ocr",le="0.25"} 2' in text
+    assert 'cyclops_stage_seconds_bucket{stage="ocr",le="+Inf"} 2' in text
+    assert 'cyclops_stage_seconds_count{stage="ocr"} 2' in text
+
+
+def test_exporter_formats(tmp_path):
+    metrics = Metrics()
+    with metrics.timer("capture"):
+        pass
+    jsonl = tmp_path / "out" / "metrics.jsonl"
+    exporter = MetricsExporter(metrics, str(jsonl))
+    exporter.write()
+    exporter.stop()  # writes a final snapshot
+    lines = [json.loads(line) for line in jsonl.read_text(encoding="utf-8").splitlines()]
+    assert len(lines) == 2 and lines[0]["stages"]["capture"]["count"] == 1
+
+    prom = tmp_path / "metrics.prom"
+    MetricsExporter(metrics, str(prom), fmt="prometheus").stop()
+    assert 'stage="capture"' in prom.read_text(encoding="utf-8")
+    with pytest.raises(ValueError):
+        MetricsExporter(metrics, str(prom), fmt="csv")
@@ -0,0 +1,276 @@
+import pytest
+
+import ocr
+from ocr import (OcrCache, OcrEngine, RegionTracker, StripRecognizer, TieredRecognizer, create_engine,
+                 parse_tesseract_config, script_lang, target_whitelist)
+
+
+def test_parse_tesseract_config():
+    assert parse_tesseract_config("--psm 6") == (6, {})
+    assert parse_tesseract_config("--oem 1 --psm 7 -c 'tessedit_char_whitelist=AB C'") == \
+        (7, {"tessedit_char_whitelist": "AB C"})
+    assert parse_tesseract_config("") == (None, {})
+
+
+class _Broken(OcrEngine):
+    name = "broken"
+
+    def __init__(self, lang, config):
+        raise ImportError("libtesseract mismatch")
+
+
+class _Echo(OcrEngine):
+    name = "echo"
+
+    def _recognize(self, image):
+        return f"{self.lang}:{image}"
+
+
+def test_auto_falls_back_past_a_broken_backend(monkeypatch):
+    monkeypatch.setattr(ocr, "ENGINES", {"broken": _Broken, "echo": _Echo})
+    monkeypatch.setattr(ocr, "AUTO_ORDER", ("broken", "echo"))
+    engine = create_engine("auto", "eng")
+    assert engine.name == "echo"
+    assert engine.recognize("frame") == "eng:frame"
+    assert engine.stats.summary()["count"] == 1
+
+
+def test_no_backend_at_all(monkeypatch):
+    monkeypatch.setattr(ocr, "ENGINES", {"broken": _Broken})
+    monkeypatch.setattr(ocr, "AUTO_ORDER", ("broken",))
+    with pytest.raises(RuntimeError, match="libtesseract mismatch"):
+        create_engine()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match="unknown OCR backend"):
+        create_engine("easyocr")
+
+
+def test_tesserocr_applies_psm_and_variables(monkeypatch):
+    calls = []
+
+    class _Api:
+        def __init__(self, **kwargs):
+            calls.append(("init", kwargs))
+
+        def SetVariable(self, key, value):
+            calls.append(("var", key, value))
+
+        def SetImage(self, image):
+            calls.append(("image", image))
+
+        def GetUTF8Text(self):
+            return "text"
+
+        def End(self):
+            calls.append(("end",))
+
+    class _Tesserocr:
+        PyTessBaseAPI = _Api
+
+    monkeypatch.setattr(ocr, "tesserocr", _Tesserocr)
+    engine = ocr.TesserocrEngine("kor", "--psm 7 -c load_system_dawg=0")
+    assert engine.recognize("img") == "text"
+    engine.close()
+    engine.close()
+    assert calls == [("init", {"lang": "kor", "psm": 7}), ("var", "load_system_dawg", "0"),
+                     ("image", "img"), ("end",)]
+    with pytest.raises(RuntimeError, match="closed"):
+        engine.recognize("img")
+
+
+def test_cache_evicts_least_recently_used():
+    cache = OcrCache(max_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"  # b is now the oldest
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("A", "C")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_byte_budget():
+    entry = len("k0") + len("x" * 100) + OcrCache.ENTRY_OVERHEAD
+    cache = OcrCache(max_entries=100, max_bytes=3 * entry)
+    for i in range(5):
+        cache.put(f"k{i}", "x" * 100)
+    assert cache.stats()["entries"] == 3 and cache.stats()["bytes"] == 3 * entry
+    cache.put("huge", "x" * (4 * entry))  # larger than the whole budget: not kept
+    assert cache.get("huge") is None and cache.stats()["entries"] == 3
+
+
+def test_cache_key_covers_image_and_settings():
+    key = OcrCache.raw_key("1", (4, 2), b"\x00\xff", "kor", "--psm 6")
+    assert key == OcrCache.raw_key("1", (4, 2), b"\x00\xff", "kor", "--psm 6")
+    assert key != OcrCache.raw_key("1", (2, 4), b"\x00\xff", "kor", "--psm 6")
+    assert key != OcrCache.raw_key("1", (4, 2), b"\x00\xfe", "kor", "--psm 6")
+    assert key != OcrCache.raw_key("1", (4, 2), b"\x00\xff", "eng", "--psm 6")
+    assert key != OcrCache.raw_key("1", (4, 2), b"\x00\xff", "kor", "--psm 7")
+
+
+def test_cache_survives_a_restart_in_lru_order(tmp_path):
+    path = str(tmp_path / "ocr_cache.json")
+    cache = OcrCache(max_entries=2, path=path)
+    cache.put("a", "강화 성공")
+    cache.put("b", "B")
+    cache.get("a")
+    cache.save()
+
+    warm = OcrCache(max_entries=2, path=path)
+    assert warm.get("a") == "강화 성공"
+    warm = OcrCache(max_entries=2, path=path)
+    warm.put("c", "C")  # evicts b, the least recently used before the restart
+    assert warm.get("b") is None and warm.get("a") == "강화 성공"
+
+
+def test_damaged_cache_file_is_ignored(tmp_path):
+    path = tmp_path / "ocr_cache.json"
+    path.write_text("{not json", encoding="utf-8")
+    assert OcrCache(path=str(path)).stats()["entries"] == 0
+
+
+def test_unwritable_cache_path_is_not_fatal(tmp_path, capsys):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("", encoding="utf-8")
+    cache = OcrCache(path=str(blocker / "ocr_cache.json"))
+    cache.put("a", "A")
+    assert not cache.save()
+    assert "OCR cache not saved" in capsys.readouterr().err
+    assert not OcrCache().save()  # memory only
+
+
+def test_region_tracker_reads_only_changed_regions():
+    Image = pytest.importorskip("PIL.Image")
+    from PIL import ImageDraw
+
+    def page(marks):
+        image = Image.new("1", (60, 40), 1)
+        draw = ImageDraw.Draw(image)
+        for x, y in marks:
+            draw.rectangle((x, y, x + 3, y + 3), fill=0)
+        return image
+
+    lines = [[(0, 0, 30, 20), (30, 0, 60, 20)], [(0, 20, 60, 40)]]
+    read = []
+
+    def recognize(crop):
+        read.append(crop.size)
+        return f"t{len(read)}"
+
+    tracker = RegionTracker()
+    assert tracker.recognize(page([(5, 5), (40, 8), (5, 25)]), lines, recognize) == "t1 t2\nt3"
+    # only the second line changed
+    assert tracker.recognize(page([(5, 5), (40, 8), (20, 25)]), lines, recognize) == "t1 t2\nt4"
+    assert read == [(30, 20), (30, 20), (60, 20), (60, 20)]
+    assert tracker.regions_total == 6 and tracker.regions_ocred == 4
+    tracker.reset()
+    tracker.recognize(page([(5, 5), (40, 8), (20, 25)]), lines, recognize)
+    assert len(read) == 7
+
+
+def test_cheap_pass_language_and_whitelist():
+    assert script_lang(["강화 성공"]) == "kor"
+    assert script_lang(["Gold 부족"]) == "kor+eng"
+    assert script_lang(["OUT OF GOLD", "123"]) == "eng"
+    assert target_whitelist(["Ab 1", "b"]) == "1ABab"
+
+
+class _Frame:
+    def __init__(self, size):
+        self.size = size
+
+
+class _Binary:
+    mode = "1"
+    size = (400, 100)
+
+    def tobytes(self):
+        return b"binary"
+
+
+class _Cheap(OcrEngine):
+    name = "cheap"
+    text = ""
+
+    def _recognize(self, image):
+        return _Cheap.text
+
+
+def _tiers(monkeypatch, cheap_text, targets=("UPGRADE SUCCESS",)):
+    engines = []
+
+    def create(backend, lang, config, daemon_address=None):
+        engines.append(_Cheap(lang, config))
+        return engines[-1]
+
+    monkeypatch.setattr(ocr, "create_engine", create)
+    _Cheap.text = cheap_text
+    tiers = TieredRecognizer(lambda image, upscale=True: _Binary(), cache=OcrCache())
+    tiers.set_targets(list(targets))
+    return tiers, engines
+
+
+def test_clearly_different_text_is_decided_on_the_cheap_pass(monkeypatch):
+    tiers, engines = _tiers(monkeypatch, "LOADING PLEASE WAIT")
+    full = []
+    assert tiers.recognize(_Frame((400, 100)), lambda: full.append(1) or "full") == "LOADING PLEASE WAIT"
+    assert full == [] and tiers.decided_cheap == 1
+    assert engines[0].lang == "eng" and "tessedit_char_whitelist=" in engines[0].config
+
+
+@pytest.mark.parametrize("cheap_text", ["UPGRADE SUCCESS", "UPGRADE SUCCES5", "", "UP"])
+def test_near_hits_and_inconclusive_reads_go_to_the_full_pass(monkeypatch, cheap_text):
+    tiers, _ = _tiers(monkeypatch, cheap_text)
+    assert tiers.recognize(_Frame((400, 100)), lambda: "upgrade success") == "upgrade success"
+    assert tiers.escalated == 1 and tiers.decided_cheap == 0
+
+
+def test_lenient_matching_lowers_the_escalation_threshold(monkeypatch):
+    from textmatch import TextMatcher
+
+    read = "UPGRAXX XXXXXXX"  # 9 edits from the target: a hit at a 0.6 error ratio
+    assert TextMatcher(["UPGRADE SUCCESS"], 0.6).match(read) is not None
+    tiers, _ = _tiers(monkeypatch, read)
+    assert tiers.recognize(_Frame((400, 100)), lambda: "full") == read
+    tiers.set_targets(["UPGRADE SUCCESS"], max_error_ratio=0.6)
+    assert tiers.recognize(_Frame((400, 100)), lambda: "full") == "full"
+    assert tiers.decided_cheap == 1 and tiers.escalated == 1
+
+
+def test_failing_cheap_pass_falls_back_to_the_full_pass(monkeypatch):
+    tiers, engines = _tiers(monkeypatch, "")
+
+    def fail(image):
+        raise RuntimeError("Failed loading language 'eng'")  # what TesseractError says
+
+    engines[0]._recognize = fail
+    assert tiers.recognize(_Frame((400, 100)), lambda: "full") == "full"
+    assert "eng" in str(tiers.error) and tiers.engine is None
+    assert tiers.recognize(_Frame((400, 100)), lambda: "full") == "full"
+
+
+def test_small_regions_skip_the_cheap_pass(monkeypatch):
+    tiers, engines = _tiers(monkeypatch, "LOADING PLEASE WAIT")
+    assert tiers.recognize(_Frame((120, 30)), lambda: "full") == "full"
+    assert engines[0].stats.summary()["count"] == 0 and tiers.escalated == 1
+
+
+def test_cheap_engine_is_rebuilt_only_for_new_targets(monkeypatch):
+    tiers, engines = _tiers(monkeypatch, "")
+    tiers.set_targets(["UPGRADE SUCCESS"])
+    assert len(engines) == 1
+    tiers.set_targets(["강화 성공"])
+    assert len(engines) == 2 and engines[1].lang == "kor"
+
+
+def test_one_strip_uses_the_callers_engine():
+    class _Page:
+        size = (400, 100)  # too short for two 64 px strips
+
+    strips = StripRecognizer(workers=4, min_height=64)
+    assert strips.recognize(_Page(), single=lambda page: "whole page") == "whole page"
+    assert strips._pool is None  # no worker processes started
+    assert strips.stats()["strips_per_call"] == 1.0
+    strips.close()
@@ -0,0 +1,168 @@
+import socket
+import threading
+
+import pytest
+
+import ocr_daemon
+from ocr_daemon import (MAX_HEADER, DaemonClient, DaemonError, OcrServer, parse_address, recv_message,
+                        send_message)
+
+
+def test_parse_address():
+    assert parse_address("127.0.0.1:47831") == (socket.AF_INET, ("127.0.0.1", 47831))
+    assert parse_address(":9000") == (socket.AF_INET, ("127.0.0.1", 9000))
+    with pytest.raises(ValueError):
+        parse_address("nowhere")
+
+
+def test_message_round_trip():
+    left, right = socket.socketpair()
+    with left, right:
+        send_message(left, {"op": "ocr", "size": [2, 1]}, b"\x00\xff")
+        send_message(left, {"op": "ping"})
+        assert recv_message(right) == ({"op": "ocr", "size": [2, 1], "bytes": 2}, b"\x00\xff")
+        assert recv_message(right) == ({"op": "ping", "bytes": 0}, b"")
+
+
+def test_oversized_header_is_refused():
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(ocr_daemon._LENGTH.pack(MAX_HEADER + 1))
+        with pytest.raises(ConnectionError, match="header too large"):
+            recv_message(right)
+
+
+class _Engine:
+    def __init__(self, config):
+        self.config = config
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_worker_engines_are_bounded(monkeypatch):
+    monkeypatch.setattr(ocr_daemon, "create_engine",
+                        lambda backend, lang, config: _Engine(config))
+    server = OcrServer(backend="pytesseract", max_engines=2)
+    try:
+        a = server._engine("kor", "a")
+        b = server._engine("kor", "b")
+        assert server._engine("kor", "a") is a  # a is now the most recent
+        c = server._engine("kor", "c")
+        assert b.closed and not a.closed and not c.closed
+        assert server.stats()["engines"] == 2 and server.stats()["evicted"] == 1
+        assert server._engine("kor", "b") is not b
+    finally:
+        server.stop()
+    assert a.closed and c.closed
+
+
+class _Bytes:
+    """Stands in for PIL.Image on the server: the "image" is its raw data."""
+
+    @staticmethod
+    def frombytes(mode, size, data):
+        return data
+
+
+class _Counting(_Engine):
+    calls = 0
+
+    def recognize(self, image):
+        _Counting.calls += 1
+        return f"{self.config}:{len(image)} "
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    if not ocr_daemon.HAS_UNIX_SOCKETS:
+        pytest.skip("needs Unix sockets")
+    monkeypatch.setattr(ocr_daemon, "Image", _Bytes)
+    monkeypatch.setattr(ocr_daemon, "create_engine",
+                        lambda backend, lang, config: _Counting(config))
+    _Counting.calls = 0
+    address = f"unix:{tmp_path}/ocr.sock"
+    server = OcrServer(address, workers=2, backend="pytesseract", batch_window=0.2)
+    server.start()
+    yield server, address
+    server.stop()
+
+
+def _ocr(client, data, config="--psm 6"):
+    header = {"op": "ocr", "mode": "L", "size": [len(data), 1], "config": config}
+    return client.call(header, data)["text"]
+
+
+def test_clients_share_results(daemon):
+    server, address = daemon
+    clients = [DaemonClient(address) for _ in range(4)]
+    assert all(client.ping() for client in clients)
+    texts = []
+    threads = [threading.Thread(target=lambda c=c: texts.append(_ocr(c, b"frame"))) for c in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5.0)
+    assert texts == ["--psm 6:5"] * 4
+    assert _Counting.calls == 1  # batched together or answered from the cache
+    assert _ocr(clients[0], b"other", "--psm 7") == "--psm 7:5"
+    stats = clients[0].stats()
+    assert stats["requests"] == 5 and stats["engines"] >= 1
+    for client in clients:
+        client.close()
+
+
+def test_errors_are_replies(daemon):
+    server, address = daemon
+    client = DaemonClient(address)
+    with pytest.raises(DaemonError, match="bad request"):
+        client.call({"op": "ocr", "size": [1, 1]}, b"x")
+    with pytest.raises(DaemonError, match="unknown op"):
+        client.call({"op": "reload"})
+    server.max_pending = 0
+    with pytest.raises(DaemonError, match="busy"):
+        _ocr(client, b"frame")
+    assert client.ping()  # the connection survives every error
+    client.close()
+
+
+def test_running_daemon_keeps_its_socket(daemon):
+    server, address = daemon
+    second = OcrServer(address, backend="pytesseract")
+    with pytest.raises(OSError, match="already listening"):
+        second.start()
+    second.stop()
+    assert DaemonClient(address).ping()
+
+
+def test_stale_socket_is_replaced(tmp_path):
+    if not ocr_daemon.HAS_UNIX_SOCKETS:
+        pytest.skip("needs Unix sockets")
+    path = str(tmp_path / "ocr.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()  # the file stays, nobody listens
+    server = OcrServer(f"unix:{path}", backend="pytesseract")
+    server.start()
+    try:
+        assert DaemonClient(f"unix:{path}").ping()
+    finally:
+        server.stop()
+
+
+@pytest.mark.parametrize("host", ["0.0.0.0", "192.0.2.1"])
+def test_network_binds_are_refused(host):
+    server = OcrServer(f"{host}:0", backend="pytesseract")
+    with pytest.raises(ValueError, match="only loopback"):
+        server.start()
+    server.stop()
+
+
+def test_unreachable_daemon(tmp_path):
+    if not ocr_daemon.HAS_UNIX_SOCKETS:
+        pytest.skip("needs Unix sockets")
+    client = DaemonClient(f"unix:{tmp_path}/none.sock", timeout=0.5)
+    assert not client.ping()
+    with pytest.raises(DaemonError, match="unreachable"):
+        client.stats()
@@ -0,0 +1,62 @@
+import queue
+import threading
+
+from frames import FrameSourceExhausted
+from pipeline import Stage, StageEnd
+
+
+def _drain(outbox, timeout=2.0):
+    items = []
+    while True:
+        item = outbox.get(timeout=timeout)
+        items.append(item)
+        if isinstance(item, StageEnd):
+            return items
+
+
+def test_stages_keep_order_drop_nones_and_forward_the_end():
+    stop = threading.Event()
+    numbers = iter(range(10))
+
+    def source(_):
+        n = next(numbers, None)
+        if n is None:
+            raise FrameSourceExhausted("done")
+        return n
+
+    q1, q2 = queue.Queue(2), queue.Queue(2)
+    stages = [Stage("source", source, None, q1, stop),
+              Stage("even", lambda n: n * 10 if n % 2 == 0 else None, q1, q2, stop)]
+    for stage in stages:
+        stage.start()
+    items = _drain(q2)
+    assert items[:-1] == [0, 20, 40, 60, 80]
+    assert items[-1].reason == "frame source exhausted"
+    for stage in stages:
+        stage.thread.join(1.0)
+        assert not stage.thread.is_alive()
+
+
+def test_a_failing_stage_ends_the_pipeline():
+    stop = threading.Event()
+    inbox, outbox = queue.Queue(), queue.Queue()
+    stage = Stage("ocr", lambda item: 1 // item, inbox, outbox, stop)
+    stage.start()
+    inbox.put(1)
+    inbox.put(0)
+    assert outbox.get(timeout=2.0) == 1
+    end = outbox.get(timeout=2.0)
+    assert isinstance(end, StageEnd) and end.reason.startswith("ocr failed:")
+    stage.thread.join(1.0)
+    assert stage.latency.summary()["count"] == 1
+
+
+def test_stop_event_ends_a_blocked_stage():
+    stop = threading.Event()
+    outbox = queue.Queue(1)
+    stage = Stage("capture", lambda _: "frame", None, outbox, stop)
+    stage.start()
+    outbox.get(timeout=2.0)  # the stage now blocks on the full queue
+    stop.set()
+    stage.thread.join(1.0)
+    assert not stage.thread.is_alive()
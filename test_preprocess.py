@@ -0,0 +1,162 @@
+import random
+
+import pytest
+
+import preprocess
+from preprocess import (BAND_PAD, NumpyPreprocessor, _reading_order, find_text_blocks, needs_upscale,
+                        preprocess_pil, split_bands, split_strips)
+
+
+def _noise(Image, size, mode, seed):
+    rng = random.Random(seed)
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    # a biased distribution, so the mean (the contrast pivot) moves per seed
+    low = rng.randrange(0, 128)
+    data = bytes(rng.randrange(low, 256) for _ in range(size[0] * size[1] * bands))
+    return Image.frombytes(mode, size, data)
+
+
+def test_needs_upscale():
+    assert needs_upscale(299, 400) and needs_upscale(800, 49)
+    assert not needs_upscale(300, 50)
+
+
+@pytest.mark.parametrize("size", [(40, 20), (320, 60), (500, 200)])
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L"])
+def test_numpy_path_matches_pil(size, mode):
+    Image = pytest.importorskip("PIL.Image")
+    np = pytest.importorskip("numpy")
+    preprocess = NumpyPreprocessor()
+    for seed in range(3):
+        image = _noise(Image, size, mode, seed)
+        for upscale in (True, False):
+            expected = preprocess_pil(image, upscale=upscale)
+            got = preprocess(image, upscale=upscale)
+            assert got.size == expected.size
+            assert np.array_equal(np.asarray(got), np.asarray(expected)), (seed, upscale)
+
+
+def test_bgrx_view_matches_pil():
+    Image = pytest.importorskip("PIL.Image")
+    np = pytest.importorskip("numpy")
+    image = _noise(Image, (320, 60), "RGB", 7)
+    bgrx = np.asarray(image.convert("RGBX"))[..., [2, 1, 0, 3]]
+    got = NumpyPreprocessor()(bgrx)
+    assert np.array_equal(np.asarray(got), np.asarray(preprocess_pil(image)))
+
+
+def test_buffers_are_reused_per_size():
+    Image = pytest.importorskip("PIL.Image")
+    np = pytest.importorskip("numpy")
+    preprocess = NumpyPreprocessor()
+    first, second = (_noise(Image, (320, 60), "RGB", seed) for seed in (1, 2))
+    expected = np.asarray(preprocess_pil(first)).copy()
+    kept = preprocess(first)
+    preprocess(second)
+    assert np.array_equal(np.asarray(kept), expected)  # not overwritten by the next frame
+    assert len(preprocess._buffers) == 1
+
+
+def _lines(Image, size, rows, ink=0, paper=1):
+    """A binarized page with a short ink run in each row range of `rows`."""
+    from PIL import ImageDraw
+
+    page = Image.new("1", size, paper)
+    draw = ImageDraw.Draw(page)
+    for top, bottom in rows:
+        draw.rectangle((5, top, size[0] // 3, bottom - 1), fill=ink)
+    return page
+
+
+def test_bands_wrap_each_text_line():
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+    page = _lines(Image, (100, 60), [(10, 16), (40, 46)])
+    assert split_bands(page) == [(0, 10 - BAND_PAD, 100, 16 + BAND_PAD),
+                                 (0, 40 - BAND_PAD, 100, 46 + BAND_PAD)]
+
+
+def test_bands_of_light_text_on_dark():
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+    dark = _lines(Image, (100, 60), [(10, 16), (40, 46)], ink=1, paper=0)
+    light = _lines(Image, (100, 60), [(10, 16), (40, 46)])
+    assert split_bands(dark) == split_bands(light)
+
+
+def test_blank_page_has_no_bands():
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+    assert split_bands(Image.new("1", (100, 60), 1)) == []
+
+
+def test_reading_order_groups_boxes_into_lines():
+    boxes = [(50, 2, 70, 12), (0, 30, 20, 40), (0, 0, 20, 10), (30, 32, 40, 38)]
+    assert _reading_order(boxes) == [[(0, 0, 20, 10), (50, 2, 70, 12)],
+                                     [(0, 30, 20, 40), (30, 32, 40, 38)]]
+
+
+class _Page:
+    size = (80, 30)
+
+
+def test_without_opencv_the_page_is_one_block(monkeypatch):
+    monkeypatch.setattr(preprocess, "text_blocks_available", lambda: False)
+    assert find_text_blocks(_Page()) == [[(0, 0, 80, 30)]]
+
+
+def test_blocks_around_words_and_solid_banners():
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+    from PIL import ImageDraw
+
+    page = Image.new("1", (300, 120), 1)
+    draw = ImageDraw.Draw(page)
+    for x in (10, 22, 34):  # three letters of one word
+        draw.rectangle((x, 10, x + 8, 22), fill=0)
+    draw.rectangle((200, 12, 230, 24), fill=0)
+    draw.rectangle((20, 70, 280, 100), fill=0)  # a banner: light text thresholds to solid
+    draw.point((150, 50), fill=0)  # a speck
+    lines = find_text_blocks(page)
+    assert len(lines) == 2
+    assert len(lines[0]) == 2 and lines[0][0][0] < 10 < 42 < lines[0][0][2] < 200
+    (banner,) = lines[1]
+    assert banner[0] <= 20 and banner[2] >= 280 and banner[1] <= 70 and banner[3] >= 100
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_strips_tile_the_page_and_never_cut_a_line(seed):
+    Image = pytest.importorskip("PIL.Image")
+    np = pytest.importorskip("numpy")
+    rng = random.Random(seed)
+    h = rng.randint(200, 900)
+    rows, top = [], rng.randint(0, 20)
+    while True:
+        bottom = top + rng.randint(8, 30)
+        if bottom > h:
+            break
+        rows.append((top, bottom))
+        top = bottom + rng.randint(BAND_PAD, 40)
+    page = _lines(Image, (200, h), rows)
+    count, min_height = rng.randint(2, 6), rng.choice([0, 32, 64])
+
+    strips = split_strips(page, count, min_height)
+    assert 1 <= len(strips) <= count
+    assert strips[0][1] == 0 and strips[-1][3] == h
+    assert all(a[3] == b[1] for a, b in zip(strips, strips[1:]))
+    if len(strips) > 1:
+        assert all(bottom - top >= min_height for _, top, _, bottom in strips)
+    inked = np.flatnonzero((~np.asarray(page)).any(axis=1))
+    for _, top, _, _ in strips[1:]:
+        # a cut between rows top-1 and top: never through a line
+        assert not (top - 1 in inked and top in inked)
+        assert not any(t <= top - 1 and top < b for t, b in rows)
+
+
+def test_short_pages_are_one_strip():
+    class _Page:
+        size = (200, 100)
+
+    assert split_strips(_Page(), 4, min_height=64) == [(0, 0, 200, 100)]
+    assert split_strips(_Page(), 1) == [(0, 0, 200, 100)]
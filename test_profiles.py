@@ -0,0 +1,157 @@
+import json
+import os
+
+import pytest
+
+import cli
+from controller import CLICK_NEEDLE, MacroController
+from profiles import ARTIFACT_DIR, ProfileError, apply_profile, load_profile, make_job, save_profile
+
+
+def _write(tmp_path, **fields):
+    profile = {"version": 1, "region": [10, 20, 300, 200], "needle": "button.png",
+               "targets": ["SUCCESS"]}
+    profile.update(fields)
+    path = tmp_path / "profile.json"
+    path.write_text(json.dumps(profile), encoding="utf-8")
+    return str(path)
+
+
+def test_minimal_profile(tmp_path):
+    profile = load_profile(_write(tmp_path, targets="SUCCESS"))
+    assert profile["targets"] == ["SUCCESS"]
+    assert profile["needle"] == os.path.join(str(tmp_path), "button.png")
+    assert profile["cache"] is None
+    assert "scale" not in profile
+
+
+def test_directory_means_its_profile_json(tmp_path):
+    _write(tmp_path)
+    assert load_profile(str(tmp_path))["region"] == [10, 20, 300, 200]
+
+
+@pytest.mark.parametrize("fields, message", [
+    ({"region": [0, 0, 0, 10]}, "region"),
+    ({"targets": ["  "]}, "targets"),
+    ({"targets": ["re:("]}, "invalid regex"),
+    ({"needle": None}, "needle"),
+    ({"needles": [{"confidence": 0.9}]}, "needles\\[0\\]"),
+    ({"ocr_backend": "foo"}, "ocr_backend"),
+    ({"ocr_daemon": "nowhere"}, "ocr_daemon"),
+    ({"ocr_layout": "columns"}, "ocr_layout"),
+    ({"click_delay": "3"}, "click_delay"),
+    ({"version": 99}, "version"),
+])
+def test_invalid_profiles_are_rejected(tmp_path, fields, message):
+    with pytest.raises(ProfileError, match=message):
+        load_profile(_write(tmp_path, **fields))
+
+
+def test_cli_reports_profile_errors_as_events(tmp_path, capsys):
+    assert cli.main([_write(tmp_path, ocr_backend="foo")]) == 2
+    event = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert event["event"] == "error" and "ocr_backend" in event["message"]
+
+
+def _controller(Image):
+    controller = MacroController(2.0)  # a detected Retina scale
+    controller.result_region = (10, 20, 300, 200)
+    controller.target_texts = ["SUCCESS", r"re:\d+ gold"]
+    controller.click_delay = 1.5
+    controller.add_needle(CLICK_NEEDLE, Image.new("RGB", (24, 16), (200, 40, 40)))
+    controller.add_needle("retry", Image.new("RGB", (20, 20), (40, 40, 200)), confidence=0.9, priority=3)
+    return controller
+
+
+def test_save_load_round_trip(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+
+    source = _controller(Image)
+    profile = load_profile(save_profile(source, str(tmp_path)))
+    assert "scale" not in profile  # detected, not chosen: measured again on load
+    assert profile["click_delay"] == 1.5
+
+    loaded = MacroController(1.0)
+    apply_profile(loaded, profile)
+    assert loaded.result_region == (10, 20, 300, 200)
+    assert loaded.target_texts == source.target_texts
+    assert [(n.name, n.confidence, n.priority) for n in loaded.needles] == \
+        [(n.name, n.confidence, n.priority) for n in source.needles]
+    assert list(loaded.needles)[1].image.size == (20, 20)
+
+
+def test_explicit_scale_is_kept(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+
+    first = str(tmp_path / "first")
+    save_profile(_controller(Image), first)
+    with open(os.path.join(first, "profile.json"), encoding="utf-8") as f:
+        data = json.load(f)
+    data["scale"] = 1.25
+    with open(os.path.join(first, "profile.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+    controller = MacroController(2.0)
+    apply_profile(controller, load_profile(first))
+    assert controller.scale == 1.25  # clicks land where the profile says
+    second = save_profile(controller, str(tmp_path / "second"))
+    assert load_profile(second)["scale"] == 1.25
+
+
+def test_ocr_backend_is_applied(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+
+    source = _controller(Image)
+    source.set_ocr_backend("daemon", "127.0.0.1:47831")
+    profile = load_profile(save_profile(source, str(tmp_path)))
+
+    loaded = MacroController(2.0, "pytesseract")
+    engines = []
+    loaded._ocr_engine = type("_Engine", (), {"close": lambda self: engines.append(self)})()
+    apply_profile(loaded, profile)
+    assert (loaded.ocr_backend, loaded.ocr_daemon_address) == ("daemon", "127.0.0.1:47831")
+    assert (loaded.tiers.backend, loaded.tiers.daemon_address) == ("daemon", "127.0.0.1:47831")
+    assert loaded._ocr_engine is None and len(engines) == 1  # reloaded on first use
+    assert loaded.scale == 2.0  # no scale in the profile: the detected one stays
+
+
+def test_truncated_artifact_is_rewritten(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+
+    controller = _controller(Image)
+    save_profile(controller, str(tmp_path))
+    cache = tmp_path / ARTIFACT_DIR
+    level = sorted(cache.glob("*.0.npy"))[0]
+    expected = np.load(level).copy()
+    level.write_bytes(level.read_bytes()[:-10])  # interrupted write
+
+    save_profile(controller, str(tmp_path))
+    assert np.array_equal(np.load(level), expected)
+    assert not list(cache.glob("*.tmp"))
+
+
+def test_cli_checks_every_job_profile(tmp_path):
+    good = _write(tmp_path)
+    bad = tmp_path / "bad.json"
+    bad.write_text(json.dumps({"region": [0, 0, 10, 10], "targets": ["x"]}), encoding="utf-8")
+    assert cli.main([good, str(bad)]) == 2
+
+
+def test_job_from_profile(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+    Image.new("RGB", (24, 16), (200, 40, 40)).save(tmp_path / "retry.png")
+    path = _write(tmp_path, needle=None, needles=[{"image": "retry.png", "confidence": 0.9}],
+                  click_delay=1.5, retry_max=3)
+    job = make_job(load_profile(path), "retry")
+    assert job.region == (10, 20, 300, 200) and job.targets == ["SUCCESS"]
+    assert (job.click_delay, job.retry_max, job.matcher.needle.confidence) == (1.5, 3, 0.9)
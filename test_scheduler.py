@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+import scheduler
+from frames import FrameSource
+from inputs import LoggingSink
+from ocr import OcrEngine
+from scheduler import JobScheduler, WatchJob
+
+REGIONS = [(0, 0, 200, 100), (200, 0, 200, 100)]
+
+
+def test_union_of_regions():
+    assert JobScheduler._union([(10, 20, 30, 40), (100, 0, 10, 10)]) == (10, 0, 100, 60)
+
+
+class _Screen(FrameSource):
+    def __init__(self, image):
+        self.image = image
+        self.regions = []
+
+    def grab(self, region):
+        self.regions.append(region)
+        x, y, w, h = region
+        return self.image.crop((x, y, x + w, y + h))
+
+
+class _Says(OcrEngine):
+    name = "fixed"
+
+    def __init__(self, text):
+        super().__init__()
+        self.text = text
+
+    def _recognize(self, image):
+        return self.text
+
+
+def _setup(monkeypatch, text):
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+    monkeypatch.setattr(scheduler, "create_engine", lambda *args: _Says(text))
+    rng = random.Random(5)
+    needle = Image.frombytes("RGB", (20, 20), bytes(rng.randrange(256) for _ in range(1200)))
+    screen = Image.new("RGB", (400, 100), (230, 230, 230))
+    for x, y, _, _ in REGIONS:
+        screen.paste(needle, (x + 50, y + 40))
+    source = _Screen(screen)
+    sink = LoggingSink()
+    sched = JobScheduler(source, sink, workers=2)
+    jobs = [WatchJob(f"job{i}", region, needle, "SUCCESS", interval=0.05, click_delay=0.05)
+            for i, region in enumerate(REGIONS)]
+    for job in jobs:
+        sched.add_job(job)
+    return sched, source, sink, jobs
+
+
+def test_due_jobs_share_one_capture(monkeypatch):
+    sched, source, sink, jobs = _setup(monkeypatch, "SUCCESS")
+    sched.run(duration=5.0)  # returns once every job is done
+    assert [job.status for job in jobs] == ["matched", "matched"]
+    assert source.regions == [(0, 0, 400, 100)]
+    assert sched.stats()["scans"] == 2
+    assert sink.clicks == []
+
+
+def test_each_job_clicks_inside_its_region(monkeypatch):
+    sched, source, sink, jobs = _setup(monkeypatch, "loading")
+    sched.run(duration=0.4)
+    assert all(job.clicks >= 1 for job in jobs)
+    assert {(x, y) for _, x, y in sink.clicks} == {(60, 50), (260, 50)}
+    assert sched.stats()["captures"] < sched.stats()["scans"]
+
+
+class _Closing(_Says):
+    def close(self):
+        self.closes = getattr(self, "closes", 0) + 1
+
+
+def test_each_run_closes_its_own_engines(monkeypatch):
+    sched, _, _, _ = _setup(monkeypatch, "loading")
+    engines = []
+    monkeypatch.setattr(scheduler, "create_engine",
+                        lambda *args: engines.append(_Closing("loading")) or engines[-1])
+    sched.run(duration=0.2)
+    assert engines and sched._engines == []
+    sched.run(duration=0.2)
+    assert [engine.closes for engine in engines] == [1] * len(engines)  # not closed again
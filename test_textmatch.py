@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from textmatch import TextMatcher, normalize_text, split_targets, substring_distance, validate_targets
+
+
+def test_split_targets():
+    assert split_targets(" A ;B;; re:C+ ;") == ["A", "B", "re:C+"]
+
+
+@pytest.mark.parametrize("pattern, text, distance", [
+    ("abc", "xxabcxx", 0),
+    ("abc", "xxabxx", 1),
+    ("abc", "xxaXcxx", 1),
+    ("abc", "", 3),
+    ("골드 부족", "현재 골드 부족합니다", 0),
+])
+def test_substring_distance(pattern, text, distance):
+    assert substring_distance(pattern, text) == distance
+
+
+def test_exact_hit_ignores_case_and_whitespace():
+    matcher = TextMatcher(["Upgrade  Success", "Out of gold"])
+    hit = matcher.match("status:\nupgrade success!")
+    assert (hit.target, hit.kind) == ("Upgrade  Success", "exact")
+
+
+def test_miss_returns_none():
+    assert TextMatcher(["강화 성공", "골드 부족"]).match("강화 실패") is None
+
+
+def test_earliest_occurrence_wins():
+    matcher = TextMatcher(["beta", "alpha"])
+    assert matcher.match("alpha then beta").target == "alpha"
+
+
+def test_regex_target():
+    matcher = TextMatcher(["never", r"re:\d+ gold"])
+    hit = matcher.match("you have 120 GOLD")
+    assert (hit.target, hit.kind) == (r"re:\d+ gold", "regex")
+    assert matcher.match("you have no gold") is None
+
+
+def test_invalid_regex_is_rejected():
+    with pytest.raises(ValueError, match="re:\\("):
+        validate_targets(["ok", "re:("])
+    with pytest.raises(ValueError):
+        TextMatcher(["re:[a-"])
+
+
+def test_fuzzy_hit_within_budget_only():
+    matcher = TextMatcher(["connection lost"], max_error_ratio=0.2)
+    hit = matcher.match("ERROR: conection lsot, retrying")
+    assert hit.kind == "fuzzy" and hit.distance <= 3
+    assert matcher.match("connected") is None
+    assert TextMatcher(["connection lost"]).match("conection lost") is None
+
+
+def test_qgram_filter_agrees_with_brute_force():
+    rng = random.Random(7)
+    alphabet = "abcde "
+    targets = ["".join(rng.choice(alphabet) for _ in range(rng.randint(3, 12))) for _ in range(40)]
+    targets = [t for t in targets if t.strip()]
+    matcher = TextMatcher(targets, max_error_ratio=0.25)
+    for _ in range(200):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        normalized = normalize_text(text)
+        expected = any(
+            substring_distance(normalize_text(t), normalized) <= int(len(normalize_text(t)) * 0.25)
+            for t in targets)
+        assert (matcher.match(text) is not None) == expected, text
@@ -0,0 +1,184 @@
+import re
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+REGEX_PREFIX = "re:"
+TARGET_SEPARATOR = ";"
+QGRAM = 2
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def split_targets(text: str) -> List[str]:
+    """"A; B; re:C+" -> ["A", "B", "re:C+"]"""
+    return [t.strip() for t in text.split(TARGET_SEPARATOR) if t.strip()]
+
+
+def validate_targets(targets: Sequence[str]):
+    """Raise ValueError for a "re:" target that is not a valid regex."""
+    for target in targets:
+        if target.startswith(REGEX_PREFIX):
+            try:
+                re.compile(target[len(REGEX_PREFIX):], re.IGNORECASE)
+            except re.error as e:
+                raise ValueError(f"invalid regex in target {target!r}: {e}") from e
+
+
+def substring_distance(pattern: str, text: str) -> int:
+    """Smallest edit distance between `pattern` and any substring of `text`."""
+    m = len(pattern)
+    prev = list(range(m + 1))
+    best = m
+    for ch in text:
+        cur = [0]
+        for i in range(1, m + 1):
+            cost = 0 if pattern[i - 1] == ch else 1
+            cur.append(min(prev[i] + 1, cur[i - 1] + 1, prev[i - 1] + cost))
+        if cur[m] < best:
+            best = cur[m]
+            if best == 0:
+                break
+        prev = cur
+    return best
+
+
+class TextHit:
+    def __init__(self, target: str, kind: str, distance: int = 0):
+        self.target = target
+        self.kind = kind          # "exact" | "regex" | "fuzzy"
+        self.distance = distance
+
+    def __repr__(self):
+        return f"TextHit({self.target!r}, {self.kind}, distance={self.distance})"
+
+
+class _AhoCorasick:
+    """Multi-pattern substring automaton; one pass over the text for all targets."""
+
+    def __init__(self, patterns: Sequence[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(index)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def first(self, text: str) -> Optional[int]:
+        """Index of the pattern whose occurrence ends earliest in `text`."""
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                return out[node][0]
+        return None
+
+
+class TextMatcher:
+    """Compiled stop-text set: exact, fuzzy and regex targets.
+
+    Plain targets are matched as whitespace/case-normalized substrings by an
+    Aho-Corasick automaton. With `max_error_ratio` > 0 a target also matches
+    a substring within floor(len * ratio) edits; a q-gram count filter picks
+    the few targets that can possibly be that close, and only those are
+    verified with an edit-distance scan, so cost stays nearly flat as the
+    list grows. Targets prefixed with "re:" are regexes, combined into one
+    alternation searched once per check; an invalid one raises ValueError.
+    """
+
+    def __init__(self, targets: Sequence[str], max_error_ratio: float = 0.0):
+        self.targets = [t for t in targets if t.strip()]
+        self.max_error_ratio = max_error_ratio
+
+        plain = [t for t in self.targets if not t.startswith(REGEX_PREFIX)]
+        self.regex_targets = [t for t in self.targets if t.startswith(REGEX_PREFIX)]
+        self._plain = plain
+        self._normalized = [normalize_text(t) for t in plain]
+        self._automaton = _AhoCorasick(self._normalized)
+
+        self._regex = None
+        if self.regex_targets:
+            validate_targets(self.regex_targets)
+            parts = [f"(?P<t{i}>{t[len(REGEX_PREFIX):]})" for i, t in enumerate(self.regex_targets)]
+            self._regex = re.compile("|".join(parts), re.IGNORECASE)
+
+        # fuzzy: per-target error budget and q-gram postings
+        self._budget: List[int] = [int(len(t) * max_error_ratio) for t in self._normalized]
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._needed: List[int] = []
+        self._always_verify: List[int] = []
+        for i, target in enumerate(self._normalized):
+            k = self._budget[i]
+            if k == 0:
+                self._needed.append(0)
+                continue
+            grams = [target[j:j + QGRAM] for j in range(len(target) - QGRAM + 1)]
+            needed = len(grams) - k * QGRAM
+            self._needed.append(needed)
+            if needed <= 0:
+                # too short for the filter to rule anything out
+                self._always_verify.append(i)
+                continue
+            counts: Dict[str, int] = defaultdict(int)
+            for gram in grams:
+                counts[gram] += 1
+            for gram, count in counts.items():
+                self._postings[gram].append((i, count))
+
+    @property
+    def fuzzy(self) -> bool:
+        return any(self._budget)
+
+    def _fuzzy_candidates(self, text: str) -> List[int]:
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in {text[j:j + QGRAM] for j in range(len(text) - QGRAM + 1)}:
+            for i, count in self._postings.get(gram, ()):
+                shared[i] += count
+        candidates = [i for i, n in shared.items() if n >= self._needed[i]]
+        return candidates + self._always_verify
+
+    def match(self, text: str) -> Optional[TextHit]:
+        normalized = normalize_text(text)
+
+        index = self._automaton.first(normalized)
+        if index is not None:
+            return TextHit(self._plain[index], "exact")
+
+        if self._regex is not None:
+            m = self._regex.search(normalized)
+            if m is not None:
+                return TextHit(self.regex_targets[int(m.lastgroup[1:])], "regex")
+
+        if self.fuzzy:
+            best: Optional[TextHit] = None
+            for i in self._fuzzy_candidates(normalized):
+                distance = substring_distance(self._normalized[i], normalized)
+                if distance <= self._budget[i] and (best is None or distance < best.distance):
+                    best = TextHit(self._plain[i], "fuzzy", distance)
+            return best
+        return None